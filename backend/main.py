@@ -18,6 +18,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from chuyen_doi import ChuyenDoiWordSangLatex
 from utils import don_dep_file_rac, bien_dich_latex
+from xu_ly_toan import khoi_dong_bo_xu_ly_toan
 
 # Khởi tạo FastAPI app
 app = FastAPI(title="Word2LaTeX API", version="1.0.0")
@@ -306,6 +307,7 @@ async def chuyen_doi_file(
             mode='demo'
         )
         bo_chuyen_doi.chuyen_doi()
+        cong_thuc_ha_cap = bo_chuyen_doi.bo_toan.bao_cao_ha_cap()
 
         print(f"[JOB {job_id}] Đã tạo file .tex, bắt đầu biên dịch PDF")
 
@@ -386,6 +388,7 @@ async def chuyen_doi_file(
                 "so_trang": so_trang,
                 "so_hinh_anh": so_hinh_anh,
                 "so_cong_thuc": so_cong_thuc,
+                "so_cong_thuc_ha_cap": len(cong_thuc_ha_cap),
                 "thoi_gian_xu_ly_giay": round(thoi_gian_xu_ly_giay, 2)
             }
         })
@@ -438,6 +441,12 @@ def xu_ly_don_dep_khi_khoi_dong():
         so_gio_ttl_output = 24
     quet_xoa_thu_muc_mo_coi(outputs_folder, so_gio_ttl_output)
 
+    # Biên dịch XSLT, dò converter MathML và pandoc một lần cho cả worker
+    try:
+        khoi_dong_bo_xu_ly_toan()
+    except Exception as loi:
+        in_log_loi('Không làm nóng được bộ xử lý toán', loi)
+
 
 @app.get("/health")
 def kiem_tra_suc_khoe():
@@ -0,0 +1,119 @@
+# bo_nho_dem.py - Bộ nhớ đệm dùng chung (LRU trong RAM + tầng SQLite tùy chọn trên đĩa)
+#
+# Cách dùng:
+#   ram = BoNhoDemLRU(1000)
+#   ram.dat('khoa', 'gia_tri'); ram.lay('khoa')      # → 'gia_tri' (None nếu không có)
+#   dia = BoNhoDemDia('cache.sqlite')
+#   dia.dat('khoa', 'gia_tri'); dia.dong_bo()         # ghi theo lô khi dong_bo()
+
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class BoNhoDemLRU:
+    # LRU an toàn đa luồng, đếm số lần trúng / trượt
+
+    def __init__(self, so_phan_tu_toi_da: int):
+        self._so_phan_tu_toi_da = max(1, so_phan_tu_toi_da)
+        self._du_lieu = OrderedDict()
+        self._khoa = threading.Lock()
+        self.so_lan_trung = 0
+        self.so_lan_truot = 0
+
+    def lay(self, khoa, mac_dinh=None):
+        with self._khoa:
+            if khoa in self._du_lieu:
+                self._du_lieu.move_to_end(khoa)
+                self.so_lan_trung += 1
+                return self._du_lieu[khoa]
+            self.so_lan_truot += 1
+            return mac_dinh
+
+    def dat(self, khoa, gia_tri):
+        with self._khoa:
+            self._du_lieu[khoa] = gia_tri
+            self._du_lieu.move_to_end(khoa)
+            while len(self._du_lieu) > self._so_phan_tu_toi_da:
+                self._du_lieu.popitem(last=False)
+
+    def xoa(self):
+        with self._khoa:
+            self._du_lieu.clear()
+            self.so_lan_trung = 0
+            self.so_lan_truot = 0
+
+    def thong_ke(self) -> dict:
+        with self._khoa:
+            return {
+                'so_phan_tu': len(self._du_lieu),
+                'trung': self.so_lan_trung,
+                'truot': self.so_lan_truot,
+            }
+
+    def __len__(self):
+        return len(self._du_lieu)
+
+
+class BoNhoDemDia:
+    # Tầng đệm khóa → chuỗi trong SQLite; ghi dồn theo lô, lỗi đĩa → tự tắt (không làm hỏng job)
+
+    _SO_BAN_GHI_MOI_LO = 200
+
+    def __init__(self, duong_dan: str):
+        self._khoa = threading.Lock()
+        self._cho_ghi = {}
+        self._ket_noi = None
+        try:
+            self._ket_noi = sqlite3.connect(duong_dan, timeout=5, check_same_thread=False)
+            self._ket_noi.execute('PRAGMA journal_mode=WAL')
+            self._ket_noi.execute(
+                'CREATE TABLE IF NOT EXISTS bo_nho_dem (khoa TEXT PRIMARY KEY, gia_tri TEXT NOT NULL)'
+            )
+            self._ket_noi.commit()
+        except Exception as e:
+            print(f'[Cảnh báo] Không mở được bộ nhớ đệm trên đĩa {duong_dan}: {e}')
+            self._ket_noi = None
+
+    @property
+    def hoat_dong(self) -> bool:
+        return self._ket_noi is not None
+
+    def lay(self, khoa: str):
+        with self._khoa:
+            if khoa in self._cho_ghi:
+                return self._cho_ghi[khoa]
+            if self._ket_noi is None:
+                return None
+            try:
+                dong = self._ket_noi.execute(
+                    'SELECT gia_tri FROM bo_nho_dem WHERE khoa = ?', (khoa,)
+                ).fetchone()
+            except Exception as e:
+                print(f'[Cảnh báo] Lỗi đọc bộ nhớ đệm trên đĩa: {e}')
+                return None
+        return dong[0] if dong else None
+
+    def dat(self, khoa: str, gia_tri: str):
+        with self._khoa:
+            if self._ket_noi is None:
+                return
+            self._cho_ghi[khoa] = gia_tri
+            can_ghi = len(self._cho_ghi) >= self._SO_BAN_GHI_MOI_LO
+        if can_ghi:
+            self.dong_bo()
+
+    def dong_bo(self):
+        # Ghi các bản ghi đang chờ xuống SQLite trong một transaction
+        with self._khoa:
+            if self._ket_noi is None or not self._cho_ghi:
+                return
+            ban_ghi = list(self._cho_ghi.items())
+            self._cho_ghi = {}
+            try:
+                with self._ket_noi:
+                    self._ket_noi.executemany(
+                        'INSERT OR REPLACE INTO bo_nho_dem (khoa, gia_tri) VALUES (?, ?)', ban_ghi
+                    )
+            except Exception as e:
+                print(f'[Cảnh báo] Lỗi ghi bộ nhớ đệm trên đĩa: {e}')
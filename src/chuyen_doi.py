@@ -10,9 +10,11 @@
 
 import os
 import re
+import hashlib
 import zipfile
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 from docx import Document
 from docx.oxml.ns import qn
@@ -22,12 +24,14 @@ from config import (
     OMML_NAMESPACE, W_NAMESPACE, OLE_NAMESPACE, VML_NAMESPACE,
     R_NAMESPACE, A_NAMESPACE, REL_NAMESPACE,
     WP_NAMESPACE, WP14_NAMESPACE,
-    MAP_STYLE, HEADING_PATTERNS, DEFAULT_OMML2MML_XSL,
+    MAP_STYLE, HEADING_PATTERNS, DEFAULT_OMML2MML_XSL, TU_KHOA_PHAN_NOI_DUNG,
+    SO_LUONG_XU_LY_ANH, KICH_THUOC_ANH_TOI_THIEU_PX,
+    PROGID_OLE_CONG_THUC, TIEN_TO_PROGID_OLE_CONG_THUC,
 )
-from xu_ly_anh import BoLocAnh
+from xu_ly_anh import BoLocAnh, BoToiUuAnh
 from xu_ly_bang import BoXuLyBang
 from xu_ly_toan import BoXuLyToan
-from xu_ly_ole_equation import ole_equation_to_latex
+from mo_hinh_template import MoHinhTemplate, lay_mo_hinh_template, them_sua
 from utils import loc_ky_tu, bien_dich_latex, don_dep_file_rac
 
 
@@ -97,10 +101,12 @@ class ChuyenDoiWordSangLatex:
 
         # Bộ đếm
         self.dem_anh = 0
+        self.dem_tham_chieu_anh = 0  # Số lần ảnh được tham chiếu (dùng cho \label)
         self.dem_bang = 0
         self.dem_heading1 = 0
         self.dem_paragraph_thuc = 0
         self.so_bang_noi_dung = 0
+        self.so_longtable = 0
 
         # Trạng thái danh sách (itemize / enumerate)
         self.trang_thai_danh_sach = None
@@ -111,7 +117,26 @@ class ChuyenDoiWordSangLatex:
         self.vi_tri_hien_tai = 0
         self.tong_so_phan_tu = 0
         self.toc_da_sinh = False
+        # Template hai cột (twocolumn / IEEEtran) → longtable phải tạm chuyển sang một cột
+        self.template_hai_cot = False
         self.kich_thuoc_anh_da_xem = []
+        # Khử trùng lặp ảnh theo nội dung: SHA-1 blob → tên file đã ghi
+        self.anh_theo_hash = {}
+        # SHA-1 các blob đã bị loại vì nội dung (hỏng / ảnh trang trí theo điểm ảnh)
+        self.hash_anh_bi_loai = set()
+
+        # Pipeline ảnh song song: partname → future đánh giá, danh sách future ghi file
+        self._nhom_luong = None
+        self._tuong_lai_danh_gia_anh = {}
+        self._tuong_lai_ghi_anh = []
+        # SHA-1 → thông tin ghi file (kích thước đích đã dùng) để ghi lại nếu cần ảnh lớn hơn
+        self._thong_tin_ghi_anh = {}
+        # Ảnh công thức (preview WMF/EMF trong bảng): SHA-1 → placeholder, placeholder → future/tên file
+        self.anh_cong_thuc_theo_hash = {}
+        self._tuong_lai_anh_cong_thuc = {}
+        self._ten_anh_cong_thuc = {}
+        # OLE equation (Equation Editor 3.0): rId → LaTeX, giải mã hết trong pre-pass chuyen_truoc_cong_thuc
+        self.latex_ole_theo_rid = {}
         self.danh_sach_phan_tu = []
         # Tap hop chi muc cac doan van da dung lam caption con (bo qua khi duyet)
         self.cac_doan_da_dung = set()
@@ -154,9 +179,8 @@ class ChuyenDoiWordSangLatex:
     # ĐỌC FILE
 
     def doc_template(self) -> str:
-        # Đọc file template LaTeX và trả về nội dung dạng chuỗi
-        with open(self.duong_dan_template, 'r', encoding='utf-8') as f:
-            return f.read()
+        # Nội dung file template LaTeX (đọc qua bộ nhớ đệm mô hình template, làm mới khi file đổi)
+        return lay_mo_hinh_template(self.duong_dan_template).van_ban_goc
 
     def doc_file_word(self):
         # Đọc file Word (.docx / .docm) bằng python-docx
@@ -322,6 +346,9 @@ class ChuyenDoiWordSangLatex:
                     run_obj = run_map.get(id(child))
                     if run_obj is not None:
                         ket_qua += self.xu_ly_run_thuong(run_obj)
+                    # OLE equation nằm trong run → inline math tại đúng vị trí
+                    for obj in child.findall(f'{{{W_NAMESPACE}}}object'):
+                        ket_qua += self.xu_ly_ole_inline(obj)
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở chuyen_doi.py dòng 341: {e}')
             ket_qua = "".join(self.xu_ly_run_thuong(run) for run in doan_van.runs)
@@ -521,6 +548,12 @@ class ChuyenDoiWordSangLatex:
         # === XỬ LÝ DISPLAY EQUATION (DisplayFormula / DisplayFormulaUnnum) ===
         if style_cmd in ('equation', 'equation*'):
             cong_thuc_list = self.bo_toan.trich_xuat_omml(doan_van)
+            # OLE equation (Equation Editor 3.0) trong đoạn công thức
+            cong_thuc_list += [
+                ('', latex) for latex in (
+                    self.lay_latex_ole(obj) for obj in doan_van._element.iter(f'{{{W_NAMESPACE}}}object')
+                ) if latex
+            ]
             if cong_thuc_list:
                 latex_parts = [lt for _, lt in cong_thuc_list if lt.strip()]
                 if latex_parts:
@@ -575,9 +608,7 @@ class ChuyenDoiWordSangLatex:
 
         # Phát hiện phần nội dung chính (sau abstract/introduction)
         if not self.da_qua_phan_noi_dung:
-            cac_tu_khoa = ['ABSTRACT', 'INTRODUCTION', 'TÓM TẮT',
-                           'GIỚI THIỆU', 'MỞ ĐẦU', 'CHƯƠNG 1']
-            for tu in cac_tu_khoa:
+            for tu in TU_KHOA_PHAN_NOI_DUNG:
                 if tu in text_raw:
                     self.da_qua_phan_noi_dung = True
                     break
@@ -707,7 +738,7 @@ class ChuyenDoiWordSangLatex:
 
     def tao_latex_hinh(self, ten_anh: str, caption: str = None) -> str:
         # Sinh mã LaTeX figure cho ảnh (includegraphics + caption + label)
-        label = f"fig:hinh{self.dem_anh}"
+        label = f"fig:hinh{self.dem_tham_chieu_anh}"
         ten_thu_muc = os.path.basename(self.thu_muc_anh)
         vi_tri = "[H]" if self.mode == 'demo' else "[htbp]"
         latex = rf"\begin{{figure}}{vi_tri}" + "\n"
@@ -751,7 +782,7 @@ class ChuyenDoiWordSangLatex:
                 latex += r"    \centering" + "\n"
                 latex += rf"    \includegraphics[width=\linewidth]{{{ten_thu_muc}/{ten_anh}}}" + "\n"
                 latex += rf"    \caption{{{mo_ta}}}" + "\n"
-                latex += rf"    \label{{fig:hinh{self.dem_anh - so_anh + i + 1}_{nhan}}}" + "\n"
+                latex += rf"    \label{{fig:hinh{self.dem_tham_chieu_anh - so_anh + i + 1}_{nhan}}}" + "\n"
                 latex += r"  \end{subfigure}" + "\n"
                 if i < so_anh - 1:
                     latex += r"  \hfill" + "\n"
@@ -768,7 +799,7 @@ class ChuyenDoiWordSangLatex:
             '', caption_final, flags=re.IGNORECASE
         ).strip()
         latex += rf"  \caption{{{caption_final}}}" + "\n"
-        latex += rf"  \label{{fig:nhom{self.dem_anh}}}" + "\n"
+        latex += rf"  \label{{fig:nhom{self.dem_tham_chieu_anh}}}" + "\n"
         latex += r"\end{figure}" + "\n\n"
         return latex
 
@@ -811,6 +842,18 @@ class ChuyenDoiWordSangLatex:
             pass
         return (0, 0)
 
+    @staticmethod
+    def kich_thuoc_anh_hop_le(kich_thuoc_anh) -> bool:
+        # Lọc theo kích thước hiển thị (EMU): bỏ ảnh rỗng, icon nhỏ, ảnh nền tràn trang
+        rong, cao = kich_thuoc_anh
+        if rong == 0 or cao == 0:
+            return False
+        if rong < 300000 and cao < 300000:
+            return False
+        if rong > 7000000 or cao > 9000000:
+            return False
+        return True
+
     def la_anh_trang_tri(self, kich_thuoc_anh, doan_van) -> bool:
         # Ủy quyền cho BoLocAnh kiểm tra ảnh trang trí (metadata + context)
         return BoLocAnh.la_anh_trang_tri(
@@ -843,13 +886,7 @@ class ChuyenDoiWordSangLatex:
                 continue
 
             kich_thuoc = self.lay_kich_thuoc_anh(run._element)
-            rong, cao = kich_thuoc
-
-            if rong == 0 or cao == 0:
-                continue
-            if rong < 300000 and cao < 300000:
-                continue
-            if rong > 7000000 or cao > 9000000:
+            if not self.kich_thuoc_anh_hop_le(kich_thuoc):
                 continue
 
             for blip in blips:
@@ -861,104 +898,319 @@ class ChuyenDoiWordSangLatex:
                 if not part:
                     continue
 
-                self.dem_anh += 1
-                content_type = getattr(part, 'content_type', '')
-                ext = 'png'
-                if 'jpeg' in content_type:
-                    ext = 'jpg'
+                # Kết quả giải mã + chấm điểm đã được gửi trước vào thread pool
+                danh_gia = self.lay_danh_gia_anh(part)
+                ma_bam = danh_gia['ma_bam']
+                if ma_bam in self.hash_anh_bi_loai:
+                    continue
 
-                ten_anh = f'hinh_{self.dem_anh}.{ext}'
-                if not os.path.exists(self.thu_muc_anh):
-                    os.makedirs(self.thu_muc_anh)
+                # Ảnh trùng nội dung đã qua kiểm tra hợp lệ + chấm điểm ở lần gặp đầu
+                ten_anh = self.anh_theo_hash.get(ma_bam)
+                la_anh_moi = ten_anh is None
 
-                duong_dan_anh = os.path.join(self.thu_muc_anh, ten_anh)
-                with open(duong_dan_anh, 'wb') as f:
-                    f.write(part.blob)
-                
-                # Kiểm tra file ảnh có hợp lệ không
-                if not os.path.exists(duong_dan_anh) or os.path.getsize(duong_dan_anh) == 0:
-                    continue
-                
-                # Kiểm tra ảnh có thể mở được bằng PIL
-                try:
-                    from PIL import Image
-                    img = Image.open(duong_dan_anh)
-                    width, height = img.size
-                    # Nếu ảnh có kích thước 0, bỏ qua
-                    if width == 0 or height == 0:
-                        os.remove(duong_dan_anh)
-                        self.dem_anh -= 1
-                        continue
-                except Exception as e:
-                    print(f'[Cảnh báo] Lỗi im lặng ở chuyen_doi.py dòng 895: {e}')
-                    # Nếu không mở được ảnh, xóa file và bỏ qua
-                    try:
-                        os.remove(duong_dan_anh)
-                        self.dem_anh -= 1
-                    except:
-                        pass
+                # Ảnh hỏng / kích thước 0 (PIL không mở được) → bỏ qua
+                if la_anh_moi and not danh_gia['hop_le']:
+                    self.hash_anh_bi_loai.add(ma_bam)
                     continue
 
+                # Lọc theo ngữ cảnh (vị trí, caption...) chạy cho mọi lần tham chiếu
                 if self.la_anh_trang_tri(kich_thuoc, doan_van):
-                    try:
-                        os.remove(duong_dan_anh)
-                        self.dem_anh -= 1
-                    except Exception as e:
-                        print(f'[Cảnh báo] Lỗi im lặng ở chuyen_doi.py dòng 908: {e}')
-                        pass
                     continue
 
-                if not BoLocAnh.la_anh_noi_dung(duong_dan_anh):
-                    try:
-                        os.remove(duong_dan_anh)
-                        self.dem_anh -= 1
-                    except Exception as e:
-                        print(f'[Cảnh báo] Lỗi im lặng ở chuyen_doi.py dòng 916: {e}')
-                        pass
+                if la_anh_moi and not danh_gia['la_noi_dung']:
+                    self.hash_anh_bi_loai.add(ma_bam)
                     continue
 
+                ten_anh, _, _ = self.luu_anh_theo_noi_dung(part, ma_bam, kich_thuoc)
+
+                self.dem_tham_chieu_anh += 1
                 danh_sach_anh.append(ten_anh)
                 danh_sach_kich_thuoc.append(kich_thuoc)
         return danh_sach_anh, danh_sach_kich_thuoc
 
-    def trich_xuat_anh_tu_bang(self, bang: Table) -> list:
-        # Trích xuất ảnh từ bảng (figure layout), luôn giữ ảnh
-        danh_sach_anh = []
+    def luu_anh_theo_noi_dung(self, part, ma_bam: str = None, kich_thuoc_emu=(0, 0)) -> tuple:
+        # Đặt tên + ghi blob ảnh, mỗi nội dung (SHA-1) chỉ ghi một file duy nhất
+        # Tên file cấp theo thứ tự duyệt (tất định); việc ghi/resample chạy trong thread pool
+        # Trả về (ten_anh, ma_bam, la_anh_moi)
+        blob = part.blob
+        if ma_bam is None:
+            ma_bam = hashlib.sha1(blob).hexdigest()
+
+        ten_anh = self.anh_theo_hash.get(ma_bam)
+        if ten_anh is not None:
+            self._cap_nhat_kich_thuoc_dich(ma_bam, kich_thuoc_emu)
+            return ten_anh, ma_bam, False
+
+        # Kích thước pixel + loại ảnh đã có sẵn từ bước đánh giá → quyết định đuôi file ngay
+        danh_gia = self.lay_danh_gia_anh(part)
+        kich_thuoc_dich = None
+        if danh_gia['hop_le']:
+            kich_thuoc_dich = BoToiUuAnh.tinh_kich_thuoc_dich(danh_gia['kich_thuoc'], kich_thuoc_emu)
+        dinh_dang = BoToiUuAnh.chon_dinh_dang(danh_gia, kich_thuoc_dich)
+
+        self.dem_anh += 1
+        ext = dinh_dang
+        if ext is None:
+            content_type = getattr(part, 'content_type', '')
+            ext = 'png'
+            if 'jpeg' in content_type:
+                ext = 'jpg'
+
+        ten_anh = f'hinh_{self.dem_anh}.{ext}'
+        if not os.path.exists(self.thu_muc_anh):
+            os.makedirs(self.thu_muc_anh, exist_ok=True)
+
+        duong_dan_anh = os.path.join(self.thu_muc_anh, ten_anh)
+        self._tuong_lai_ghi_anh.append(self.lay_nhom_luong().submit(
+            BoToiUuAnh.ghi_anh, duong_dan_anh, blob, kich_thuoc_dich, dinh_dang,
+        ))
+
+        self.anh_theo_hash[ma_bam] = ten_anh
+        self._thong_tin_ghi_anh[ma_bam] = {
+            'part': part,
+            'duong_dan': duong_dan_anh,
+            'kich_thuoc_dich': kich_thuoc_dich,
+            'dinh_dang': dinh_dang,
+            'can_ghi_lai': False,
+        }
+        return ten_anh, ma_bam, True
+
+    def _cap_nhat_kich_thuoc_dich(self, ma_bam: str, kich_thuoc_emu):
+        # Ảnh trùng được đặt lớn hơn lần đầu → đánh dấu ghi lại với độ phân giải cao hơn
+        thong_tin = self._thong_tin_ghi_anh.get(ma_bam)
+        if not thong_tin or thong_tin['kich_thuoc_dich'] is None:
+            return
+        danh_gia = self.lay_danh_gia_anh(thong_tin['part'])
+        kich_thuoc_moi = BoToiUuAnh.tinh_kich_thuoc_dich(danh_gia['kich_thuoc'], kich_thuoc_emu)
+        if kich_thuoc_moi is None:
+            # Cần độ phân giải gốc: giữ đuôi file đã cấp, chỉ mã hóa lại ở kích thước gốc
+            kich_thuoc_moi = danh_gia['kich_thuoc']
+        if kich_thuoc_moi[0] > thong_tin['kich_thuoc_dich'][0]:
+            thong_tin['kich_thuoc_dich'] = kich_thuoc_moi
+            thong_tin['can_ghi_lai'] = True
+
+    # PIPELINE ẢNH SONG SONG
+
+    def _cho_ghi_anh(self):
+        # Chờ các future ghi file ảnh đang chạy
+        for tuong_lai in self._tuong_lai_ghi_anh:
+            try:
+                tuong_lai.result()
+            except Exception as e:
+                print(f"[Cảnh báo] Lỗi ghi file ảnh: {e}")
+        self._tuong_lai_ghi_anh = []
+
+    def lay_nhom_luong(self) -> ThreadPoolExecutor:
+        # Thread pool dùng chung trong một lần chuyển đổi, tạo khi cần
+        if self._nhom_luong is None:
+            self._nhom_luong = ThreadPoolExecutor(
+                max_workers=SO_LUONG_XU_LY_ANH, thread_name_prefix='w2l',
+            )
+        return self._nhom_luong
+
+    def gui_truoc_danh_gia_anh(self):
+        # Quét mọi blip trong document ngay khi mở file, gửi việc giải mã + chấm điểm
+        # vào thread pool để chạy song song với việc duyệt paragraph
+        # Chỉ gửi ảnh có khả năng được giữ: lọc trước bằng các bộ lọc rẻ của trich_xuat_anh
+        # (số ảnh / paragraph, kích thước EMU) + thăm dò header; ảnh bị lọc không giải mã trước,
+        # nếu vẫn cần (vd ảnh trong bảng figure) lay_danh_gia_anh sẽ đánh giá khi gặp
         if not self.tai_lieu:
-            return danh_sach_anh
-
-        for hang in bang.rows:
-            for cell in hang.cells:
-                for para in cell.paragraphs:
-                    for run in para.runs:
-                        blips = run._element.findall(f'.//{{{A_NAMESPACE}}}blip')
-                        for blip in blips:
-                            embed = blip.get(f'{{{REL_NAMESPACE}}}embed')
-                            if not embed:
-                                continue
-                            part = self.tai_lieu.part.related_parts.get(embed)
-                            if not part:
-                                continue
-
-                            self.dem_anh += 1
-                            content_type = getattr(part, 'content_type', '')
-                            ext = 'png'
-                            if 'jpeg' in content_type:
-                                ext = 'jpg'
-
-                            ten_anh = f'hinh_{self.dem_anh}.{ext}'
-                            if not os.path.exists(self.thu_muc_anh):
-                                os.makedirs(self.thu_muc_anh)
-
-                            duong_dan_anh = os.path.join(self.thu_muc_anh, ten_anh)
-                            with open(duong_dan_anh, 'wb') as f:
-                                f.write(part.blob)
-
-                            danh_sach_anh.append(ten_anh)
-        return danh_sach_anh
+            return
+        related_parts = self.tai_lieu.part.related_parts
+        tag_blip = f'{{{A_NAMESPACE}}}blip'
+        tag_run = f'{{{W_NAMESPACE}}}r'
+        tag_p = f'{{{W_NAMESPACE}}}p'
+        tag_tbl = f'{{{W_NAMESPACE}}}tbl'
+        so_anh_theo_doan = {}
+        for blip in self.tai_lieu.element.body.iter(tag_blip):
+            embed = blip.get(f'{{{REL_NAMESPACE}}}embed')
+            part = related_parts.get(embed) if embed else None
+            if part is None or part.partname in self._tuong_lai_danh_gia_anh:
+                continue
+
+            run = next(blip.iterancestors(tag_run), None)
+            trong_bang = next(blip.iterancestors(tag_tbl), None) is not None
+            if not trong_bang:
+                # Ảnh ngoài bảng: trich_xuat_anh bỏ paragraph > 3 ảnh và ảnh sai kích thước hiển thị
+                doan = next(blip.iterancestors(tag_p), None)
+                if doan is not None:
+                    if doan not in so_anh_theo_doan:
+                        so_anh_theo_doan[doan] = sum(1 for _ in doan.iter(tag_blip))
+                    if so_anh_theo_doan[doan] > 3:
+                        continue
+                if run is None or not self.kich_thuoc_anh_hop_le(self.lay_kich_thuoc_anh(run)):
+                    continue
+
+            tham_do = BoLocAnh.tham_do_anh(part.blob)
+            if tham_do is None or max(tham_do['kich_thuoc']) < KICH_THUOC_ANH_TOI_THIEU_PX:
+                continue
+            self._tuong_lai_danh_gia_anh[part.partname] = self.lay_nhom_luong().submit(
+                BoLocAnh.danh_gia_blob, part.blob
+            )
+
+    def chuyen_truoc_cong_thuc(self):
+        # Gom mọi oMath + OLE equation trong document (kể cả trong bảng) ngay khi mở file
+        # BoXuLyToan chuyển song song bằng process pool nếu tài liệu đủ nhiều công thức
+        # OLE equation: mọi OLE công thức (ProgID Equation.3 / Equation.DSMT*) được giải mã ở đây
+        # → latex_ole_theo_rid (body + bảng dùng chung)
+        if not self.tai_lieu:
+            return
+        body = self.tai_lieu.element.body
+        danh_sach_omath = list(body.iter(f'{{{OMML_NAMESPACE}}}oMath'))
+
+        part_ole_theo_rid = {}
+        for obj in body.iter(f'{{{W_NAMESPACE}}}object'):
+            rid, part = self._lay_part_ole(obj)
+            if part is not None:
+                part_ole_theo_rid[rid] = part
+
+        self.bo_toan.tinh_truoc_cong_thuc(
+            danh_sach_omath, [part.blob for part in part_ole_theo_rid.values()]
+        )
+        # Kết quả song song đã nằm sẵn trong bo_toan; còn lại giải tuần tự, blob trùng chỉ giải một lần
+        for rid, part in part_ole_theo_rid.items():
+            try:
+                self.latex_ole_theo_rid[rid] = self.bo_toan.ole_sang_latex(part.blob)
+            except Exception as e:
+                print(f'[Cảnh báo] Lỗi giải mã OLE equation {part.partname}: {e}')
+                self.latex_ole_theo_rid[rid] = ''
+
+    def lay_danh_gia_anh(self, part) -> dict:
+        # Lấy kết quả đánh giá ảnh (chờ future nếu luồng phụ chưa xong)
+        tuong_lai = self._tuong_lai_danh_gia_anh.get(part.partname)
+        if tuong_lai is None:
+            tuong_lai = self.lay_nhom_luong().submit(BoLocAnh.danh_gia_blob, part.blob)
+            self._tuong_lai_danh_gia_anh[part.partname] = tuong_lai
+        return tuong_lai.result()
+
+    def cho_xu_ly_anh_hoan_tat(self):
+        # Chờ mọi file ảnh được ghi xong rồi đóng thread pool (gọi lúc ghép kết quả)
+        self._cho_ghi_anh()
+
+        # Ghi lại các ảnh trùng cần độ phân giải lớn hơn lần tham chiếu đầu
+        for thong_tin in self._thong_tin_ghi_anh.values():
+            if not thong_tin['can_ghi_lai']:
+                continue
+            self._tuong_lai_ghi_anh.append(self.lay_nhom_luong().submit(
+                BoToiUuAnh.ghi_anh, thong_tin['duong_dan'], thong_tin['part'].blob,
+                thong_tin['kich_thuoc_dich'], thong_tin['dinh_dang'],
+            ))
+            thong_tin['can_ghi_lai'] = False
+        self._cho_ghi_anh()
+
+        # Ảnh công thức: lấy tên file cuối cùng (PNG nếu chuyển được, file gốc nếu lỗi)
+        for placeholder, tuong_lai in self._tuong_lai_anh_cong_thuc.items():
+            try:
+                self._ten_anh_cong_thuc[placeholder] = tuong_lai.result()
+            except Exception as e:
+                print(f"[Cảnh báo] Lỗi chuyển ảnh công thức: {e}")
+        self._tuong_lai_anh_cong_thuc = {}
+        self._tuong_lai_danh_gia_anh = {}
+        if self._nhom_luong is not None:
+            self._nhom_luong.shutdown(wait=True, cancel_futures=True)
+            self._nhom_luong = None
+
+    def dang_ky_anh_cong_thuc(self, part) -> str:
+        # Đăng ký preview ảnh của công thức OLE: đặt tên theo thứ tự duyệt, chuyển PNG trong thread pool
+        # Công thức trùng nội dung (cùng SHA-1) dùng chung một file
+        # Trả về placeholder cho đường dẫn ảnh, thay bằng tên thật ở giai_anh_cong_thuc
+        ma_bam = hashlib.sha1(part.blob).hexdigest()
+        placeholder = self.anh_cong_thuc_theo_hash.get(ma_bam)
+        if placeholder is not None:
+            return placeholder
+
+        self.dem_anh += 1
+        content_type = getattr(part, 'content_type', '')
+        ext = 'png'
+        if 'wmf' in content_type:
+            ext = 'wmf'
+        elif 'emf' in content_type:
+            ext = 'emf'
+        elif 'jpeg' in content_type:
+            ext = 'jpg'
+
+        ten_anh_goc = f'formula_{self.dem_anh}.{ext}'
+        if not os.path.exists(self.thu_muc_anh):
+            os.makedirs(self.thu_muc_anh, exist_ok=True)
+
+        placeholder = f'%%ANH_CONG_THUC_{self.dem_anh}%%'
+        self._tuong_lai_anh_cong_thuc[placeholder] = self.lay_nhom_luong().submit(
+            BoToiUuAnh.raster_hoa_cong_thuc, self.thu_muc_anh, ten_anh_goc, part.blob,
+        )
+        self._ten_anh_cong_thuc[placeholder] = ten_anh_goc
+        self.anh_cong_thuc_theo_hash[ma_bam] = placeholder
+        return placeholder
+
+    def giai_anh_cong_thuc(self, latex: str) -> str:
+        # Thay placeholder ảnh công thức bằng đường dẫn ảnh thật (gọi sau cho_xu_ly_anh_hoan_tat)
+        if not self._ten_anh_cong_thuc:
+            return latex
+        ten_thu_muc = os.path.basename(self.thu_muc_anh)
+        return re.sub(
+            r'%%ANH_CONG_THUC_\d+%%',
+            lambda m: f'{ten_thu_muc}/{self._ten_anh_cong_thuc.get(m.group(0), "")}',
+            latex,
+        )
+
+    def trich_xuat_anh_tu_bang(self, bang: Table) -> list:
+        # Ủy quyền cho BoXuLyBang (trích xuất ảnh từ bảng figure layout)
+        return self.bo_bang.trich_xuat_anh_tu_bang(bang)
 
     # OLE OBJECT (Equation Editor cũ)
 
+    @staticmethod
+    def _lay_ole_cong_thuc(obj):
+        # o:OLEObject của w:object nếu ProgID là công thức (Equation.3 / Equation.DSMT*), ngược lại None
+        ole = obj.find(f'.//{{{OLE_NAMESPACE}}}OLEObject')
+        if ole is None:
+            return None
+        prog_id = (ole.get('ProgID') or '').strip()
+        if prog_id in PROGID_OLE_CONG_THUC or prog_id.startswith(TIEN_TO_PROGID_OLE_CONG_THUC):
+            return ole
+        return None
+
+    def _lay_part_ole(self, obj) -> tuple:
+        # w:object → (rId, part word/embeddings/oleObjectN.bin) của OLE công thức; (None, None) nếu không có
+        ole = self._lay_ole_cong_thuc(obj)
+        rid = ole.get(f'{{{R_NAMESPACE}}}id') if ole is not None else None
+        part = self.tai_lieu.part.related_parts.get(rid) if rid else None
+        if part is None or not str(part.partname).lower().endswith('.bin'):
+            return None, None
+        return rid, part
+
+    def lay_latex_ole(self, obj) -> str:
+        # LaTeX của OLE equation trong w:object (tra bảng rId của pre-pass, chưa có thì giải mã ngay)
+        rid, part = self._lay_part_ole(obj)
+        if part is None:
+            return ''
+        if rid not in self.latex_ole_theo_rid:
+            self.latex_ole_theo_rid[rid] = self.bo_toan.ole_sang_latex(part.blob)
+        return self.latex_ole_theo_rid[rid]
+
+    def lay_anh_ole(self, obj) -> str:
+        # Đường dẫn (placeholder) ảnh preview v:imagedata của OLE công thức; '' nếu không có
+        if self._lay_ole_cong_thuc(obj) is None:
+            return ''
+        imagedata = obj.find(f'.//{{{VML_NAMESPACE}}}imagedata')
+        rid = imagedata.get(f'{{{R_NAMESPACE}}}id') if imagedata is not None else None
+        part = self.tai_lieu.part.related_parts.get(rid) if rid else None
+        if part is None:
+            return ''
+        return self.dang_ky_anh_cong_thuc(part)
+
+    def xu_ly_ole_inline(self, obj) -> str:
+        # OLE equation trong đoạn văn → $LaTeX$; không giải mã được → ảnh preview
+        try:
+            latex = self.lay_latex_ole(obj).strip()
+            if latex:
+                return f'${latex}$'
+            duong_dan = self.lay_anh_ole(obj)
+            if duong_dan:
+                return rf'\includegraphics[height=1.2em]{{{duong_dan}}}'
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi xử lý OLE equation trong đoạn văn: {e}')
+        return ''
+
     def xu_ly_bang(self, bang: Table) -> str:
         # Ủy quyền xử lý bảng cho BoXuLyBang để đảm bảo SRP
         return self.bo_bang.xu_ly_bang(bang)
@@ -1005,6 +1257,8 @@ class ChuyenDoiWordSangLatex:
     def sinh_noi_dung(self) -> str:
         # Duyệt toàn bộ phần tử và sinh nội dung LaTeX (dùng cho fallback %%CONTENT%%)
         self.doc_file_word()
+        self.gui_truoc_danh_gia_anh()
+        self.chuyen_truoc_cong_thuc()
         noi_dung = []
         thu_tu_phan_tu = self.lay_thu_tu_phan_tu()
         self.tong_so_phan_tu = len(thu_tu_phan_tu)
@@ -1135,6 +1389,8 @@ class ChuyenDoiWordSangLatex:
         Mỗi phần tử được xử lý thành LaTeX rồi gán vào vùng tương ứng.
         """
         self.doc_file_word()
+        self.gui_truoc_danh_gia_anh()
+        self.chuyen_truoc_cong_thuc()
         thu_tu_phan_tu = self.lay_thu_tu_phan_tu()
         self.tong_so_phan_tu = len(thu_tu_phan_tu)
         self.danh_sach_phan_tu = thu_tu_phan_tu
@@ -1311,156 +1567,60 @@ class ChuyenDoiWordSangLatex:
         self.parsed_data['keywords'] = ''.join(buf_keywords).strip()
         self.parsed_data['body'] = ''.join(buf_body)
 
-    # ----- Regex helpers cho inject_into_template -----
+    # ----- Các bước tiêm của inject_into_template -----
+    # Mỗi bước thêm thao tác sửa (bat_dau, ket_thuc, van_ban) theo vị trí đã phân tích sẵn trong MoHinhTemplate
 
-    def _tim_cap_ngoac(self, s: str, vi_tri_bat_dau: int) -> int:
-        """Tìm vị trí đóng ngoặc nhọn } khớp với { tại vi_tri_bat_dau.
-        Xử lý nested braces: \title{A {B} C} → trả về vị trí } cuối.
-        """
-        if vi_tri_bat_dau >= len(s) or s[vi_tri_bat_dau] != '{':
-            return -1
-        dem = 0
-        for i in range(vi_tri_bat_dau, len(s)):
-            if s[i] == '{' and (i == 0 or s[i-1] != '\\'):
-                dem += 1
-            elif s[i] == '}' and (i == 0 or s[i-1] != '\\'):
-                dem -= 1
-                if dem == 0:
-                    return i
-        return -1
-
-    def _thay_the_title(self, template: str) -> str:
-        """Thay thế \title{dummy} bằng nội dung title thật từ Word."""
+    def _thay_the_title(self, mo_hinh: MoHinhTemplate, cac_sua: list):
+        """Thay thế \title{dummy} bằng nội dung title thật từ Word (giữ lại \thanks{...})."""
         title = self.parsed_data.get('title', '').strip()
-        if not title:
-            return template
-
-        # Tìm \title{ bằng regex, bỏ qua các dòng comment (bắt đầu bằng %)
-        vi_tri_title = -1
-        match_iter = re.finditer(r'\\title\s*\{', template)
-        for match in match_iter:
-            # Kiểm tra xem có dấu % nào ở trước trên cùng dòng không
-            dong_chua_match = template.rfind('\n', 0, match.start())
-            if dong_chua_match == -1:
-                dong_chua_match = 0
-            text_truoc = template[dong_chua_match:match.start()]
-            if '%' not in text_truoc:
-                vi_tri_title = match
-                break
-                
-        if vi_tri_title == -1 or not vi_tri_title:
-            return template
-
-        vi_tri_mo = vi_tri_title.end() - 1  # Vị trí ký tự '{'
-        vi_tri_dong = self._tim_cap_ngoac(template, vi_tri_mo)
-        if vi_tri_dong == -1:
-            return template
-
-        # Giữ nguyên phần sau title (ví dụ \thanks{...})
-        noi_dung_cu = template[vi_tri_mo + 1:vi_tri_dong]
-
-        # Nếu có \thanks{} bên trong, giữ lại
-        thanks_match = re.search(r'\\thanks\s*\{', noi_dung_cu)
-        phan_thanks = ''
-        if thanks_match:
-            thanks_start = thanks_match.start()
-            # Tìm } đóng của \thanks
-            vi_tri_thanks_mo = thanks_match.end() - 1
-            # Tìm trong noi_dung_cu
-            vi_tri_thanks_dong = self._tim_cap_ngoac(noi_dung_cu, vi_tri_thanks_mo)
-            if vi_tri_thanks_dong != -1:
-                phan_thanks = '\n' + noi_dung_cu[thanks_start:vi_tri_thanks_dong + 1]
-
-        noi_dung_moi = title + phan_thanks
-        template = template[:vi_tri_mo + 1] + noi_dung_moi + template[vi_tri_dong:]
-        return template
-
-    def _thay_the_abstract(self, template: str) -> str:
+        if not title or mo_hinh.title is None:
+            return
+        bat_dau, ket_thuc, phan_thanks = mo_hinh.title
+        them_sua(cac_sua, bat_dau, ket_thuc, title + phan_thanks)
+
+    def _thay_the_abstract(self, mo_hinh: MoHinhTemplate, cac_sua: list):
         """Thay thế nội dung bên trong \begin{abstract}...\end{abstract}."""
+        if mo_hinh.abstract is None:
+            return
         abstract = self.parsed_data.get('abstract', '').strip()
-
-        pattern = r'(\\begin\{abstract\})(.*?)(\\end\{abstract\})'
-        match = re.search(pattern, template, re.DOTALL)
-        
-        if not match:
-            return template
-            
+        bat_dau, ket_thuc, bat_dau_noi_dung, ket_thuc_noi_dung = mo_hinh.abstract
         if not abstract:
-            return template[:match.start()] + template[match.end():]
-            
-        template = (
-            template[:match.start(2)]
-            + '\n' + abstract + '\n'
-            + template[match.end(2):]
-        )
-        return template
+            them_sua(cac_sua, bat_dau, ket_thuc, '')
+        else:
+            them_sua(cac_sua, bat_dau_noi_dung, ket_thuc_noi_dung, '\n' + abstract + '\n')
 
-    def _thay_the_keywords(self, template: str) -> str:
-        """Thay thế nội dung keywords trong IEEEkeywords hoặc dòng Keywords."""
+    def _thay_the_keywords(self, mo_hinh: MoHinhTemplate, cac_sua: list):
+        """Thay thế nội dung keywords trong IEEEkeywords, keyword (Elsevier) hoặc dòng Keywords."""
+        if mo_hinh.keywords is None:
+            return
         keywords = self.parsed_data.get('keywords', '').strip()
+        loai = mo_hinh.keywords[0]
 
-        # Thử \begin{IEEEkeywords}...\end{IEEEkeywords}
-        pattern_ieee = r'(\\begin\{IEEEkeywords\})(.*?)(\\end\{IEEEkeywords\})'
-        match = re.search(pattern_ieee, template, re.DOTALL)
-        if match:
-            if not keywords:
-                template = template[:match.start()] + template[match.end():]
-            else:
-                template = (
-                    template[:match.start(2)]
-                    + '\n' + keywords + '\n'
-                    + template[match.end(2):]
-                )
-            return template
-
-        # Thử \begin{keyword}...\end{keyword} (Elsevier)
-        pattern_els = r'(\\begin\{keyword\})(.*?)(\\end\{keyword\})'
-        match_els = re.search(pattern_els, template, re.DOTALL)
-        if match_els:
-            if not keywords:
-                template = template[:match_els.start()] + template[match_els.end():]
-            else:
-                kw_list = [k.strip() for k in keywords.split(',') if k.strip()]
-                kw_formatted = ' \\sep '.join(kw_list)
-                
-                template = (
-                    template[:match_els.start(2)]
-                    + '\n' + kw_formatted + '\n'
-                    + template[match_els.end(2):]
-                )
-            return template
+        if loai == 'textbf':
+            # \textbf{Keywords:} hoặc \textbf{Index Terms:}
+            if keywords:
+                _, bat_dau, ket_thuc, nhan = mo_hinh.keywords
+                them_sua(cac_sua, bat_dau, ket_thuc, rf'\\textbf{{{nhan}:}} {keywords}')
+            return
 
+        _, bat_dau, ket_thuc, bat_dau_noi_dung, ket_thuc_noi_dung = mo_hinh.keywords
         if not keywords:
-            return template
-
-        # Thử \textbf{Keywords:} hoặc \textbf{Index Terms:}
-        pattern_kw = r'\\textbf\{(Keywords|Index Terms)\s*:?\}[^\n]*'
-        match = re.search(pattern_kw, template, re.IGNORECASE)
-        if match:
-            replacement = rf'\\textbf{{{match.group(1)}:}} {keywords}'
-            template = template[:match.start()] + replacement + template[match.end():]
-            return template
-
-        return template
+            them_sua(cac_sua, bat_dau, ket_thuc, '')
+            return
+        if loai == 'keyword':
+            kw_list = [k.strip() for k in keywords.split(',') if k.strip()]
+            keywords = ' \\sep '.join(kw_list)
+        them_sua(cac_sua, bat_dau_noi_dung, ket_thuc_noi_dung, '\n' + keywords + '\n')
 
-    def _thay_the_author(self, template: str) -> str:
+    def _thay_the_author(self, mo_hinh: MoHinhTemplate, cac_sua: list):
         """Thay thế block author trong template bằng author từ Word.
         Cố gắng bảo tồn định dạng của template (vd: IEEEauthorblockN, nhiều \author rời rạc)."""
         authors = self.parsed_data.get('authors', [])
         if not authors:
-            # Xoá TẤT CẢ các thẻ tác giả cũ (bao gồm cả các thẻ của ACM)
-            while True:
-                m = re.search(r'\\(author|affil|affiliation|address|email|orcid|authornote|authornotemark)\s*\{', template)
-                if not m: break
-                v_mo = m.end() - 1
-                v_dong = self._tim_cap_ngoac(template, v_mo)
-                if v_dong != -1:
-                    template = template[:m.start()] + template[v_dong+1:]
-                else:
-                    break
-            # Xoá thêm \and nếu có thừa thải
-            template = re.sub(r'\\and\s+', '', template)
-            return template
+            # Xoá TẤT CẢ các thẻ tác giả cũ (bao gồm cả các thẻ của ACM) và \and thừa thải
+            for bat_dau, ket_thuc in mo_hinh.vung_tac_gia + mo_hinh.vung_and:
+                them_sua(cac_sua, bat_dau, ket_thuc, '')
+            return
 
         # Tách parsed authors thành danh sách các dict {name: '', affil: ''}
         author_list = []
@@ -1479,102 +1639,58 @@ class ChuyenDoiWordSangLatex:
                 current_author['affil'].append(info_escaped)
         if current_author:
             author_list.append(current_author)
-            
-        # Nếu Word chỉ có 1 cục text khổng lồ, tách gượng ep để có nhiều tác giả
-        if len(author_list) == 1 and len(author_list[0]['affil']) > 2:
-           # fallback to simple join
-           pass
 
         # Trường hợp 1: Template IEEE (1 \author chứa nhiều \IEEEauthorblockN phân tách bởi \and)
-        if '\\IEEEauthorblockN' in template:
-            match_author = re.search(r'\\author\s*\{', template)
-            if match_author:
-                vi_tri_mo = match_author.end() - 1
-                vi_tri_dong = self._tim_cap_ngoac(template, vi_tri_mo)
-                if vi_tri_dong != -1:
-                    blocks_moi = []
-                    for auth_data in author_list:
-                        ten_tac_gia = auth_data["name"]
-                        affil_str = ' \\\\\n'.join(auth_data['affil']) if auth_data['affil'] else ''
-                        
-                        block = rf'\IEEEauthorblockN{{{ten_tac_gia}}}' + '\n'
-                        if affil_str:
-                            block += rf'\IEEEauthorblockA{{\textit{{{affil_str}}}}}' + '\n'
-                        blocks_moi.append(block)
-                        
-                    noi_dung_moi = '\n\\and\n'.join(blocks_moi)
-                    template = template[:vi_tri_mo+1] + '\n' + noi_dung_moi + '\n' + template[vi_tri_dong:]
-                    return template
+        if mo_hinh.co_ieee_author and mo_hinh.author_ieee is not None:
+            blocks_moi = []
+            for auth_data in author_list:
+                ten_tac_gia = auth_data["name"]
+                affil_str = ' \\\\\n'.join(auth_data['affil']) if auth_data['affil'] else ''
+
+                block = rf'\IEEEauthorblockN{{{ten_tac_gia}}}' + '\n'
+                if affil_str:
+                    block += rf'\IEEEauthorblockA{{\textit{{{affil_str}}}}}' + '\n'
+                blocks_moi.append(block)
+
+            noi_dung_moi = '\n\\and\n'.join(blocks_moi)
+            them_sua(cac_sua, *mo_hinh.author_ieee, '\n' + noi_dung_moi + '\n')
+            return
 
         # Trường hợp 2: Nhiều \author{} rời rạc (ACM / onecolumn / IEEE trơn)
-        matches = list(re.finditer(r'\\author\s*\{', template))
-        if len(matches) > 1 or (len(matches) == 1 and '\\and' not in template):
-            is_elsarticle = 'elsarticle' in template
-            is_acm = '\\affiliation' in template and not is_elsarticle
-            
+        so_author = mo_hinh.so_lenh_author
+        if so_author > 1 or (so_author == 1 and not mo_hinh.co_and):
             # Xoá TẤT CẢ các thẻ tác giả cũ (bao gồm cả các thẻ của ACM)
-            while True:
-                m = re.search(r'\\(author|affil|affiliation|address|email|orcid|authornote|authornotemark)\s*\{', template)
-                if not m: break
-                v_mo = m.end() - 1
-                v_dong = self._tim_cap_ngoac(template, v_mo)
-                if v_dong != -1:
-                    template = template[:m.start()] + template[v_dong+1:]
-                else:
-                    break
-                    
-            # Tìm vị trí chèn (trước \maketitle hoặc \begin{abstract})
-            diem_chen = -1
-            for moc in [r'\\maketitle', r'\\begin\{abstract\}']:
-                m = re.search(moc, template)
-                if m:
-                    diem_chen = m.start()
-                    break
-                    
-            if diem_chen == -1:
-                return template
-                
+            for bat_dau, ket_thuc in mo_hinh.vung_tac_gia:
+                them_sua(cac_sua, bat_dau, ket_thuc, '')
+
+            # Chèn trước \maketitle hoặc \begin{abstract}
+            if mo_hinh.diem_chen_tac_gia is None:
+                return
+
             # Tạo block mới
             block_moi = ""
             for auth in author_list:
                 block_moi += rf'\author{{{auth["name"]}}}' + '\n'
                 for aff in auth['affil']:
-                    if is_elsarticle:
+                    if mo_hinh.la_elsarticle:
                         block_moi += rf'\affiliation{{organization={{{aff}}}}}' + '\n'
-                    elif is_acm:
+                    elif mo_hinh.la_acm:
                         block_moi += rf'\affiliation{{ \institution{{{aff}}} }}' + '\n'
                     else:
                         block_moi += rf'\affil{{{aff}}}' + '\n'
-            
-            template = template[:diem_chen] + block_moi + '\n' + template[diem_chen:]
-            return template
+
+            them_sua(cac_sua, mo_hinh.diem_chen_tac_gia, mo_hinh.diem_chen_tac_gia, block_moi + '\n')
+            return
 
         # Fallback (chẳng hạn nếu fallback 1 cục): xử lý như cũ (trường hợp template không định dạng)
+        if mo_hinh.author_dau is None:
+            return
         noi_dung_author_parts = [loc_ky_tu(info).strip() for info in authors]
         noi_dung_author = ' \\\\\n'.join(noi_dung_author_parts)
-        
-        vi_tri_dau_tien = None
-        while True:
-            match = re.search(r'\\author\s*\{', template)
-            if not match:
-                break
-            if vi_tri_dau_tien is None:
-                vi_tri_dau_tien = match.start()
-            vi_tri_mo = match.end() - 1  # vị trí {
-            vi_tri_dong = self._tim_cap_ngoac(template, vi_tri_mo)
-            if vi_tri_dong == -1:
-                break
-            template = template[:match.start()] + template[vi_tri_dong + 1:]
-
-        if vi_tri_dau_tien is None:
-            return template
-
-        template = (
-            template[:vi_tri_dau_tien]
-            + f'\\author{{{noi_dung_author}}}\n'
-            + template[vi_tri_dau_tien:]
-        )
-        return template
+
+        them_sua(cac_sua, mo_hinh.author_dau, mo_hinh.author_dau, f'\\author{{{noi_dung_author}}}\n')
+        for bat_dau, ket_thuc in mo_hinh.vung_author:
+            them_sua(cac_sua, bat_dau, ket_thuc, '')
 
     def _strip_latex_commands(self, text: str) -> str:
         """Loại bỏ các lệnh LaTeX formatting để lấy plain text cho matching."""
@@ -1663,7 +1779,7 @@ class ChuyenDoiWordSangLatex:
             return '\n'.join(cac_dong[dong_bat_dau_noi_dung:])
         return body
 
-    def _thay_the_body(self, template: str) -> str:
+    def _thay_the_body(self, mo_hinh: MoHinhTemplate, cac_sua: list):
         """Thay thế TOÀN BỘ dummy content trong template bằng body thật từ Word.
 
         Chiến lược:
@@ -1675,129 +1791,109 @@ class ChuyenDoiWordSangLatex:
         """
         body = self.parsed_data.get('body', '')
         if not body.strip():
-            return template
+            return
 
         # Lọc bỏ metadata Word dư thừa ở đầu body
         body = self._loc_metadata_word_thua(body)
 
-        # Tìm điểm bắt đầu (ưu tiên cao → thấp)
+        # Điểm bắt đầu: mốc đầu tiên còn lại của mỗi loại (vd \end{abstract} bị xóa khi abstract rỗng),
+        # lấy vị trí xa nhất (sau cùng trong template)
         diem_bat_dau = -1
-        cac_moc_bat_dau = [
-            r'\\end\{frontmatter\}',
-            r'\\end\{IEEEkeywords\}',
-            r'\\end\{abstract\}',
-            r'\\maketitle',
-        ]
-        for moc in cac_moc_bat_dau:
-            match = re.search(moc, template)
-            if match:
-                # Lấy vị trí xa nhất (sau cùng trong template)
-                if match.end() > diem_bat_dau:
-                    diem_bat_dau = match.end()
+        for cac_moc in mo_hinh.moc_body:
+            for bat_dau, ket_thuc in cac_moc:
+                if mo_hinh.con_lai(bat_dau, ket_thuc, cac_sua):
+                    diem_bat_dau = max(diem_bat_dau, ket_thuc)
+                    break
 
         if diem_bat_dau == -1:
             # Không tìm thấy mốc → fallback
-            return template
+            return
 
         # Điểm kết thúc: LUÔN là \end{document} — xóa TẤT CẢ dummy content
-        match_end = re.search(r'\\end\{document\}', template)
-        if not match_end:
-            return template
-        diem_ket_thuc = match_end.start()
-
-        # Xây dựng template mới: giữ preamble + chèn body + \end{document}
-        template = (
-            template[:diem_bat_dau]
-            + '\n\n' + body + '\n\n'
-            + template[diem_ket_thuc:]
-        )
-        return template
+        diem_ket_thuc = next((v for v in mo_hinh.end_document
+                              if mo_hinh.con_lai(v, v + len(r'\end{document}'), cac_sua)), None)
+        if diem_ket_thuc is None:
+            return
 
-    def _template_co_cau_truc(self, template: str) -> bool:
-        """Kiểm tra template có cấu trúc ngữ nghĩa (title/abstract/maketitle)
-        hay chỉ là template đơn giản với %%CONTENT%%.
-        """
-        # Nếu template có \maketitle hoặc \title{ → cấu trúc IEEE/ACM
-        co_maketitle = '\\maketitle' in template
-        co_title_cmd = bool(re.search(r'\\title\s*\{', template))
-        co_abstract = '\\begin{abstract}' in template
-        # Template được coi là có cấu trúc nếu có ít nhất 1 trong 3 dấu hiệu
-        return co_maketitle or co_title_cmd or co_abstract
-
-    def inject_into_template(self, template: str) -> str:
+        # Giữ preamble + chèn body + \end{document}
+        them_sua(cac_sua, diem_bat_dau, diem_ket_thuc, '\n\n' + body + '\n\n', gom_bien=True)
+
+    def _them_goi_longtable(self, mo_hinh: MoHinhTemplate, cac_sua: list):
+        # longtable chỉ được dùng cho bảng dữ liệu rất lớn → thêm package khi thực sự có
+        if self.so_longtable and '{longtable}' not in mo_hinh.van_ban and mo_hinh.begin_document != -1:
+            them_sua(cac_sua, mo_hinh.begin_document, mo_hinh.begin_document, r"\usepackage{longtable}" + "\n")
+
+    def inject_into_template(self, mo_hinh: MoHinhTemplate) -> str:
         """BƯỚC 2: Tiêm parsed_data vào template LaTeX có cấu trúc.
 
-        Thứ tự xử lý: title → abstract → keywords → body
-        Mỗi bước dùng regex helper riêng biệt, dễ debug.
+        Thứ tự xử lý: title → author → abstract → keywords → body
+        Mỗi bước thêm thao tác sửa theo vị trí đã phân tích sẵn của template,
+        kết quả ghép một lần từ các đoạn của template.
         """
-        ket_qua = template
-        
-        # Xóa các khối rác của Elsevier (nếu có)
-        ket_qua = re.sub(r'\\begin\{graphicalabstract\}.*?\\end\{graphicalabstract\}', '', ket_qua, flags=re.DOTALL)
-        ket_qua = re.sub(r'\\begin\{highlights\}.*?\\end\{highlights\}', '', ket_qua, flags=re.DOTALL)
+        cac_sua = []
 
         # 1. Title
-        ket_qua = self._thay_the_title(ket_qua)
+        self._thay_the_title(mo_hinh, cac_sua)
 
         # 2. Author (thay thế example authors trong template)
-        ket_qua = self._thay_the_author(ket_qua)
+        self._thay_the_author(mo_hinh, cac_sua)
 
         # 3. Abstract
-        ket_qua = self._thay_the_abstract(ket_qua)
+        self._thay_the_abstract(mo_hinh, cac_sua)
 
         # 4. Keywords
-        ket_qua = self._thay_the_keywords(ket_qua)
+        self._thay_the_keywords(mo_hinh, cac_sua)
 
         # 4. Body (quan trọng nhất)
-        ket_qua = self._thay_the_body(ket_qua)
+        self._thay_the_body(mo_hinh, cac_sua)
 
         # 5. Fallback: nếu body injection thất bại, thử %%CONTENT%%
-        if '%%CONTENT%%' in ket_qua:
-            all_content = self.parsed_data.get('body', '')
-            ket_qua = ket_qua.replace('%%CONTENT%%', all_content)
+        all_content = self.parsed_data.get('body', '')
+        for vi_tri in mo_hinh.cac_content:
+            them_sua(cac_sua, vi_tri, vi_tri + len('%%CONTENT%%'), all_content)
 
-        return ket_qua
+        self._them_goi_longtable(mo_hinh, cac_sua)
+        return mo_hinh.ghep(cac_sua)
 
     def chuyen_doi(self):
         """Thực hiện chuyển đổi: đọc Word → phân loại → tiêm vào template → ghi file."""
-        template = self.doc_template()
-
-        # Đảm bảo template có các package cần thiết
-        cac_goi_can_them = []
-        # Xóa package booktabs vì ta dùng \hline chuẩn
-        if r"\usepackage{multirow}" not in template:
-            cac_goi_can_them.append(r"\usepackage{multirow}")
-            cac_goi_can_them.append(r"\usepackage{multicol}")
-        if r"\usepackage{float}" not in template:
-            cac_goi_can_them.append(r"\usepackage{float}")
-        if r"\usepackage{subcaption}" not in template and r"\usepackage{subfig}" not in template:
-            cac_goi_can_them.append(r"\usepackage{subcaption}")
-        if '{hyperref}' not in template:
-            cac_goi_can_them.append(r"\usepackage{hyperref}")
-            # Ẩn viền xanh quanh hyperlink trong PDF
-            cac_goi_can_them.append(r"\hypersetup{colorlinks=true,linkcolor=black,urlcolor=blue,citecolor=black}")
-        elif 'colorlinks' not in template and r"\hypersetup" not in template:
-            # Template đã có hyperref nhưng chưa cấu hình colorlinks
-            cac_goi_can_them.append(r"\hypersetup{colorlinks=true,linkcolor=black,urlcolor=blue,citecolor=black}")
-
-        if cac_goi_can_them:
-            goi_str = "\n".join(cac_goi_can_them) + "\n"
-            if r"\begin{document}" in template:
-                template = template.replace(r"\begin{document}", goi_str + r"\begin{document}")
-            else:
-                template = template + "\n" + goi_str
-
-        # Phân biệt: template có cấu trúc (IEEE/ACM) hay đơn giản (%%CONTENT%%)
-        co_cau_truc = self._template_co_cau_truc(template)
+        # Template đọc + phân tích một lần cho mỗi file (đã thêm package cần thiết), dùng lại giữa các job
+        mo_hinh = lay_mo_hinh_template(self.duong_dan_template)
+        self.template_hai_cot = mo_hinh.hai_cot
 
-        if co_cau_truc:
-            # --- Semantic Mapping Pipeline ---
-            self.phan_tich_ngu_nghia()            # BƯỚC 1: Bóc tách
-            latex_cuoi = self.inject_into_template(template)  # BƯỚC 2: Tiêm
-        else:
-            # --- Fallback: dùng %%CONTENT%% như cũ ---
-            noi_dung = self.sinh_noi_dung()
-            latex_cuoi = template.replace('%%CONTENT%%', noi_dung)
+        try:
+            # Phân biệt: template có cấu trúc (IEEE/ACM) hay đơn giản (%%CONTENT%%)
+            if mo_hinh.co_cau_truc:
+                # --- Semantic Mapping Pipeline ---
+                self.phan_tich_ngu_nghia()            # BƯỚC 1: Bóc tách
+                latex_cuoi = self.inject_into_template(mo_hinh)  # BƯỚC 2: Tiêm
+            else:
+                # --- Fallback: dùng %%CONTENT%% như cũ ---
+                noi_dung = self.sinh_noi_dung()
+                cac_sua = []
+                for vi_tri in mo_hinh.cac_content:
+                    them_sua(cac_sua, vi_tri, vi_tri + len('%%CONTENT%%'), noi_dung)
+                self._them_goi_longtable(mo_hinh, cac_sua)
+                latex_cuoi = mo_hinh.ghep(cac_sua)
+        finally:
+            # Ảnh được ghi song song trong lúc duyệt → chờ xong trước khi xuất .tex
+            self.cho_xu_ly_anh_hoan_tat()
+        latex_cuoi = self.giai_anh_cong_thuc(latex_cuoi)
+        # Công thức dồn cho pandoc: chuyển cả tài liệu trong một tiến trình
+        latex_cuoi = self.bo_toan.giai_cong_thuc_pandoc(latex_cuoi)
+
+        thong_ke = self.bo_toan.hoan_tat_bo_nho_dem()
+        if any(thong_ke.values()):
+            print(f"[INFO] Bộ nhớ đệm công thức: {thong_ke['tinh_truoc']} chuyển trước song song, "
+                  f"{thong_ke['trung_ram']} trúng RAM, "
+                  f"{thong_ke['trung_dia']} trúng đĩa, {thong_ke['truot']} trượt")
+        ha_cap = self.bo_toan.bao_cao_ha_cap()
+        if ha_cap:
+            print(f"[Cảnh báo] {len(ha_cap)} công thức bị hạ cấp do giới hạn thời gian:")
+            for muc in ha_cap[:20]:
+                print(f"    - {muc['cong_thuc']!r}: {muc['ly_do']}")
+            if len(ha_cap) > 20:
+                print(f"    ... và {len(ha_cap) - 20} công thức khác")
 
         with open(self.duong_dan_dau_ra, 'w', encoding='utf-8') as f:
             f.write(latex_cuoi)
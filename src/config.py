@@ -12,6 +12,11 @@ OLE_NAMESPACE = 'urn:schemas-microsoft-com:office:office'
 
 VML_NAMESPACE = 'urn:schemas-microsoft-com:vml'
 
+# ProgID của OLE object là công thức: Equation Editor 3.0 (Equation.3) và MathType (Equation.DSMT4, ...)
+# OLE khác (Excel, Visio, Package...) không giải mã MTEF, không chèn preview như công thức
+PROGID_OLE_CONG_THUC = ('Equation.3',)
+TIEN_TO_PROGID_OLE_CONG_THUC = ('Equation.DSMT',)
+
 R_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
 
 # Namespace cho Drawing
@@ -91,6 +96,10 @@ MAP_STYLE = {
     'TableFootnote': '',       # Table footnote → text thường
 }
 
+# Từ khóa đánh dấu đã vào phần nội dung chính (sau abstract/introduction)
+TU_KHOA_PHAN_NOI_DUNG = ['ABSTRACT', 'INTRODUCTION', 'TÓM TẮT',
+                         'GIỚI THIỆU', 'MỞ ĐẦU', 'CHƯƠNG 1']
+
 # HEADING PATTERNS: Phát hiện heading từ nội dung (khi Word không gán style)
 HEADING_PATTERNS = [
     # --- Heading tiếng Việt ---
@@ -258,3 +267,52 @@ for _p in _office_paths:
     if _os.path.exists(_p):
         DEFAULT_OMML2MML_XSL = _p
         break
+
+# HIỆU NĂNG: số luồng xử lý ảnh song song (giải mã, chấm điểm, ghi file)
+# Pillow nhả GIL khi decode/lọc ảnh nên luồng phụ chạy song song thật sự
+SO_LUONG_XU_LY_ANH = max(1, min(4, _os.cpu_count() or 1))
+
+# TỐI ƯU ẢNH: giảm độ phân giải ảnh về DPI mục tiêu theo kích thước hiển thị (EMU) trong Word
+DPI_ANH_MUC_TIEU = 300
+# Chỉ resample khi ảnh gốc lớn hơn mục tiêu ít nhất hệ số này (tránh mã hóa lại vô ích)
+HE_SO_GIAM_ANH_TOI_THIEU = 1.25
+# Ảnh chụp (nhiều màu, không kênh alpha) được mã hóa lại sang JPEG với chất lượng này
+CHAT_LUONG_JPEG = 90
+SO_MAU_TOI_THIEU_ANH_CHUP = 10000
+
+# THĂM DÒ ẢNH: ảnh có cạnh lớn nhất nhỏ hơn ngưỡng này (pixel) bị loại ngay từ header, không giải mã
+KICH_THUOC_ANH_TOI_THIEU_PX = 16
+
+# ẢNH CÔNG THỨC: preview WMF/EMF của OLE công thức được phóng to hệ số này khi chuyển sang PNG
+HE_SO_PHONG_ANH_CONG_THUC = 3
+
+# PANDOC FALLBACK: công thức mọi hướng khác thất bại được gom lại, chuyển bằng một tiến trình pandoc
+# Ngân sách thời gian pandoc cho mỗi tài liệu (giây); hết ngân sách → dùng text gốc của công thức
+THOI_GIAN_PANDOC_TOI_DA_GIAY = 60
+# Số công thức tối đa trong một file .docx tổng hợp gửi cho pandoc
+SO_CONG_THUC_MOI_LO_PANDOC = 200
+
+# BỘ NHỚ ĐỆM CÔNG THỨC: kết quả OMML → LaTeX theo mã băm dạng chuẩn của cây OMML,
+# OLE Equation → LaTeX theo mã băm của blob và của MTEF bên trong
+SO_CONG_THUC_TOI_DA_BO_NHO_DEM = 5000
+# File SQLite cho tầng đệm trên đĩa (dùng chung giữa các lần chạy / worker); để trống → chỉ đệm trong RAM
+DUONG_DAN_BO_NHO_DEM_CONG_THUC = _os.getenv('W2L_FORMULA_CACHE_DB', '').strip() or None
+# Tăng khi đổi logic chuyển công thức để bỏ qua kết quả cũ trong tầng đĩa
+PHIEN_BAN_BO_CHUYEN_TOAN = 1
+
+# TOÁN SONG SONG: gom mọi công thức (OMML + OLE) từ đầu, chuyển trước bằng process pool
+# Chỉ bật khi số công thức chưa có trong bộ nhớ đệm đạt ngưỡng (tránh chi phí khởi động tiến trình)
+SO_CONG_THUC_TOI_THIEU_SONG_SONG = 200
+SO_TIEN_TRINH_TOAN = max(1, min(8, _os.cpu_count() or 1))
+# Thời gian tối đa cho mỗi công thức (giây): công thức quá hạn trong process pool bị hạ cấp thành text gốc;
+# khi render chỉ kiểm tra được giữa các bước (XSLT trong tiến trình chính không ngắt được): XSLT đã quá mức
+# này thì bỏ parser thủ công, XSLT + parser thủ công đã quá mức này thì không gửi tiếp cho pandoc
+THOI_GIAN_TOI_DA_MOI_CONG_THUC_GIAY = 2.0
+
+# NGÂN SÁCH THỜI GIAN TOÁN: tổng thời gian chuyển công thức cho mỗi tài liệu (giây)
+# Hết ngân sách → bỏ XSLT / pandoc, chỉ dùng parser thủ công hoặc text gốc; công thức bị hạ cấp được báo cáo
+THOI_GIAN_TOAN_TOI_DA_MOI_TAI_LIEU_GIAY = 120
+
+# BẢNG DỮ LIỆU RẤT LỚN: bảng có từ ngần này dòng trở lên được render thành longtable (ngắt trang),
+# duyệt theo từng dòng thay cho float table + tabular dựng toàn bộ lưới ô
+SO_HANG_TOI_THIEU_LONGTABLE = 200
@@ -0,0 +1,583 @@
+# do_hieu_nang.py - Microbenchmark cho các đường nóng của bộ chuyển đổi
+#
+# Cách dùng (chạy trong thư mục src/):
+#   python do_hieu_nang.py xslt [so_cong_thuc]
+#   python do_hieu_nang.py unicode [so_chuoi]
+#   python do_hieu_nang.py mtef [so_cong_thuc]
+#   python do_hieu_nang.py mtef-thong-luong [so_moi_nhom] [file.docx ...]
+#   python do_hieu_nang.py fuzz-mtef [so_input]
+#
+# Mỗi phép đo chạy cách cũ và cách mới trên cùng bộ dữ liệu sinh sẵn (cố định, không ngẫu nhiên),
+# in thời gian, số lần gọi mỗi giây và bộ nhớ tạm mỗi lần gọi (tracemalloc), đồng thời kiểm tra kết quả trùng nhau.
+# mtef-thong-luong đo riêng từng nhóm của kho MTEF (thường, lồng sâu, ma trận lớn, pile dài, embellishment, file thật);
+# fuzz-mtef đột biến kho MTEF và chạy trong tiến trình con, thoát mã 1 nếu có input làm parser treo quá giới hạn.
+# Lưu ý: tracemalloc chỉ thấy bộ nhớ Python; phần libxml2 cấp phát (deepcopy, parse) không được tính.
+
+import os
+import re
+import sys
+import time
+import struct
+import tracemalloc
+from copy import deepcopy
+
+from lxml import etree
+
+from config import OMML_NAMESPACE, W_NAMESPACE, DEFAULT_OMML2MML_XSL
+from xu_ly_ole_equation import (
+    _END, _LINE, _CHAR, _TMPL, _PILE, _MATRIX, _EMBELL, _RULER, _FONT_STYLE_DEF, _SIZE,
+    _FULL, _SUB, _SUB2, _SYM, _SUBSYM,
+)
+
+# XSLT đi kèm repo (src/OMML2MML.XSL) dùng khi máy không cài Office
+XSLT_DO = DEFAULT_OMML2MML_XSL or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'OMML2MML.XSL')
+
+
+def _m(tag: str) -> str:
+    return f'{{{OMML_NAMESPACE}}}{tag}'
+
+
+def _run_toan(text: str):
+    r = etree.Element(_m('r'))
+    etree.SubElement(r, _m('t')).text = text
+    return r
+
+
+def _boc(tag: str, *con):
+    e = etree.Element(_m(tag))
+    for c in con:
+        e.append(c)
+    return e
+
+
+def tao_cong_thuc_mau(so_luong: int) -> list:
+    # Sinh so_luong oMath đủ loại cấu trúc (phân số, căn, chỉ số, tổng, ngoặc, ma trận)
+    # Các oMath được gắn vào một w:document chung giống lúc render tài liệu thật
+    ky_hieu = ['x', 'y', 'α', '≤', '12', '∞', '→', 'a+b', 'β', '∑']
+    doc = etree.Element(f'{{{W_NAMESPACE}}}document', nsmap={'w': W_NAMESPACE, 'm': OMML_NAMESPACE})
+    body = etree.SubElement(doc, f'{{{W_NAMESPACE}}}body')
+    ket_qua = []
+    for i in range(so_luong):
+        a = _run_toan(ky_hieu[i % len(ky_hieu)])
+        b = _run_toan(ky_hieu[(i * 7 + 3) % len(ky_hieu)])
+        mau = i % 6
+        if mau == 0:
+            cau_truc = _boc('f', _boc('num', a), _boc('den', b))
+        elif mau == 1:
+            cau_truc = _boc('rad', _boc('radPr', _boc('degHide')), _boc('deg'), _boc('e', a, b))
+        elif mau == 2:
+            cau_truc = _boc('sSubSup', _boc('e', a), _boc('sub', _run_toan('i')), _boc('sup', b))
+        elif mau == 3:
+            cau_truc = _boc('nary', _boc('sub', _run_toan('i=1')), _boc('sup', _run_toan('n')),
+                            _boc('e', _boc('f', _boc('num', a), _boc('den', b))))
+        elif mau == 4:
+            cau_truc = _boc('d', _boc('e', a), _boc('e', b))
+        else:
+            cau_truc = _boc('m', _boc('mr', _boc('e', a), _boc('e', b)),
+                            _boc('mr', _boc('e', _run_toan('0')), _boc('e', _run_toan('1'))))
+        omath = _boc('oMath', _run_toan('y='), cau_truc)
+        etree.SubElement(body, f'{{{W_NAMESPACE}}}p').append(omath)
+        ket_qua.append(omath)
+    return ket_qua
+
+
+def do(ten: str, ham, du_lieu: list):
+    # Đo một hàm trên toàn bộ dữ liệu: thời gian, bộ nhớ tạm trung bình / lớn nhất mỗi lần gọi
+    # (đỉnh tracemalloc trong lần gọi trừ bộ nhớ đang giữ trước lần gọi)
+    ket_qua = []
+    tong_tam = tam_lon_nhat = 0
+    tracemalloc.start()
+    for x in du_lieu:
+        tracemalloc.reset_peak()
+        truoc, _ = tracemalloc.get_traced_memory()
+        ket_qua.append(ham(x))
+        _, dinh = tracemalloc.get_traced_memory()
+        tong_tam += dinh - truoc
+        tam_lon_nhat = max(tam_lon_nhat, dinh - truoc)
+    tracemalloc.stop()
+
+    # Đo thời gian riêng (tracemalloc làm chậm đáng kể)
+    bat_dau = time.perf_counter()
+    for x in du_lieu:
+        ham(x)
+    giay = time.perf_counter() - bat_dau
+    print(f"  {ten:<30} {giay * 1000:9.1f} ms  {len(du_lieu) / max(giay, 1e-9):9.0f} lần/s  "
+          f"bộ nhớ tạm/lần {tong_tam / max(1, len(du_lieu)) / 1024:7.1f} KB  "
+          f"lớn nhất {tam_lon_nhat / 1024:7.1f} KB")
+    return ket_qua
+
+
+def do_xslt(so_cong_thuc: int = 2000):
+    # XSLT: deepcopy + str(kết quả) + regex + parse lại (cũ) so với duyệt thẳng cây kết quả (mới)
+    from xu_ly_toan import BoXuLyToan
+    bo_toan = BoXuLyToan(XSLT_DO)
+    if bo_toan._xslt_transform is None:
+        print(f"[INFO] Không có XSLT tại {XSLT_DO}, bỏ qua phép đo")
+        return
+    cong_thuc = tao_cong_thuc_mau(so_cong_thuc)
+
+    def mathml_chuoi_sang_latex(mathml_str):
+        # Đường cũ: chuỗi MathML → thư viện, hoặc bỏ prefix / namespace bằng regex rồi parse lại
+        if bo_toan._mathml_to_latex_fn is not None:
+            try:
+                return bo_toan._mathml_to_latex_fn(mathml_str)
+            except Exception as e:
+                print(f'[Cảnh báo] Lỗi mathml_to_latex: {e}')
+        try:
+            clean = re.sub(r'<(/?)mml:', r'<\1', mathml_str)
+            clean = re.sub(r'\s+xmlns:[a-z]+="[^"]*"', '', clean)
+            return bo_toan._parse_mathml_node(etree.fromstring(clean.encode('utf-8'))).strip()
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi parse MathML: {e}')
+            return ""
+
+    def cach_cu(omath):
+        ket_qua = str(bo_toan._xslt_transform(deepcopy(omath))).strip()
+        return mathml_chuoi_sang_latex(ket_qua) if '<math' in ket_qua or '<mml:math' in ket_qua else ket_qua
+
+    print(f"[INFO] XSLT → LaTeX trên {so_cong_thuc} công thức")
+    cu = do('deepcopy + chuỗi + parse lại', cach_cu, cong_thuc)
+    moi = do('duyệt thẳng cây kết quả', bo_toan._via_xslt, cong_thuc)
+    so_khac = sum(1 for a, b in zip(cu, moi) if a != b)
+    print(f"  kết quả khác nhau: {so_khac}")
+
+
+def do_unicode(so_chuoi: int = 20000):
+    # Ký tự Unicode toán → LaTeX: re.sub lần lượt từng mục OMML_CHAR_MAP (cũ) so với một lượt translate (mới)
+    from config import OMML_CHAR_MAP
+    from xu_ly_omml import thay_ky_tu_unicode_toan
+
+    ky_tu = [m for m, _ in OMML_CHAR_MAP] + list('xyzabn0123+-=() ')
+    chuoi = [
+        ''.join(ky_tu[(i * 31 + j * 17) % len(ky_tu)] for j in range(1 + i % 12))
+        for i in range(so_chuoi)
+    ]
+
+    def cach_cu(text):
+        for pattern, replacement in OMML_CHAR_MAP:
+            text = re.sub(pattern, replacement, text)
+        return text
+
+    print(f"[INFO] Thay ký tự Unicode toán trên {so_chuoi} chuỗi text của m:t")
+    cu = do('re.sub theo từng mục', cach_cu, chuoi)
+    moi = do('str.translate một lượt', thay_ky_tu_unicode_toan, chuoi)
+    so_khac = sum(1 for a, b in zip(cu, moi) if a != b)
+    print(f"  kết quả khác nhau: {so_khac}")
+
+
+def _mtef_ky_tu(ma: int, kieu: int = 3) -> bytes:
+    return bytes([0x02, 128 + kieu]) + struct.pack('<H', ma)
+
+
+def _mtef_dong(*noi_dung) -> bytes:
+    return b'\x01' + b''.join(noi_dung) + b'\x00'
+
+
+def _mtef_mau(selector: int, *slots) -> bytes:
+    return bytes([0x03, selector, 0]) + b''.join(slots) + b'\x00'
+
+
+_MTEF_DAU = bytes([3, 1, 1, 3, 0])
+_MTEF_BIEN = [ord(c) for c in 'xyzabn'] + [0x3B1, 0x3B8]
+
+
+def tao_mtef_mau(so_luong: int) -> list:
+    # Sinh so_luong chuỗi MTEF v3 (Equation Editor 3.0): phân số, căn, chỉ số, tích phân, ngoặc lồng nhau
+    ky_tu, dong, mau = _mtef_ky_tu, _mtef_dong, _mtef_mau
+    ket_qua = []
+    for i in range(so_luong):
+        a = ky_tu(_MTEF_BIEN[i % len(_MTEF_BIEN)])
+        b = ky_tu(ord('0') + i % 10, 8)
+        thanh_phan = [
+            mau(11, dong(a, ky_tu(ord('+'), 6), b) + b'\x00', dong(b, a)),
+            mau(10, dong(a, ky_tu(ord('-'), 6), b)),
+            mau(29, dong(a), b'\x0b', dong(ky_tu(ord('i'))), b'\x0d', dong(b)),
+            mau(15, dong(a), b'\x0b', dong(b), dong(ky_tu(ord('n'))), b'\x0d', dong(ky_tu(0x222B, 6))),
+            mau(1, dong(a, ky_tu(ord('+'), 6), b), ky_tu(ord('('), 22), ky_tu(ord(')'), 22)),
+        ]
+        so_tang = 1 + i % 4
+        noi_dung = b''.join(thanh_phan[(i + k) % len(thanh_phan)] for k in range(so_tang))
+        ket_qua.append(_MTEF_DAU + dong(a, ky_tu(ord('='), 6), noi_dung))
+    return ket_qua
+
+
+def tao_kho_mtef(so_luong: int) -> dict:
+    # Kho MTEF tổng hợp theo nhóm (mỗi nhóm so_luong công thức, cố định theo chỉ số):
+    # thường, lồng sâu, ma trận lớn, pile dài, nhiều embellishment
+    ky_tu, dong, mau = _mtef_ky_tu, _mtef_dong, _mtef_mau
+
+    def long_sau(i):
+        # Phân số / căn / chỉ số lồng nhau 20..59 tầng
+        noi_dung = ky_tu(_MTEF_BIEN[i % len(_MTEF_BIEN)])
+        for k in range(20 + i % 40):
+            b = ky_tu(ord('0') + k % 10, 8)
+            if k % 3 == 0:
+                noi_dung = mau(11, dong(noi_dung) + b'\x00', dong(b))
+            elif k % 3 == 1:
+                noi_dung = mau(10, dong(noi_dung, ky_tu(ord('+'), 6), b))
+            else:
+                noi_dung = mau(29, dong(b), b'\x0b', dong(noi_dung))
+        return _MTEF_DAU + dong(noi_dung)
+
+    def ma_tran_lon(i):
+        # Ma trận 4..16 hàng × 4..16 cột, mỗi ô một biểu thức ngắn
+        so_hang, so_cot = 4 + i % 13, 4 + (i * 7) % 13
+        o = b''.join(
+            ky_tu(_MTEF_BIEN[(r + c) % len(_MTEF_BIEN)]) + ky_tu(ord('0') + (r * c) % 10, 8) + b'\x00'
+            for r in range(so_hang) for c in range(so_cot)
+        )
+        return _MTEF_DAU + dong(bytes([0x05, so_hang, so_cot]) + bytes(so_cot) + o)
+
+    def pile_dai(i):
+        # Pile (hệ phương trình) 20..99 dòng
+        cac_dong = b''.join(
+            dong(ky_tu(_MTEF_BIEN[k % len(_MTEF_BIEN)]), ky_tu(ord('='), 6), ky_tu(ord('0') + k % 10, 8))
+            for k in range(20 + i % 80)
+        )
+        return _MTEF_DAU + dong(bytes([0x04, 1]) + cac_dong + b'\x00')
+
+    def trang_tri(i):
+        # 50 ký tự, mỗi ký tự kèm 1..3 embellishment (chấm, mũ, vector, gạch trên...)
+        kieu = [2, 3, 5, 6, 7, 8, 17]
+        return _MTEF_DAU + dong(*(
+            ky_tu(_MTEF_BIEN[(i + k) % len(_MTEF_BIEN)])
+            + b''.join(bytes([0x06, kieu[(i + k + j) % len(kieu)]]) for j in range(1 + k % 3))
+            for k in range(50)
+        ))
+
+    return {
+        'thường': tao_mtef_mau(so_luong),
+        'lồng sâu': [long_sau(i) for i in range(so_luong)],
+        'ma trận lớn': [ma_tran_lon(i) for i in range(so_luong)],
+        'pile dài': [pile_dai(i) for i in range(so_luong)],
+        'embellishment': [trang_tri(i) for i in range(so_luong)],
+    }
+
+
+def doc_mtef_thuc_te(*duong_dan) -> list:
+    # MTEF trích từ file thật: .docx/.docm (mọi word/embeddings/oleObject*.bin) hoặc .bin rời
+    import zipfile
+    from xu_ly_ole_equation import extract_mtef_from_ole
+
+    cac_blob = []
+    for duong in duong_dan:
+        if zipfile.is_zipfile(duong):
+            with zipfile.ZipFile(duong) as z:
+                cac_blob += [z.read(ten) for ten in z.namelist()
+                             if ten.startswith('word/embeddings/') and ten.endswith('.bin')]
+        else:
+            with open(duong, 'rb') as f:
+                cac_blob.append(f.read())
+    ket_qua = []
+    for blob in cac_blob:
+        mtef = extract_mtef_from_ole(blob)
+        if mtef:
+            ket_qua.append(bytes(mtef))
+    return ket_qua
+
+
+class MTEFParser:
+    # Parser MTEF v3 tham chiếu (đệ quy, đọc từng byte qua method) — cách cũ để so với parse_mtef
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+        self.version = data[0]
+        self.platform = data[1]
+        self.product = data[2]
+        self.prod_ver = data[3]
+        self.prod_sub = data[4]
+        self.pos = 5
+
+    def _read_byte(self):
+        if self.pos >= len(self.data):
+            return None
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def _peek_byte(self):
+        if self.pos >= len(self.data):
+            return None
+        return self.data[self.pos]
+
+    def _read_uint16_le(self):
+        if self.pos + 1 >= len(self.data):
+            self.pos = len(self.data)
+            return 0
+        lo = self.data[self.pos]
+        hi = self.data[self.pos + 1]
+        self.pos += 2
+        return (hi << 8) | lo
+
+    def parse(self):
+        # Parse toàn bộ MTEF → danh sách record
+        records = []
+        while self.pos < len(self.data):
+            rec = self._parse_record()
+            if rec is None:
+                break
+            records.append(rec)
+        return records
+
+    def _parse_record(self):
+        if self.pos >= len(self.data):
+            return None
+        tag = self._read_byte()
+        if tag is None:
+            return None
+        rec_type = tag & 0x0F
+        options = (tag >> 4) & 0x0F
+
+        if rec_type == _END:
+            return ('END',)
+        elif rec_type == _LINE:
+            return self._parse_line(options)
+        elif rec_type == _CHAR:
+            return self._parse_char(options)
+        elif rec_type == _TMPL:
+            return self._parse_tmpl(options)
+        elif rec_type == _PILE:
+            return self._parse_pile(options)
+        elif rec_type == _MATRIX:
+            return self._parse_matrix(options)
+        elif rec_type == _EMBELL:
+            return self._parse_embell(options)
+        elif rec_type in (_FULL, _SUB, _SUB2, _SYM, _SUBSYM):
+            # Các record đánh dấu kích thước - không có dữ liệu phụ
+            return (['FULL', '', '', 'SIZE', '', 'SUB', 'SUB2', '', '', '', 'FULL', 'SUB', 'SUB2', 'SYM', 'SUBSYM'][rec_type],)
+        elif rec_type in (_RULER, _FONT_STYLE_DEF, _SIZE):
+            # Bỏ qua các record ít gặp
+            return ('SKIP',)
+        else:
+            return ('UNKNOWN', tag)
+
+    def _parse_line(self, options):
+        children = []
+        while self.pos < len(self.data):
+            rec = self._parse_record()
+            if rec is None or rec[0] == 'END':
+                break
+            children.append(rec)
+        return ('LINE', children)
+
+    def _parse_char(self, options):
+        typeface = self._read_byte() or 0x81
+        char_code = self._read_uint16_le()
+        font_style = typeface - 128
+        return ('CHAR', font_style, char_code)
+
+    def _parse_tmpl(self, options):
+        selector = self._read_byte() or 0
+        variation = self._read_byte() or 0
+        # Variation 2 bytes nếu bit 7 set (chủ yếu MTEF v5)
+        if variation & 0x80:
+            var2 = self._read_byte() or 0
+            variation = (variation & 0x7F) | (var2 << 7)
+
+        # Đọc các slot (mỗi slot kết thúc bằng END)
+        # Đọc tham lam, dừng khi byte tiếp theo không phải LINE/END
+        slots = []
+        for _ in range(8):  # tối đa 8 slot
+            if self.pos >= len(self.data):
+                break
+            slot = self._parse_slot()
+            slots.append(slot)
+            # Kiểm tra byte tiếp: nếu không phải END/LINE → dừng
+            nxt = self._peek_byte()
+            if nxt is None:
+                break
+            nxt_type = nxt & 0x0F
+            if nxt_type not in (_END, _LINE):
+                break
+
+        return ('TMPL', selector, variation, slots)
+
+    def _parse_slot(self):
+        # Đọc danh sách record cho đến END
+        records = []
+        while self.pos < len(self.data):
+            rec = self._parse_record()
+            if rec is None or rec[0] == 'END':
+                break
+            records.append(rec)
+        return records
+
+    def _parse_pile(self, options):
+        halign = self._read_byte() or 0
+        lines = []
+        while self.pos < len(self.data):
+            rec = self._parse_record()
+            if rec is None or rec[0] == 'END':
+                break
+            lines.append(rec)
+        return ('PILE', halign, lines)
+
+    def _parse_matrix(self, options):
+        rows = self._read_byte() or 1
+        cols = self._read_byte() or 1
+        # Đọc alignment cho mỗi cột
+        col_aligns = []
+        for _ in range(cols):
+            col_aligns.append(self._read_byte() or 0)
+        # Đọc rows*cols cell (mỗi cell kết thúc bằng END)
+        cells = []
+        for _ in range(rows * cols):
+            cell = self._parse_slot()
+            cells.append(cell)
+        return ('MATRIX', rows, cols, cells)
+
+    def _parse_embell(self, options):
+        embell_type = self._read_byte() or 0
+        return ('EMBELL', embell_type)
+
+
+def do_mtef(so_cong_thuc: int = 3000):
+    # MTEF → cây cú pháp: MTEFParser (đệ quy, đọc từng byte) so với parser memoryview + stack tường minh
+    from xu_ly_ole_equation import parse_mtef
+
+    mtef = tao_mtef_mau(so_cong_thuc)
+    print(f"[INFO] Parse MTEF trên {so_cong_thuc} công thức")
+    cu = do('MTEFParser (đệ quy)', lambda du_lieu: MTEFParser(du_lieu).parse(), mtef)
+    moi = do('memoryview + stack', parse_mtef, mtef)
+    so_khac = sum(1 for a, b in zip(cu, moi) if a != b)
+    print(f"  kết quả khác nhau: {so_khac}")
+
+
+def do_thong_luong_mtef(so_cong_thuc: int = 500, *duong_dan):
+    # Thông lượng parse_mtef / mtef_tree_to_latex theo từng nhóm của kho MTEF
+    # (+ nhóm 'thực tế' nếu truyền thêm file .docx/.docm/.bin chứa OLE Equation)
+    from xu_ly_ole_equation import parse_mtef, mtef_tree_to_latex
+
+    kho = tao_kho_mtef(so_cong_thuc)
+    if duong_dan:
+        kho['thực tế'] = doc_mtef_thuc_te(*duong_dan)
+    for nhom, mtef in kho.items():
+        if not mtef:
+            print(f"[INFO] Nhóm {nhom}: không có công thức, bỏ qua")
+            continue
+        print(f"[INFO] Nhóm {nhom}: {len(mtef)} công thức, trung bình {sum(map(len, mtef)) // len(mtef)} byte")
+        cay = do('parse_mtef', parse_mtef, mtef)
+        do('mtef_tree_to_latex', mtef_tree_to_latex, cay)
+
+
+def _dot_bien_mtef(ngau_nhien, kho: list) -> bytes:
+    # Một input hỏng sinh từ kho: lật byte, cắt cụt, chèn tag ngẫu nhiên, ghép hai công thức,
+    # nhân bản một đoạn (tăng độ lồng), hoặc chèn header ma trận / template cực đại
+    du_lieu = bytearray(ngau_nhien.choice(kho))
+    for _ in range(ngau_nhien.randint(1, 4)):
+        cach = ngau_nhien.randrange(6)
+        vi_tri = ngau_nhien.randrange(len(du_lieu) + 1)
+        if cach == 0 and du_lieu:
+            du_lieu[min(vi_tri, len(du_lieu) - 1)] = ngau_nhien.randrange(256)
+        elif cach == 1:
+            del du_lieu[vi_tri:]
+        elif cach == 2:
+            du_lieu[vi_tri:vi_tri] = bytes(ngau_nhien.randrange(16) | (ngau_nhien.randrange(16) << 4)
+                                          for _ in range(ngau_nhien.randint(1, 8)))
+        elif cach == 3:
+            khac = ngau_nhien.choice(kho)
+            du_lieu[vi_tri:] = khac[ngau_nhien.randrange(len(khac)):]
+        elif cach == 4 and du_lieu:
+            dau = ngau_nhien.randrange(len(du_lieu))
+            doan = du_lieu[dau:dau + ngau_nhien.randint(1, 64)]
+            du_lieu[vi_tri:vi_tri] = doan * ngau_nhien.randint(2, 200)
+        else:
+            du_lieu[vi_tri:vi_tri] = ngau_nhien.choice([b'\x05\xff\xff', b'\x03\x0b\x80\xff', b'\x04\x00' * 50])
+    return bytes(du_lieu)
+
+
+def _tien_trinh_fuzz(ket_noi):
+    # Tiến trình con của fuzz: nhận MTEF, parse + sinh LaTeX, gửi lại None (ổn) hoặc mô tả lỗi
+    from xu_ly_ole_equation import parse_mtef, mtef_tree_to_latex
+    ket_noi.send('san_sang')
+    while True:
+        du_lieu = ket_noi.recv()
+        if du_lieu is None:
+            return
+        try:
+            mtef_tree_to_latex(parse_mtef(du_lieu))
+            ket_noi.send(None)
+        except RecursionError:
+            # ole_equation_to_latex đã bắt riêng (công thức lồng quá sâu) → không tính là lỗi
+            ket_noi.send(None)
+        except Exception as e:
+            ket_noi.send(f'{type(e).__name__}: {e}')
+
+
+def fuzz_mtef(so_mau: int = 5000, gioi_han_giay: float = 2.0, hat_giong: int = 0):
+    # Fuzz có giới hạn: mỗi input hỏng phải parse + sinh LaTeX xong trong gioi_han_giay
+    # Chạy trong tiến trình con để phát hiện treo; input treo / lỗi được lưu ra file fuzz_mtef_*.bin
+    # Trả về số input treo (main thoát mã 1 nếu > 0)
+    import random
+    import multiprocessing
+
+    ngau_nhien = random.Random(hat_giong)
+    kho = [x for nhom in tao_kho_mtef(50).values() for x in nhom]
+    ngu_canh = multiprocessing.get_context('spawn')
+
+    def khoi_dong():
+        cha, con = ngu_canh.Pipe()
+        tien_trinh = ngu_canh.Process(target=_tien_trinh_fuzz, args=(con,), daemon=True)
+        tien_trinh.start()
+        # Chờ tiến trình con import xong để thời gian khởi động không tính vào input đầu tiên
+        cha.recv()
+        return cha, tien_trinh
+
+    def luu(loai, i, du_lieu):
+        ten = f'fuzz_mtef_{loai}_{hat_giong}_{i}.bin'
+        with open(ten, 'wb') as f:
+            f.write(du_lieu)
+        return ten
+
+    print(f"[INFO] Fuzz MTEF: {so_mau} input, giới hạn {gioi_han_giay:g}s mỗi input, hạt giống {hat_giong}")
+    ket_noi, tien_trinh = khoi_dong()
+    so_treo = so_loi = 0
+    lau_nhat = 0.0
+    bat_dau = time.perf_counter()
+    try:
+        for i in range(so_mau):
+            du_lieu = _dot_bien_mtef(ngau_nhien, kho)
+            t0 = time.perf_counter()
+            ket_noi.send(du_lieu)
+            if not ket_noi.poll(gioi_han_giay):
+                so_treo += 1
+                print(f"  [TREO] input #{i} ({len(du_lieu)} byte) → {luu('treo', i, du_lieu)}")
+                tien_trinh.kill()
+                tien_trinh.join()
+                ket_noi, tien_trinh = khoi_dong()
+                continue
+            lau_nhat = max(lau_nhat, time.perf_counter() - t0)
+            loi = ket_noi.recv()
+            if loi is not None:
+                so_loi += 1
+                print(f"  [LỖI] input #{i}: {loi} → {luu('loi', i, du_lieu)}")
+    finally:
+        ket_noi.send(None)
+        tien_trinh.join(timeout=5)
+    print(f"  {so_mau} input trong {time.perf_counter() - bat_dau:.1f}s, lâu nhất {lau_nhat * 1000:.1f} ms, "
+          f"treo {so_treo}, lỗi {so_loi}")
+    return so_treo
+
+
+PHEP_DO = {
+    'xslt': do_xslt,
+    'unicode': do_unicode,
+    'mtef': do_mtef,
+    'mtef-thong-luong': do_thong_luong_mtef,
+    'fuzz-mtef': fuzz_mtef,
+}
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in PHEP_DO:
+        print(f"Cách dùng: python {os.path.basename(__file__)} <{'|'.join(PHEP_DO)}> [so_luong]")
+        return
+    # Tham số thứ hai là số lượng; phần còn lại (nếu có) là đường dẫn file thật cho mtef-thong-luong
+    tham_so = [int(x) for x in sys.argv[2:3]] + sys.argv[3:]
+    if PHEP_DO[sys.argv[1]](*tham_so):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# luoi_bang.py - Lưới ô của bảng Word theo vị trí thực (rowspan / colspan)
+#
+# Dùng chung cho các bộ render bảng: lưới lưu bằng mảng phẳng (array / bytearray) thay cho
+# list lồng nhau + dict theo (r, c), rowspan tính bằng một lượt quét từ dưới lên.
+# Bảng rất lớn dùng LuoiBangTheoDong: không dựng lưới, duyệt lại XML theo từng dòng.
+#
+# Cách dùng:
+#   luoi = LuoiBang(bang)                  # bang: docx.table.Table
+#   i = luoi.ma_o[r * luoi.so_cot + c]     # số hiệu ô phủ vị trí (r, c), -1 nếu trống
+#   if i >= 0 and luoi.bat_dau[i]:
+#       luoi.cell[i], luoi.colspan[i], luoi.rowspan[luoi.nhom[i]]
+#
+#   for cac_o in LuoiBangTheoDong(bang):   # hoặc luoi.cac_o_dong(r)
+#       for c, cell, colspan, rowspan in cac_o: ...   # chỉ các ô bat_dau, theo thứ tự cột
+
+from array import array
+
+from docx.table import Table, _Cell
+from docx.oxml.ns import qn
+
+
+_TAG_TCPR = qn('w:tcPr')
+_TAG_GRIDSPAN = qn('w:gridSpan')
+_TAG_VMERGE = qn('w:vMerge')
+_ATTR_VAL = qn('w:val')
+
+
+def _lay_gridspan(tcPr) -> int:
+    # Lấy colspan từ w:gridSpan (tcPr: phần tử w:tcPr hoặc None)
+    try:
+        gridSpan = tcPr.find(_TAG_GRIDSPAN) if tcPr is not None else None
+        if gridSpan is None:
+            return 1
+        val = gridSpan.get(_ATTR_VAL)
+        if val is None:
+            return 1
+        return max(1, int(val))
+    except Exception as e:
+        print(f'[Cảnh báo] Lỗi im lặng ở luoi_bang.py dòng 35: {e}')
+        return 1
+
+
+def _lay_vmerge(tcPr):
+    # Lấy trạng thái vMerge: None / 'restart' / 'continue'
+    vMerge = tcPr.find(_TAG_VMERGE) if tcPr is not None else None
+    if vMerge is None:
+        return None
+    val = vMerge.get(_ATTR_VAL)
+    if val is None:
+        return 'continue'
+    return str(val)
+
+
+def _uoc_luong_so_cot(tbl) -> int:
+    # Ước lượng số cột theo tblGrid, fallback theo số tc lớn nhất
+    so_cot = 0
+    try:
+        so_cot = len(tbl.tblGrid.gridCol_lst)
+    except Exception as e:
+        print(f'[Cảnh báo] Lỗi im lặng ở luoi_bang.py dòng 60: {e}')
+        so_cot = 0
+    if so_cot <= 0:
+        for tr in tbl.tr_lst:
+            so_cot = max(so_cot, len(tr.tc_lst))
+    return so_cot
+
+
+def _dat_o_theo_dong(tbl, so_cot):
+    # Đặt từng w:tc vào cột lưới, dòng trên xuống: yield (r, [(i, c, tc, colspan, nhom, bat_dau), ...])
+    # Chỉ giữ nhóm của dòng ngay phía trên theo cột (nhom_tren) — đủ để nối ô vMerge continue
+    nhom_tren = [-1] * so_cot
+    i = 0
+    for r, tr in enumerate(tbl.tr_lst):
+        nhom_nay = [-1] * so_cot
+        cac_o = []
+        c = 0
+        for tc in tr.tc_lst:
+            if c >= so_cot:
+                break
+            # Đọc thẳng w:tcPr bằng lxml (nhanh hơn thuộc tính python-docx tc.tcPr.gridSpan)
+            tcPr = tc.find(_TAG_TCPR)
+            colspan = _lay_gridspan(tcPr)
+            tiep_noi = _lay_vmerge(tcPr) in ('continue', 'cont')
+
+            # vMerge continue nối vào nhóm của ô ngay phía trên (nếu có)
+            nhom = nhom_tren[c] if tiep_noi and nhom_tren[c] >= 0 else i
+
+            het = min(c + colspan, so_cot)
+            nhom_nay[c:het] = [nhom] * (het - c)
+            cac_o.append((i, c, tc, colspan, nhom, not tiep_noi))
+            i += 1
+            c += colspan
+        nhom_tren = nhom_nay
+        yield r, cac_o
+
+
+class LuoiBang:
+    # Mỗi w:tc là một ô, đánh số i theo thứ tự đọc (hàng trên xuống, trái sang phải):
+    #   ma_o[r * so_cot + c] : ô phủ vị trí (r, c) (ô gridSpan phủ nhiều cột), -1 nếu trống
+    #   nhom[i]              : ô gốc của nhóm gộp dọc chứa i (vMerge continue → nhóm của ô phía trên)
+    #   bat_dau[i]           : 1 nếu ô i mang nội dung (không phải vMerge continue)
+    #   hang[i], cot[i]      : vị trí bắt đầu; colspan[i]: w:gridSpan (có thể vượt quá số cột lưới)
+    #   rowspan[g]           : số hàng của nhóm g (chỉ có nghĩa tại g = nhom[i] của ô bat_dau)
+    #   tc[i], cell[i]       : phần tử w:tc và handle python-docx (_Cell, giống _Row.cells trả về)
+
+    def __init__(self, bang: Table):
+        tbl = bang._tbl
+        so_cot = _uoc_luong_so_cot(tbl)
+
+        self.so_hang = len(tbl.tr_lst)
+        self.so_cot = so_cot
+        self.ma_o = array('i', [-1]) * (self.so_hang * so_cot)
+        self.nhom = array('i')
+        self.bat_dau = bytearray()
+        self.hang = array('i')
+        self.cot = array('i')
+        self.colspan = array('i')
+        self.tc = []
+        self.cell = []
+
+        ma_o = self.ma_o
+        for r, cac_o in _dat_o_theo_dong(tbl, so_cot):
+            goc = r * so_cot
+            for i, c, tc, colspan, nhom, bat_dau in cac_o:
+                self.nhom.append(nhom)
+                self.bat_dau.append(1 if bat_dau else 0)
+                self.hang.append(r)
+                self.cot.append(c)
+                self.colspan.append(colspan)
+                self.tc.append(tc)
+                self.cell.append(_Cell(tc, bang))
+
+                het = min(c + colspan, so_cot)
+                ma_o[goc + c:goc + het] = array('i', [i]) * (het - c)
+
+        self.rowspan = self._tinh_rowspan()
+
+    def _tinh_rowspan(self) -> array:
+        # Quét từ hàng dưới lên, mỗi cột giữ số hàng nối tiếp phía dưới cùng nhóm (ô continue):
+        #   xuong[c] của hàng r = 1 + xuong[c] của hàng r+1 nếu (r+1, c) là ô continue cùng nhóm, ngược lại 0
+        # Ô bat_dau ở hàng r: rowspan = 1 + max xuong[c] trên các cột nó phủ
+        so_cot, ma_o, nhom, bat_dau = self.so_cot, self.ma_o, self.nhom, self.bat_dau
+        rowspan = array('i', [1]) * len(self.tc)
+        xuong = [0] * so_cot
+        for r in range(self.so_hang - 1, -1, -1):
+            goc = r * so_cot
+            duoi = goc + so_cot
+            for c in range(so_cot):
+                i = ma_o[goc + c]
+                if i < 0:
+                    xuong[c] = 0
+                    continue
+                if r + 1 < self.so_hang:
+                    j = ma_o[duoi + c]
+                    xuong[c] = xuong[c] + 1 if j >= 0 and not bat_dau[j] and nhom[j] == nhom[i] else 0
+                else:
+                    xuong[c] = 0
+                if bat_dau[i]:
+                    g = nhom[i]
+                    if xuong[c] + 1 > rowspan[g]:
+                        rowspan[g] = xuong[c] + 1
+        return rowspan
+
+    def o_tai(self, r: int, c: int) -> int:
+        # Số hiệu ô phủ vị trí (r, c), -1 nếu trống
+        return self.ma_o[r * self.so_cot + c]
+
+    def cac_o_dong(self, r: int) -> list:
+        # Các ô bat_dau của dòng r theo thứ tự cột: [(c, cell, colspan, rowspan), ...]
+        cac_o = []
+        goc = r * self.so_cot
+        for c in range(self.so_cot):
+            i = self.ma_o[goc + c]
+            if i >= 0 and self.bat_dau[i] and self.cot[i] == c:
+                cac_o.append((c, self.cell[i], self.colspan[i], self.rowspan[self.nhom[i]]))
+        return cac_o
+
+
+class LuoiBangTheoDong:
+    # Duyệt bảng rất lớn theo từng dòng, không dựng lưới vị trí hay giữ handle của mọi ô:
+    #   lượt 1 chỉ đọc w:tcPr để tính rowspan, lượt 2 (mỗi lần lặp) tạo _Cell cho từng dòng khi cần.
+    # Rowspan tính từ trên xuống: sau[c] = số dòng continue cùng nhóm liên tiếp tính từ ô gốc ở cột c
+    # (-1 nếu chuỗi đã đứt) — cùng kết quả với LuoiBang._tinh_rowspan, chỉ giữ trạng thái của dòng trên.
+
+    def __init__(self, bang: Table):
+        self.bang = bang
+        self.so_hang = len(bang._tbl.tr_lst)
+        self.so_cot = _uoc_luong_so_cot(bang._tbl)
+        self.rowspan = self._tinh_rowspan()
+
+    def _tinh_rowspan(self) -> array:
+        so_cot = self.so_cot
+        rowspan = array('i')
+        nhom_tren = [-1] * so_cot
+        sau_tren = [-1] * so_cot
+        for _, cac_o in _dat_o_theo_dong(self.bang._tbl, so_cot):
+            nhom_nay = [-1] * so_cot
+            sau_nay = [-1] * so_cot
+            for _, c, _, colspan, nhom, bat_dau in cac_o:
+                rowspan.append(1)
+                for k in range(c, min(c + colspan, so_cot)):
+                    nhom_nay[k] = nhom
+                    if bat_dau:
+                        sau_nay[k] = 0
+                    elif nhom_tren[k] == nhom and sau_tren[k] >= 0:
+                        sau_nay[k] = sau_tren[k] + 1
+                        if sau_nay[k] + 1 > rowspan[nhom]:
+                            rowspan[nhom] = sau_nay[k] + 1
+            nhom_tren, sau_tren = nhom_nay, sau_nay
+        return rowspan
+
+    def __iter__(self):
+        # Mỗi dòng: [(c, cell, colspan, rowspan), ...] các ô bat_dau theo thứ tự cột (giống LuoiBang.cac_o_dong)
+        bang, rowspan = self.bang, self.rowspan
+        for _, cac_o in _dat_o_theo_dong(bang._tbl, self.so_cot):
+            yield [(c, _Cell(tc, bang), colspan, rowspan[nhom])
+                   for _, c, tc, colspan, nhom, bat_dau in cac_o if bat_dau]
@@ -0,0 +1,286 @@
+# mo_hinh_template.py - Mô hình template LaTeX: đọc + phân tích một lần cho mỗi file template
+#
+# Mọi thứ chỉ phụ thuộc template (package cần thêm, template có cấu trúc / hai cột, khối Elsevier thừa,
+# vị trí title / author / abstract / keywords / mốc body / \begin{document} / %%CONTENT%%) được tính
+# một lần rồi giữ trong RAM, tự làm mới khi file đổi (mtime / kích thước).
+# Tiêm nội dung = danh sách thao tác sửa (bat_dau, ket_thuc, van_ban) trên nguồn → ghép một lần.
+#
+# Cách dùng:
+#   mo_hinh = lay_mo_hinh_template('input_data/IEEE-conference-template-062824.tex')
+#   cac_sua = []
+#   them_sua(cac_sua, *mo_hinh.title[:2], 'Tiêu đề mới')
+#   latex = mo_hinh.ghep(cac_sua)
+
+import os
+import re
+import threading
+
+
+# Package bảng / hình / hyperlink mà nội dung sinh ra cần (thêm trước \begin{document} nếu template thiếu)
+def _goi_can_them(template: str) -> list:
+    cac_goi_can_them = []
+    # Xóa package booktabs vì ta dùng \hline chuẩn
+    if r"\usepackage{multirow}" not in template:
+        cac_goi_can_them.append(r"\usepackage{multirow}")
+        cac_goi_can_them.append(r"\usepackage{multicol}")
+    if r"\usepackage{float}" not in template:
+        cac_goi_can_them.append(r"\usepackage{float}")
+    if r"\usepackage{subcaption}" not in template and r"\usepackage{subfig}" not in template:
+        cac_goi_can_them.append(r"\usepackage{subcaption}")
+    if '{hyperref}' not in template:
+        cac_goi_can_them.append(r"\usepackage{hyperref}")
+        # Ẩn viền xanh quanh hyperlink trong PDF
+        cac_goi_can_them.append(r"\hypersetup{colorlinks=true,linkcolor=black,urlcolor=blue,citecolor=black}")
+    elif 'colorlinks' not in template and r"\hypersetup" not in template:
+        # Template đã có hyperref nhưng chưa cấu hình colorlinks
+        cac_goi_can_them.append(r"\hypersetup{colorlinks=true,linkcolor=black,urlcolor=blue,citecolor=black}")
+    return cac_goi_can_them
+
+
+def _template_co_cau_truc(template: str) -> bool:
+    # Template có cấu trúc ngữ nghĩa (title/abstract/maketitle) hay chỉ là template đơn giản với %%CONTENT%%
+    # Nếu template có \maketitle hoặc \title{ → cấu trúc IEEE/ACM
+    co_maketitle = '\\maketitle' in template
+    co_title_cmd = bool(re.search(r'\\title\s*\{', template))
+    co_abstract = '\\begin{abstract}' in template
+    # Template được coi là có cấu trúc nếu có ít nhất 1 trong 3 dấu hiệu
+    return co_maketitle or co_title_cmd or co_abstract
+
+
+def _template_hai_cot(template: str) -> bool:
+    # Template dàn trang hai cột: tùy chọn twocolumn / 5p (elsarticle), hoặc IEEEtran không có onecolumn
+    for m in re.finditer(r'^[ \t]*\\documentclass\s*(?:\[([^\]]*)\])?\s*\{([^}]*)\}', template, re.MULTILINE):
+        tuy_chon = [t.strip() for t in (m.group(1) or '').split(',')]
+        if 'twocolumn' in tuy_chon or '5p' in tuy_chon:
+            return True
+        return m.group(2).strip() == 'IEEEtran' and 'onecolumn' not in tuy_chon
+    return False
+
+
+def tim_cap_ngoac(s: str, vi_tri_bat_dau: int) -> int:
+    # Tìm vị trí đóng ngoặc nhọn } khớp với { tại vi_tri_bat_dau
+    # Xử lý nested braces: \title{A {B} C} → trả về vị trí } cuối
+    if vi_tri_bat_dau >= len(s) or s[vi_tri_bat_dau] != '{':
+        return -1
+    dem = 0
+    for i in range(vi_tri_bat_dau, len(s)):
+        if s[i] == '{' and (i == 0 or s[i-1] != '\\'):
+            dem += 1
+        elif s[i] == '}' and (i == 0 or s[i-1] != '\\'):
+            dem -= 1
+            if dem == 0:
+                return i
+    return -1
+
+
+def _quet_lenh(pattern: str, s: str) -> list:
+    # Vùng [bat_dau, ket_thuc) của các lệnh \cmd{...} khớp pattern, quét trái → phải như vòng xóa tuần tự
+    # (mỗi lần xóa lệnh đầu tiên còn lại); dừng ở lệnh đầu tiên không đóng ngoặc
+    cac_vung = []
+    regex = re.compile(pattern)
+    vi_tri = 0
+    while True:
+        m = regex.search(s, vi_tri)
+        if not m:
+            break
+        v_dong = tim_cap_ngoac(s, m.end() - 1)
+        if v_dong == -1:
+            break
+        cac_vung.append((m.start(), v_dong + 1))
+        vi_tri = v_dong + 1
+    return cac_vung
+
+
+def _nam_trong(vi_tri: int, cac_vung: list) -> bool:
+    return any(s <= vi_tri < e for s, e in cac_vung)
+
+
+def them_sua(cac_sua: list, bat_dau: int, ket_thuc: int, van_ban: str, gom_bien: bool = False):
+    # Thêm thao tác sửa (tọa độ trên nguồn) theo thứ tự tiêm tuần tự:
+    # - nằm trong vùng đã bị thay bởi thao tác trước → bỏ (đoạn đó không còn trong kết quả)
+    # - thao tác trước nằm trong vùng này → bị thay đè, bỏ thao tác trước
+    # Chèn (bat_dau == ket_thuc) đúng tại biên vùng bị thay được giữ lại (trước / sau vùng đó),
+    # trừ khi gom_bien: vùng tính từ mốc nằm ngoài nó (vd body: sau \maketitle → trước \end{document})
+    for s, e, _ in cac_sua:
+        if s < e and s <= bat_dau and ket_thuc <= e and (bat_dau < ket_thuc or s < bat_dau < e):
+            return
+    if bat_dau < ket_thuc:
+        cac_sua[:] = [
+            (s, e, t) for s, e, t in cac_sua
+            if not (bat_dau <= s and e <= ket_thuc
+                    and (s < e or bat_dau < s < ket_thuc or gom_bien))
+        ]
+    cac_sua.append((bat_dau, ket_thuc, van_ban))
+
+
+class MoHinhTemplate:
+    # van_ban_goc : nội dung file
+    # van_ban     : đã thêm package cần thiết (cac_goi_can_them) trước \begin{document}
+    # nguon       : văn bản được tiêm (template có cấu trúc: bỏ thêm khối graphicalabstract/highlights)
+    # Vị trí (trên nguon, None nếu không có):
+    #   title         : (bat_dau, ket_thuc, phan_thanks) nội dung trong \title{...} (giữ lại \thanks{...})
+    #   vung_tac_gia  : các lệnh \author/\affil/\affiliation/\address/\email/\orcid/\authornote(mark){...}
+    #   vung_and      : các \and<khoảng trắng> ngoài vung_tac_gia
+    #   author_ieee   : (bat_dau, ket_thuc) nội dung \author{...} đầu tiên (template \IEEEauthorblockN)
+    #   vung_author   : chỉ các lệnh \author{...}; author_dau: vị trí \author{ đầu tiên
+    #   diem_chen_tac_gia : \maketitle / \begin{abstract} đầu tiên ngoài vung_tac_gia
+    #   abstract      : (bat_dau, ket_thuc, bat_dau_noi_dung, ket_thuc_noi_dung)
+    #   keywords      : ('ieee' | 'keyword', 4 vị trí như abstract) hoặc ('textbf', bat_dau, ket_thuc, nhan)
+    #   moc_body      : mỗi mốc một danh sách (bat_dau, ket_thuc) của \end{frontmatter} / \end{IEEEkeywords} / \end{abstract} / \maketitle
+    #   end_document  : các vị trí \end{document}; begin_document: \begin{document} đầu tiên
+    #   cac_content   : các vị trí %%CONTENT%%
+
+    def __init__(self, van_ban_goc: str):
+        self.van_ban_goc = van_ban_goc
+        self.cac_goi_can_them = _goi_can_them(van_ban_goc)
+        template = van_ban_goc
+        if self.cac_goi_can_them:
+            goi_str = "\n".join(self.cac_goi_can_them) + "\n"
+            if r"\begin{document}" in template:
+                template = template.replace(r"\begin{document}", goi_str + r"\begin{document}")
+            else:
+                template = template + "\n" + goi_str
+        self.van_ban = template
+        self.co_cau_truc = _template_co_cau_truc(template)
+        self.hai_cot = _template_hai_cot(van_ban_goc)
+
+        nguon = template
+        if self.co_cau_truc:
+            # Xóa các khối rác của Elsevier (nếu có)
+            nguon = re.sub(r'\\begin\{graphicalabstract\}.*?\\end\{graphicalabstract\}', '', nguon, flags=re.DOTALL)
+            nguon = re.sub(r'\\begin\{highlights\}.*?\\end\{highlights\}', '', nguon, flags=re.DOTALL)
+        self.nguon = nguon
+        self.begin_document = nguon.find(r'\begin{document}')
+        self.cac_content = [m.start() for m in re.finditer('%%CONTENT%%', nguon)]
+
+        self.title = None
+        self.vung_tac_gia = []
+        self.vung_and = []
+        self.author_ieee = None
+        self.vung_author = []
+        self.author_dau = None
+        self.so_lenh_author = 0
+        self.co_and = False
+        self.co_ieee_author = False
+        self.la_elsarticle = False
+        self.la_acm = False
+        self.diem_chen_tac_gia = None
+        self.abstract = None
+        self.keywords = None
+        self.moc_body = []
+        self.end_document = []
+        if self.co_cau_truc:
+            self._phan_tich_vi_tri()
+
+    def _phan_tich_vi_tri(self):
+        nguon = self.nguon
+
+        # Title: \title{ đầu tiên không nằm sau dấu % trên cùng dòng
+        for match in re.finditer(r'\\title\s*\{', nguon):
+            dong_chua_match = nguon.rfind('\n', 0, match.start())
+            if dong_chua_match == -1:
+                dong_chua_match = 0
+            if '%' in nguon[dong_chua_match:match.start()]:
+                continue
+            vi_tri_mo = match.end() - 1
+            vi_tri_dong = tim_cap_ngoac(nguon, vi_tri_mo)
+            if vi_tri_dong != -1:
+                # Nếu có \thanks{} bên trong, giữ lại
+                noi_dung_cu = nguon[vi_tri_mo + 1:vi_tri_dong]
+                phan_thanks = ''
+                thanks_match = re.search(r'\\thanks\s*\{', noi_dung_cu)
+                if thanks_match:
+                    vi_tri_thanks_dong = tim_cap_ngoac(noi_dung_cu, thanks_match.end() - 1)
+                    if vi_tri_thanks_dong != -1:
+                        phan_thanks = '\n' + noi_dung_cu[thanks_match.start():vi_tri_thanks_dong + 1]
+                self.title = (vi_tri_mo + 1, vi_tri_dong, phan_thanks)
+            break
+
+        # Author
+        self.vung_tac_gia = _quet_lenh(
+            r'\\(author|affil|affiliation|address|email|orcid|authornote|authornotemark)\s*\{', nguon)
+        self.vung_and = [(m.start(), m.end()) for m in re.finditer(r'\\and\s+', nguon)
+                         if not _nam_trong(m.start(), self.vung_tac_gia)]
+        cac_author = list(re.finditer(r'\\author\s*\{', nguon))
+        self.so_lenh_author = len(cac_author)
+        self.co_and = '\\and' in nguon
+        self.co_ieee_author = '\\IEEEauthorblockN' in nguon
+        self.la_elsarticle = 'elsarticle' in nguon
+        self.la_acm = '\\affiliation' in nguon and not self.la_elsarticle
+        if cac_author:
+            self.author_dau = cac_author[0].start()
+            vi_tri_dong = tim_cap_ngoac(nguon, cac_author[0].end() - 1)
+            if vi_tri_dong != -1:
+                self.author_ieee = (cac_author[0].end(), vi_tri_dong)
+        self.vung_author = _quet_lenh(r'\\author\s*\{', nguon)
+        # Vị trí chèn block author mới (trước \maketitle hoặc \begin{abstract}) sau khi xóa thẻ tác giả cũ
+        for moc in [r'\\maketitle', r'\\begin\{abstract\}']:
+            cac_vi_tri = [m.start() for m in re.finditer(moc, nguon)
+                          if not _nam_trong(m.start(), self.vung_tac_gia)]
+            if cac_vi_tri:
+                self.diem_chen_tac_gia = cac_vi_tri[0]
+                break
+
+        # Abstract
+        match = re.search(r'(\\begin\{abstract\})(.*?)(\\end\{abstract\})', nguon, re.DOTALL)
+        if match:
+            self.abstract = (match.start(), match.end(), match.start(2), match.end(2))
+
+        # Keywords: IEEEkeywords → keyword (Elsevier) → dòng \textbf{Keywords:} / \textbf{Index Terms:}
+        for loai, pattern in (('ieee', r'(\\begin\{IEEEkeywords\})(.*?)(\\end\{IEEEkeywords\})'),
+                              ('keyword', r'(\\begin\{keyword\})(.*?)(\\end\{keyword\})')):
+            match = re.search(pattern, nguon, re.DOTALL)
+            if match:
+                self.keywords = (loai, match.start(), match.end(), match.start(2), match.end(2))
+                break
+        else:
+            match = re.search(r'\\textbf\{(Keywords|Index Terms)\s*:?\}[^\n]*', nguon, re.IGNORECASE)
+            if match:
+                self.keywords = ('textbf', match.start(), match.end(), match.group(1))
+
+        # Body: bắt đầu sau mốc xa nhất, kết thúc trước \end{document}
+        for moc in [r'\\end\{frontmatter\}', r'\\end\{IEEEkeywords\}', r'\\end\{abstract\}', r'\\maketitle']:
+            self.moc_body.append([(m.start(), m.end()) for m in re.finditer(moc, nguon)])
+        self.end_document = [m.start() for m in re.finditer(r'\\end\{document\}', nguon)]
+
+    @staticmethod
+    def con_lai(bat_dau: int, ket_thuc: int, cac_sua: list) -> bool:
+        # Đoạn [bat_dau, ket_thuc) của nguồn còn nguyên sau các thao tác sửa (không bị xóa / thay)
+        return not any(s < e and s < ket_thuc and bat_dau < e for s, e, _ in cac_sua)
+
+    def ghep(self, cac_sua: list) -> str:
+        # Ghép nguồn với các thao tác sửa (đã sắp theo vị trí, chèn trước vùng thay cùng vị trí)
+        nguon = self.nguon
+        cac_phan = []
+        vi_tri = 0
+        for bat_dau, ket_thuc, van_ban in sorted(cac_sua, key=lambda sua: (sua[0], sua[1])):
+            if ket_thuc < vi_tri:
+                continue
+            bat_dau = max(bat_dau, vi_tri)
+            cac_phan.append(nguon[vi_tri:bat_dau])
+            cac_phan.append(van_ban)
+            vi_tri = ket_thuc
+        cac_phan.append(nguon[vi_tri:])
+        return "".join(cac_phan)
+
+
+# Bộ nhớ đệm theo đường dẫn tuyệt đối: (mtime_ns, kích thước, mô hình)
+_bo_nho_dem_mo_hinh = {}
+_khoa_bo_nho_dem = threading.Lock()
+
+
+def lay_mo_hinh_template(duong_dan: str) -> MoHinhTemplate:
+    # Mô hình của file template, đọc + phân tích lại chỉ khi file đổi (mtime / kích thước)
+    duong_dan = os.path.abspath(duong_dan)
+    thong_tin = os.stat(duong_dan)
+    dau_vet = (thong_tin.st_mtime_ns, thong_tin.st_size)
+    with _khoa_bo_nho_dem:
+        muc = _bo_nho_dem_mo_hinh.get(duong_dan)
+    if muc is not None and muc[0] == dau_vet:
+        return muc[1]
+
+    with open(duong_dan, 'r', encoding='utf-8') as f:
+        mo_hinh = MoHinhTemplate(f.read())
+    with _khoa_bo_nho_dem:
+        _bo_nho_dem_mo_hinh[duong_dan] = (dau_vet, mo_hinh)
+    return mo_hinh
@@ -1,9 +1,101 @@
 # xu_ly_anh.py - Xử lý phân tích và lọc ảnh (trang trí vs nội dung)
 
+import io
+import os
 import math
 import re
+import hashlib
+import struct
 from PIL import Image, ImageStat, ImageFilter
 
+from config import (
+    DPI_ANH_MUC_TIEU, HE_SO_GIAM_ANH_TOI_THIEU,
+    CHAT_LUONG_JPEG, SO_MAU_TOI_THIEU_ANH_CHUP,
+    KICH_THUOC_ANH_TOI_THIEU_PX, HE_SO_PHONG_ANH_CONG_THUC,
+)
+
+# 1 inch = 914400 EMU (đơn vị kích thước trong DrawingML)
+_EMU_MOI_INCH = 914400
+
+# PNG IHDR color type → mode PIL tương ứng
+_CHE_DO_PNG = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+# JPEG: số thành phần màu trong SOF → mode PIL tương ứng
+_CHE_DO_JPEG = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+# Marker SOF0..SOF15 (trừ DHT 0xC4, JPG 0xC8, DAC 0xCC) chứa kích thước ảnh
+_MARKER_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _tham_do_png(blob: bytes):
+    # PNG: chữ ký 8 byte, chunk đầu tiên luôn là IHDR (rộng, cao, bit depth, color type)
+    if len(blob) < 26 or blob[12:16] != b'IHDR':
+        return None
+    rong, cao = struct.unpack('>II', blob[16:24])
+    bit_depth, color_type = blob[24], blob[25]
+    che_do = _CHE_DO_PNG.get(color_type)
+    if color_type == 0 and bit_depth == 1:
+        che_do = '1'
+    return 'PNG', (rong, cao), che_do
+
+
+def _tham_do_jpeg(blob: bytes):
+    # JPEG: duyệt các segment từ SOI tới marker SOF đầu tiên (không đọc dữ liệu nén)
+    vi_tri = 2
+    do_dai = len(blob)
+    while vi_tri + 4 <= do_dai:
+        if blob[vi_tri] != 0xFF:
+            return None
+        marker = blob[vi_tri + 1]
+        # Byte đệm 0xFF liên tiếp
+        if marker == 0xFF:
+            vi_tri += 1
+            continue
+        # Marker đứng riêng (không có độ dài): TEM, RSTn
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            vi_tri += 2
+            continue
+        # EOI / SOS trước SOF → file hỏng
+        if marker in (0xD9, 0xDA):
+            return None
+        do_dai_segment = struct.unpack('>H', blob[vi_tri + 2:vi_tri + 4])[0]
+        if marker in _MARKER_SOF:
+            if vi_tri + 10 > do_dai:
+                return None
+            cao, rong = struct.unpack('>HH', blob[vi_tri + 5:vi_tri + 9])
+            so_thanh_phan = blob[vi_tri + 9]
+            return 'JPEG', (rong, cao), _CHE_DO_JPEG.get(so_thanh_phan)
+        vi_tri += 2 + do_dai_segment
+    return None
+
+
+def _tham_do_gif(blob: bytes):
+    # GIF: logical screen descriptor ngay sau chữ ký (little-endian)
+    if len(blob) < 10:
+        return None
+    rong, cao = struct.unpack('<HH', blob[6:10])
+    return 'GIF', (rong, cao), 'P'
+
+
+def _tham_do_bmp(blob: bytes):
+    # BMP: BITMAPCOREHEADER (12 byte, kích thước 16-bit) hoặc BITMAPINFOHEADER trở lên (32-bit)
+    if len(blob) < 26:
+        return None
+    kich_thuoc_dib = struct.unpack('<I', blob[14:18])[0]
+    if kich_thuoc_dib == 12:
+        rong, cao, _, bpp = struct.unpack('<HHHH', blob[18:26])
+    else:
+        if len(blob) < 30:
+            return None
+        rong, cao, _, bpp = struct.unpack('<iiHH', blob[18:30])
+    # Chiều cao âm = ảnh lưu từ trên xuống
+    rong, cao = abs(rong), abs(cao)
+    if bpp == 1:
+        che_do = '1'
+    elif bpp <= 8:
+        che_do = 'P'
+    else:
+        che_do = 'RGB'
+    return 'BMP', (rong, cao), che_do
+
 class BoLocAnh:
     # Bộ lọc ảnh: phân biệt ảnh nội dung (photo, chart) và ảnh trang trí (logo, icon)
 
@@ -150,6 +242,71 @@ class BoLocAnh:
 
         return diem >= 4
 
+    @staticmethod
+    def tham_do_anh(blob: bytes):
+        # Đọc định dạng, kích thước, mode màu trực tiếp từ header (PNG/JPEG/GIF/BMP), không giải mã
+        # Định dạng khác → PIL làm dự phòng (Image.open chỉ đọc header, chưa decode)
+        # Trả về dict {'dinh_dang', 'kich_thuoc', 'che_do'} hoặc None nếu không nhận dạng được
+        if not blob:
+            return None
+        try:
+            ket_qua = None
+            if blob[:8] == b'\x89PNG\r\n\x1a\n':
+                ket_qua = _tham_do_png(blob)
+            elif blob[:3] == b'\xff\xd8\xff':
+                ket_qua = _tham_do_jpeg(blob)
+            elif blob[:6] in (b'GIF87a', b'GIF89a'):
+                ket_qua = _tham_do_gif(blob)
+            elif blob[:2] == b'BM':
+                ket_qua = _tham_do_bmp(blob)
+            else:
+                im = Image.open(io.BytesIO(blob))
+                ket_qua = (im.format, im.size, im.mode)
+        except Exception as e:
+            print(f"[Cảnh báo] Lỗi tham_do_anh: {e}")
+            return None
+
+        if ket_qua is None:
+            return None
+        dinh_dang, kich_thuoc, che_do = ket_qua
+        return {'dinh_dang': dinh_dang, 'kich_thuoc': kich_thuoc, 'che_do': che_do}
+
+    @classmethod
+    def danh_gia_blob(cls, blob: bytes) -> dict:
+        # Giải mã + chấm điểm ảnh trực tiếp từ bytes, không cần ghi ra đĩa
+        # An toàn khi chạy trong thread pool (không đụng trạng thái bộ chuyển đổi)
+        ket_qua = {
+            'ma_bam': hashlib.sha1(blob or b'').hexdigest(),
+            'hop_le': False,
+            'la_noi_dung': False,
+            'kich_thuoc': (0, 0),
+            'dinh_dang': None,
+            'la_anh_chup': False,
+        }
+
+        # Thăm dò header trước: ảnh hỏng, kích thước 0 hoặc quá nhỏ bị loại mà không cần giải mã
+        tham_do = cls.tham_do_anh(blob)
+        if tham_do is None:
+            return ket_qua
+        rong, cao = tham_do['kich_thuoc']
+        if rong == 0 or cao == 0:
+            return ket_qua
+        ket_qua['kich_thuoc'] = (rong, cao)
+        ket_qua['dinh_dang'] = tham_do['dinh_dang']
+        if max(rong, cao) < KICH_THUOC_ANH_TOI_THIEU_PX:
+            return ket_qua
+
+        try:
+            im = Image.open(io.BytesIO(blob))
+        except Exception as e:
+            print(f"[Cảnh báo] Lỗi danh_gia_blob: {e}")
+            return ket_qua
+
+        ket_qua['hop_le'] = True
+        ket_qua['la_noi_dung'] = cls.la_anh_noi_dung(im)
+        ket_qua['la_anh_chup'] = BoToiUuAnh.la_anh_chup(im)
+        return ket_qua
+
     # LỌC ẢNH TRANG TRÍ (dựa trên metadata + context)
 
     @staticmethod
@@ -280,3 +437,100 @@ class BoLocAnh:
                         return True
 
         return False
+
+
+class BoToiUuAnh:
+    # Giảm độ phân giải ảnh về DPI mục tiêu theo kích thước hiển thị trong Word
+    # (ảnh chụp 20-40 MP đặt rộng 3 inch chỉ cần ~900 px ở 300 DPI)
+
+    @staticmethod
+    def la_anh_chup(im) -> bool:
+        # Ảnh chụp (tông màu liên tục, không trong suốt) → JPEG gần như không mất mát
+        try:
+            if im.mode not in ('RGB', 'L', 'CMYK', 'YCbCr'):
+                return False
+            if 'transparency' in im.info:
+                return False
+            if im.format == 'JPEG':
+                return True
+            return BoLocAnh.tinh_so_mau_anh(im) >= SO_MAU_TOI_THIEU_ANH_CHUP
+        except Exception as e:
+            print(f"[Cảnh báo] Lỗi la_anh_chup: {e}")
+            return False
+
+    @staticmethod
+    def tinh_kich_thuoc_dich(kich_thuoc_px, kich_thuoc_emu, dpi: int = DPI_ANH_MUC_TIEU):
+        # Tính kích thước pixel mục tiêu (giữ tỉ lệ) từ extent EMU; None = giữ nguyên ảnh
+        rong_px, cao_px = kich_thuoc_px
+        cx, cy = kich_thuoc_emu
+        if rong_px <= 0 or cao_px <= 0 or cx <= 0 or cy <= 0:
+            return None
+
+        rong_can = cx / _EMU_MOI_INCH * dpi
+        cao_can = cy / _EMU_MOI_INCH * dpi
+        he_so = max(rong_can / rong_px, cao_can / cao_px)
+        # Ảnh đã bằng hoặc nhỏ hơn mục tiêu (trong ngưỡng) → không đụng tới
+        if he_so * HE_SO_GIAM_ANH_TOI_THIEU > 1:
+            return None
+        return (max(1, round(rong_px * he_so)), max(1, round(cao_px * he_so)))
+
+    @staticmethod
+    def chon_dinh_dang(danh_gia: dict, kich_thuoc_dich) -> str:
+        # Chọn đuôi file đầu ra: 'jpg' / 'png', hoặc None nếu ghi nguyên bản
+        if kich_thuoc_dich is None:
+            return None
+        if danh_gia.get('la_anh_chup'):
+            return 'jpg'
+        return 'png'
+
+    @staticmethod
+    def ghi_anh(duong_dan_anh: str, blob: bytes, kich_thuoc_dich=None, dinh_dang: str = None):
+        # Ghi ảnh ra đĩa: nguyên bản, hoặc resample + mã hóa lại (chạy trong thread pool)
+        if kich_thuoc_dich is None or dinh_dang is None:
+            with open(duong_dan_anh, 'wb') as f:
+                f.write(blob)
+            return
+
+        try:
+            im = Image.open(io.BytesIO(blob))
+            # JPEG: decoder tự thu nhỏ 1/2, 1/4, 1/8 khi giải mã → nhanh hơn nhiều với ảnh lớn
+            if im.format == 'JPEG':
+                im.draft('RGB', kich_thuoc_dich)
+            icc = im.info.get('icc_profile')
+            im = im.resize(kich_thuoc_dich, Image.LANCZOS)
+
+            if dinh_dang == 'jpg':
+                if im.mode not in ('RGB', 'L'):
+                    im = im.convert('RGB')
+                im.save(duong_dan_anh, 'JPEG', quality=CHAT_LUONG_JPEG,
+                        optimize=True, icc_profile=icc)
+            else:
+                if im.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P', '1'):
+                    im = im.convert('RGBA')
+                im.save(duong_dan_anh, 'PNG', icc_profile=icc)
+        except Exception as e:
+            # Không tối ưu được → ghi nguyên bản để không mất ảnh
+            print(f"[Cảnh báo] Lỗi tối ưu ảnh {duong_dan_anh}: {e}")
+            with open(duong_dan_anh, 'wb') as f:
+                f.write(blob)
+
+    @staticmethod
+    def raster_hoa_cong_thuc(thu_muc_anh: str, ten_anh_goc: str, blob: bytes) -> str:
+        # Preview WMF/EMF của công thức OLE → PNG phóng to (LANCZOS), lỗi → ghi nguyên file gốc
+        # Chạy trong thread pool; trả về tên file thực sự được ghi
+        goc, ext = os.path.splitext(ten_anh_goc)
+        if ext.lower() in ('.wmf', '.emf'):
+            try:
+                im = Image.open(io.BytesIO(blob))
+                kich_thuoc_moi = (im.size[0] * HE_SO_PHONG_ANH_CONG_THUC,
+                                  im.size[1] * HE_SO_PHONG_ANH_CONG_THUC)
+                im = im.resize(kich_thuoc_moi, Image.LANCZOS)
+                ten_anh = goc + '.png'
+                im.save(os.path.join(thu_muc_anh, ten_anh))
+                return ten_anh
+            except Exception as e:
+                print(f"[Cảnh báo] Lỗi chuyển ảnh công thức {ten_anh_goc} sang PNG: {e}")
+
+        with open(os.path.join(thu_muc_anh, ten_anh_goc), 'wb') as f:
+            f.write(blob)
+        return ten_anh_goc
@@ -3,12 +3,45 @@
 import os
 import re
 
-from docx.table import Table
+from docx.table import Table, _Cell
+from docx.text.run import Run
 from docx.oxml.ns import qn
 
 from config import OMML_NAMESPACE, W_NAMESPACE, OLE_NAMESPACE, VML_NAMESPACE, R_NAMESPACE, A_NAMESPACE, REL_NAMESPACE
+from config import SO_HANG_TOI_THIEU_LONGTABLE, MAP_STYLE, TU_KHOA_PHAN_NOI_DUNG
 from utils import loc_ky_tu
-from xu_ly_ole_equation import ole_equation_to_latex
+from luoi_bang import LuoiBang, LuoiBangTheoDong
+
+_TAG_BLIP = f'{{{A_NAMESPACE}}}blip'
+_TAG_OMATH = f'{{{OMML_NAMESPACE}}}oMath'
+_TAG_OBJECT = f'{{{W_NAMESPACE}}}object'
+_TAG_PSTYLE = qn('w:pStyle')
+_ATTR_VAL = qn('w:val')
+# Đoạn văn trong ô chứa một trong các phần tử này → xử lý đầy đủ qua xu_ly_doan_van
+_TAG_DOAN_VAN_DAC_BIET = (
+    qn('w:drawing'), qn('w:pict'), _TAG_OBJECT, _TAG_BLIP,
+    _TAG_OMATH, qn('w:hyperlink'), qn('w:numPr'),
+)
+
+
+# Từ khóa + mẫu dùng cho đặc trưng phân loại bảng (tính một lần trong _trich_dac_trung_bang)
+_TU_KHOA_MUC_LUC = ['MỤC LỤC', 'TABLE OF CONTENTS']
+_TU_KHOA_LAYOUT = [
+    'ARTICLE INFORMATION', 'ARTICLE TITLE', 'JOURNAL:',
+    'ISSN:', 'ABSTRACT', 'KEYWORDS:', 'TỪ KHÓA:',
+    'AUTHOR', 'AFFILIATION', 'CORRESPONDENCE', 'CITATION',
+    'RECEIVED:', 'ACCEPTED:', 'PUBLISHED:', 'DOI:',
+    'OPEN ACCESS', 'TÓM TẮT', 'VOLUME:', 'ISSUE:',
+]
+_TU_KHOA_METADATA = [
+    "ARTICLE INFO", "ARTICLE INFORMATION", "ABSTRACT",
+    "TÓM TẮT", "THÔNG TIN BÀI BÁO",
+]
+_MAU_TEN_MUC = re.compile(r'(CH[UƯ][ƠƯ]NG|CHAPTER|PH[ẦẦ]N|PART|M[ỤỦ]C)\s*\d')
+_MAU_SO_MUC = re.compile(r'^\d+\.?\d*\.?\s+[A-ZÀ-Ỹ]')
+_MAU_SO_THU_TU_CONG_THUC = re.compile(r'^\(\d+\)$')
+_MAU_NHAN_ANH = re.compile(r'^[\(\[]*[a-zA-Z0-9][\)\]]*\.?$')
+_MAU_CAPTION = re.compile(r'^(Hình|Figure|Fig|Bảng|Table)\s*\d+', re.IGNORECASE)
 
 
 class BoXuLyBang:
@@ -17,11 +50,120 @@ class BoXuLyBang:
     def __init__(self, bo_chuyen):
         # Nhận tham chiếu đến ChuyenDoiWordSangLatex để dùng lại các hàm xử lý run/ảnh/toán
         self.bo_chuyen = bo_chuyen
+        # Đặc trưng của bảng đang phân loại: (tbl, dict) - các hàm la_* của cùng một bảng dùng chung
+        self._dac_trung_bang = (None, None)
+        # styleId (None = style mặc định) → lệnh MAP_STYLE, tránh tra paragraph.style cho từng ô
+        self._lenh_style_theo_id = {}
+
+    # ĐẶC TRƯNG BẢNG (dùng chung cho các hàm phân loại)
+
+    def lay_dac_trung_bang(self, bang: Table):
+        # Đặc trưng của bảng, tính một lần cho mỗi bảng; None nếu không đọc được cấu trúc bảng
+        tbl = bang._tbl
+        if self._dac_trung_bang[0] is not tbl:
+            try:
+                dac_trung = self._trich_dac_trung_bang(bang)
+            except Exception as e:
+                print(f'[Cảnh báo] Không trích được đặc trưng bảng: {e}')
+                dac_trung = None
+            self._dac_trung_bang = (tbl, dac_trung)
+        return self._dac_trung_bang[1]
+
+    def _trich_dac_trung_bang(self, bang: Table) -> dict:
+        # Một lượt duyệt XML của bảng → dict:
+        # - so_hang, so_cot (theo tblGrid, giống len(bang.columns))
+        # - hang: mỗi hàng là danh sách ô như bang.rows[r].cells (ô gridSpan lặp lại,
+        #   ô vMerge continue trỏ về ô gốc phía trên)
+        # - o: các ô khác nhau theo thứ tự gặp
+        # - dau_cham: mỗi hàng có dấu dẫn mục lục ('.....' / '…') trong text nối các ô hay không
+        # - tu_khoa: từ khóa trong text đầu bảng — 'muc_luc' (5 hàng đầu), 'layout' (số từ khóa, 10 hàng),
+        #   'metadata' (2 hàng đầu)
+        # Mỗi ô: xem _trich_dac_trung_o; text chỉ đọc một lần cho mỗi tc
+        tbl = bang._tbl
+        grid = tbl.find(qn('w:tblGrid'))
+        so_cot = len(grid.findall(qn('w:gridCol'))) if grid is not None else 0
+
+        hang = []
+        o_duy_nhat = []
+        o_hang_tren = {}  # vị trí lưới → ô gốc của hàng trên
+        for tr in tbl.tr_lst:
+            cac_o = []
+            o_hang_nay = {}
+            vi_tri = tr.grid_before
+            for tc in tr.tc_lst:
+                span = tc.grid_span
+                if tc.vMerge == 'continue' and vi_tri in o_hang_tren:
+                    o = o_hang_tren[vi_tri]
+                else:
+                    o = self._trich_dac_trung_o(tc, bang)
+                    o_duy_nhat.append(o)
+                o_hang_nay[vi_tri] = o
+                cac_o.extend([o] * span)
+                vi_tri += span
+            o_hang_tren = o_hang_nay
+            hang.append(cac_o)
+
+        dau_cham = []
+        for cac_o in hang:
+            text_hang = ''.join(o['text'] for o in cac_o)
+            dau_cham.append('.....' in text_hang or '…' in text_hang)
+
+        def text_dau(so_hang, strip):
+            return ''.join((o['text'].strip() if strip else o['text']).upper() + ' '
+                           for cac_o in hang[:so_hang] for o in cac_o)
+
+        text_muc_luc = text_dau(5, True)
+        text_layout = text_dau(10, True)
+        text_metadata = text_dau(2, False)
+        tu_khoa = {
+            'muc_luc': any(tu in text_muc_luc for tu in _TU_KHOA_MUC_LUC),
+            'layout': sum(1 for tu in _TU_KHOA_LAYOUT if tu in text_layout),
+            'metadata': any(tu in text_metadata for tu in _TU_KHOA_METADATA),
+        }
+
+        return {'so_hang': len(hang), 'so_cot': so_cot, 'hang': hang, 'o': o_duy_nhat,
+                'dau_cham': dau_cham, 'tu_khoa': tu_khoa}
+
+    @staticmethod
+    def _trich_dac_trung_o(tc, bang: Table) -> dict:
+        # Đặc trưng một ô: text (như cell.text), do_dai = len(text), số ảnh / oMath / OLE trong các
+        # paragraph trực tiếp, và các mẫu trên text đã strip:
+        # - so_trang: số trang (1-4 chữ số); so_thu_tu: số thứ tự công thức '(n)'
+        # - cau_truc_muc: số mẫu đầu mục khớp ('CHƯƠNG 1', '1.2 Tên mục') trên text in hoa
+        # - text_dai: > 20 ký tự và không phải nhãn '(a)' / caption 'Hình 1'
+        so_anh = so_omath = so_ole = 0
+        for p in tc.p_lst:
+            for phan_tu in p.iter(_TAG_BLIP, _TAG_OMATH, _TAG_OBJECT):
+                if phan_tu.tag == _TAG_BLIP:
+                    so_anh += 1
+                elif phan_tu.tag == _TAG_OMATH:
+                    so_omath += 1
+                else:
+                    so_ole += 1
+        text = _Cell(tc, bang).text
+        text_gon = text.strip()
+        text_hoa = text_gon.upper()
+        return {
+            'tc': tc,
+            'text': text,
+            'do_dai': len(text),
+            'so_anh': so_anh,
+            'so_omath': so_omath,
+            'so_ole': so_ole,
+            'so_trang': text_gon.isdigit() and 1 <= len(text_gon) <= 4,
+            'so_thu_tu': _MAU_SO_THU_TU_CONG_THUC.match(text_gon) is not None,
+            'cau_truc_muc': (_MAU_TEN_MUC.search(text_hoa) is not None) + (_MAU_SO_MUC.search(text_hoa) is not None),
+            'text_dai': (len(text_gon) > 20 and not _MAU_NHAN_ANH.match(text_gon)
+                         and not _MAU_CAPTION.match(text_gon)),
+        }
+
+    # PHÂN LOẠI BẢNG
 
     def la_table_of_contents(self, bang: Table) -> bool:
         # Phát hiện bảng Mục lục (TOC) dựa trên từ khóa + cấu trúc
         try:
-            if len(bang.rows) < 5:
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None or dac_trung['so_hang'] < 5:
                 return False
 
             if self.bo_chuyen.tong_so_phan_tu > 0:
@@ -29,43 +171,25 @@ class BoXuLyBang:
                 if vi_tri_phan_tram > 30:
                     return False
 
-            toan_bo_text = ''
-            for hang in bang.rows[:min(5, len(bang.rows))]:
-                for cell in hang.cells:
-                    toan_bo_text += cell.text.strip().upper() + ' '
-
-            co_tu_khoa_toc = False
-            tu_khoa_muc_luc = ['MỤC LỤC', 'TABLE OF CONTENTS']
-            for tu in tu_khoa_muc_luc:
-                if tu in toan_bo_text:
-                    co_tu_khoa_toc = True
-                    break
+            co_tu_khoa_toc = dac_trung['tu_khoa']['muc_luc']
 
             dem_dau_cham = 0
             dem_so_trang_cuoi = 0
             dem_cau_truc_muc = 0
 
-            for hang in bang.rows[:min(20, len(bang.rows))]:
-                if len(hang.cells) == 0:
+            for hang, dau_cham in zip(dac_trung['hang'][:20], dac_trung['dau_cham']):
+                if len(hang) == 0:
                     continue
 
-                text_hang = ''.join([c.text for c in hang.cells])
-
-                if '.....' in text_hang or '…' in text_hang:
+                if dau_cham:
                     dem_dau_cham += 1
 
-                if len(hang.cells) >= 2:
-                    cell_cuoi = hang.cells[-1].text.strip()
-                    if cell_cuoi.isdigit() and 1 <= len(cell_cuoi) <= 4:
+                if len(hang) >= 2:
+                    if hang[-1]['so_trang']:
                         dem_so_trang_cuoi += 1
+                    dem_cau_truc_muc += hang[0]['cau_truc_muc']
 
-                    cell_dau = hang.cells[0].text.strip().upper()
-                    if re.search(r'(CH[UƯ][ƠƯ]NG|CHAPTER|PH[ẦẦ]N|PART|M[ỤỦ]C)\s*\d', cell_dau):
-                        dem_cau_truc_muc += 1
-                    if re.search(r'^\d+\.?\d*\.?\s+[A-ZÀ-Ỹ]', cell_dau):
-                        dem_cau_truc_muc += 1
-
-            so_hang_kiem_tra = min(20, len(bang.rows))
+            so_hang_kiem_tra = min(20, dac_trung['so_hang'])
 
             if co_tu_khoa_toc:
                 if dem_dau_cham >= 3 or dem_so_trang_cuoi >= 5:
@@ -83,41 +207,19 @@ class BoXuLyBang:
     def la_bang_chua_anh(self, bang: Table) -> bool:
         # Phát hiện bảng chứa chủ yếu ảnh (figure layout)
         try:
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None:
+                return False
+
             so_cell_co_anh = 0
             so_cell_co_text_dai = 0
-            tong_cell = 0
-            cells_da_kiem = set()
+            tong_cell = len(dac_trung['o'])
 
-            for hang in bang.rows:
-                for cell in hang.cells:
-                    cell_id = id(cell._tc)
-                    if cell_id in cells_da_kiem:
-                        continue
-                    cells_da_kiem.add(cell_id)
-
-                    tong_cell += 1
-                    cell_text = cell.text.strip()
-                    co_anh = False
-
-                    for para in cell.paragraphs:
-                        for run in para.runs:
-                            blips = run._element.findall(f'.//{{{A_NAMESPACE}}}blip')
-                            if blips:
-                                co_anh = True
-                                break
-                        drawings = para._element.findall(f'.//{{{A_NAMESPACE}}}blip')
-                        if drawings:
-                            co_anh = True
-
-                    if co_anh:
-                        so_cell_co_anh += 1
-
-                    if re.match(r'^[\(\[]*[a-zA-Z0-9][\)\]]*\.?$', cell_text):
-                        pass
-                    elif re.match(r'^(Hình|Figure|Fig|Bảng|Table)\s*\d+', cell_text, re.IGNORECASE):
-                        pass
-                    elif len(cell_text) > 20:
-                        so_cell_co_text_dai += 1
+            for o in dac_trung['o']:
+                if o['so_anh']:
+                    so_cell_co_anh += 1
+                if o['text_dai']:
+                    so_cell_co_text_dai += 1
 
             if tong_cell == 0:
                 return False
@@ -140,29 +242,19 @@ class BoXuLyBang:
                 if vi_tri_phan_tram > 25:
                     return False
 
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None:
+                return False
+
             # Bảng dữ liệu thật: nhiều hàng hoặc nhiều cột → không phải layout
-            so_hang = len(bang.rows)
-            so_cot = len(bang.columns) if bang.rows else 0
+            so_hang = dac_trung['so_hang']
+            so_cot = dac_trung['so_cot'] if so_hang else 0
             if so_hang >= 10:
                 return False
             if so_cot >= 4:
                 return False
 
-            toan_bo_text = ''
-            for hang in bang.rows[:min(10, len(bang.rows))]:
-                for cell in hang.cells:
-                    toan_bo_text += cell.text.strip().upper() + ' '
-
-            tu_khoa_layout = [
-                'ARTICLE INFORMATION', 'ARTICLE TITLE', 'JOURNAL:',
-                'ISSN:', 'ABSTRACT', 'KEYWORDS:', 'TỪ KHÓA:',
-                'AUTHOR', 'AFFILIATION', 'CORRESPONDENCE', 'CITATION',
-                'RECEIVED:', 'ACCEPTED:', 'PUBLISHED:', 'DOI:',
-                'OPEN ACCESS', 'TÓM TẮT', 'VOLUME:', 'ISSUE:',
-            ]
-
-            dem_tu_khoa = sum(1 for tu in tu_khoa_layout if tu in toan_bo_text)
-            if dem_tu_khoa >= 3:
+            if dac_trung['tu_khoa']['layout'] >= 3:
                 return True
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 165: {e}')
@@ -175,19 +267,11 @@ class BoXuLyBang:
             if self.bo_chuyen.dem_bang > 5:
                 return False
 
-            text_dau = ""
-            for hang in bang.rows[:2]:
-                for cell in hang.cells:
-                    text_dau += cell.text.upper() + " "
-
-            tu_khoa = [
-                "ARTICLE INFO", "ARTICLE INFORMATION", "ABSTRACT",
-                "TÓM TẮT", "THÔNG TIN BÀI BÁO",
-            ]
-            for k in tu_khoa:
-                if k in text_dau:
-                    return True
-            return False
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None:
+                return False
+
+            return dac_trung['tu_khoa']['metadata']
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 188: {e}')
             return False
@@ -229,20 +313,14 @@ class BoXuLyBang:
     def la_bang_tieu_su(self, bang: Table) -> bool:
         # Nhận diện bảng tiểu sử tác giả (ảnh + đoạn text dài)
         try:
-            if len(bang.columns) != 2:
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None or dac_trung['so_cot'] != 2:
                 return False
 
-            cells = bang.rows[0].cells
-            co_anh = False
-            for cell in cells:
-                for para in cell.paragraphs:
-                    if para._element.findall(f'.//{{{A_NAMESPACE}}}blip'):
-                        co_anh = True
-                        break
-                if co_anh:
-                    break
+            cells = dac_trung['hang'][0]
+            co_anh = any(o['so_anh'] for o in cells)
 
-            text_len = len(bang.rows[0].cells[0].text) + len(bang.rows[0].cells[1].text)
+            text_len = cells[0]['do_dai'] + cells[1]['do_dai']
             return co_anh and text_len > 50
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 242: {e}')
@@ -303,25 +381,69 @@ class BoXuLyBang:
         # Gộp và xử lý nội dung các paragraph bên trong một ô bảng
         noi_dung = []
         for p in cell.paragraphs:
-            text = self.bo_chuyen.xu_ly_doan_van(p, che_do_inline=che_do_inline)
+            text = self._xu_ly_doan_van_thuan(p) if che_do_inline else None
+            if text is None:
+                text = self.bo_chuyen.xu_ly_doan_van(p, che_do_inline=che_do_inline)
             if text:
                 noi_dung.append(text)
         return "\n".join(noi_dung)
 
+    def _lenh_style_doan_van(self, p) -> str:
+        # Lệnh MAP_STYLE của đoạn văn, tra paragraph.style (chậm) một lần cho mỗi styleId
+        pPr = p._p.pPr
+        pStyle = pPr.find(_TAG_PSTYLE) if pPr is not None else None
+        style_id = pStyle.get(_ATTR_VAL) if pStyle is not None else None
+        if style_id not in self._lenh_style_theo_id:
+            self._lenh_style_theo_id[style_id] = MAP_STYLE.get(p.style.name, '')
+        return self._lenh_style_theo_id[style_id]
+
+    def _la_doan_van_thuan(self, p) -> bool:
+        # Đoạn văn chỉ có text thường (ô số liệu...): xu_ly_doan_van(p, che_do_inline=True) chỉ escape +
+        # định dạng từng run. False → cần xử lý đầy đủ (ảnh, công thức, hyperlink, danh sách,
+        # style đặc biệt, trạng thái abstract/bibliography/TOC). Chỉ kiểm tra, không đổi trạng thái
+        phan_tu = p._p
+        if next(phan_tu.iter(*_TAG_DOAN_VAN_DAC_BIET), None) is not None:
+            return False
+        bo_chuyen = self.bo_chuyen
+        if bo_chuyen.dang_trong_abstract or getattr(bo_chuyen, 'dang_trong_bibliography', False):
+            return False
+        if self._lenh_style_doan_van(p) != '':
+            return False
+
+        text_raw = phan_tu.text.strip().upper()
+        if 'TABLE OF CONTENTS' in text_raw or 'MỤC LỤC' in text_raw:
+            return False
+        if not bo_chuyen.da_qua_phan_noi_dung and any(tu in text_raw for tu in TU_KHOA_PHAN_NOI_DUNG):
+            return False
+        return True
+
+    def _dem_doan_van_thuan(self, p):
+        # Đếm đoạn văn có nội dung như xu_ly_doan_van, gọi đúng lúc đoạn thuần được render
+        if p._p.text.strip():
+            self.bo_chuyen.dem_paragraph_thuc += 1
+
+    def _xu_ly_doan_van_thuan(self, p):
+        # Đường tắt cho đoạn văn thuần, cùng kết quả với xu_ly_doan_van(p, che_do_inline=True)
+        # None → cần xử lý đầy đủ
+        if not self._la_doan_van_thuan(p):
+            return None
+        self._dem_doan_van_thuan(p)
+        noi_dung = "".join(self.bo_chuyen.xu_ly_run_thuong(Run(r, p)) for r in p._p.r_lst)
+        return noi_dung if noi_dung.strip() else ""
+
     def la_bang_cong_thuc(self, bang: Table) -> bool:
         # Phát hiện bảng công thức toán: 2 cột, cột cuối là số thứ tự (1), (2)...
         try:
-            if len(bang.columns) != 2:
+            dac_trung = self.lay_dac_trung_bang(bang)
+            if dac_trung is None or dac_trung['so_cot'] != 2:
                 return False
 
             dem_so_thu_tu = 0
-            for hang in bang.rows:
-                if len(hang.cells) >= 2:
-                    cell_cuoi = hang.cells[-1].text.strip()
-                    if re.match(r'^\(\d+\)$', cell_cuoi):
-                        dem_so_thu_tu += 1
+            for hang in dac_trung['hang']:
+                if len(hang) >= 2 and hang[-1]['so_thu_tu']:
+                    dem_so_thu_tu += 1
 
-            if len(bang.rows) > 0 and dem_so_thu_tu / len(bang.rows) >= 0.5:
+            if dac_trung['so_hang'] > 0 and dem_so_thu_tu / dac_trung['so_hang'] >= 0.5:
                 return True
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 319: {e}')
@@ -364,64 +486,20 @@ class BoXuLyBang:
                 if not omath_list:
                     objects = para._element.findall(f'.//{{{W_NAMESPACE}}}object')
                     for obj in objects:
-                        ole = obj.find(f'.//{{{OLE_NAMESPACE}}}OLEObject')
-                        if ole is not None:
-                            ole_rid = ole.get(f'{{{R_NAMESPACE}}}id')
-                            if ole_rid:
-                                ole_part = self.bo_chuyen.tai_lieu.part.related_parts.get(ole_rid)
-                                if ole_part:
-                                    try:
-                                        latex_from_mtef = ole_equation_to_latex(ole_part.blob)
-                                        if latex_from_mtef.strip():
-                                            cong_thuc_parts.append(latex_from_mtef)
-                                            continue
-                                    except Exception as e:
-                                        print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 369: {e}')
-                                        pass
-
-                            imagedata = obj.find(f'.//{{{VML_NAMESPACE}}}imagedata')
-                            if imagedata is not None:
-                                rid = imagedata.get(f'{{{R_NAMESPACE}}}id')
-                                if rid:
-                                    part = self.bo_chuyen.tai_lieu.part.related_parts.get(rid)
-                                    if part:
-                                        self.bo_chuyen.dem_anh += 1
-                                        content_type = getattr(part, 'content_type', '')
-                                        ext = 'png'
-                                        if 'wmf' in content_type:
-                                            ext = 'wmf'
-                                        elif 'emf' in content_type:
-                                            ext = 'emf'
-                                        elif 'jpeg' in content_type:
-                                            ext = 'jpg'
-
-                                        ten_anh_goc = f'formula_{self.bo_chuyen.dem_anh}.{ext}'
-                                        if not os.path.exists(self.bo_chuyen.thu_muc_anh):
-                                            os.makedirs(self.bo_chuyen.thu_muc_anh, exist_ok=True)
-
-                                        duong_dan_anh = os.path.join(self.bo_chuyen.thu_muc_anh, ten_anh_goc)
-                                        with open(duong_dan_anh, 'wb') as f:
-                                            f.write(part.blob)
-
-                                        ten_anh = ten_anh_goc
-                                        if ext in ('wmf', 'emf'):
-                                            try:
-                                                from PIL import Image
-                                                img = Image.open(duong_dan_anh)
-                                                ten_anh = f'formula_{self.bo_chuyen.dem_anh}.png'
-                                                duong_dan_png = os.path.join(self.bo_chuyen.thu_muc_anh, ten_anh)
-                                                new_size = (img.size[0] * 3, img.size[1] * 3)
-                                                img_resized = img.resize(new_size, Image.LANCZOS)
-                                                img_resized.save(duong_dan_png)
-                                                os.remove(duong_dan_anh)
-                                            except Exception as e:
-                                                print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 407: {e}')
-                                                pass
-
-                                        ten_thu_muc = os.path.basename(self.bo_chuyen.thu_muc_anh)
-                                        cong_thuc_parts.append(
-                                            rf'\\includegraphics[height=1.5em]{{{ten_thu_muc}/{ten_anh}}}'
-                                        )
+                        try:
+                            latex_from_mtef = self.bo_chuyen.lay_latex_ole(obj)
+                            if latex_from_mtef.strip():
+                                cong_thuc_parts.append(latex_from_mtef)
+                                continue
+                        except Exception as e:
+                            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 369: {e}')
+
+                        # Ảnh được chuyển PNG song song, đường dẫn điền lúc ghép kết quả
+                        duong_dan = self.bo_chuyen.lay_anh_ole(obj)
+                        if duong_dan:
+                            cong_thuc_parts.append(
+                                rf'\includegraphics[height=1.5em]{{{duong_dan}}}'
+                            )
 
                 if not omath_list and not cong_thuc_parts:
                     text = para.text.strip()
@@ -472,6 +550,10 @@ class BoXuLyBang:
                 for para in cell.paragraphs:
                     for run in para.runs:
                         blips = run._element.findall(f'.//{{{A_NAMESPACE}}}blip')
+                        if not blips:
+                            continue
+                        # Kích thước hiển thị (EMU) quyết định độ phân giải ghi ra
+                        kich_thuoc = self.bo_chuyen.lay_kich_thuoc_anh(run._element)
                         for blip in blips:
                             embed = blip.get(f'{{{REL_NAMESPACE}}}embed')
                             if not embed:
@@ -480,20 +562,9 @@ class BoXuLyBang:
                             if not part:
                                 continue
 
-                            self.bo_chuyen.dem_anh += 1
-                            content_type = getattr(part, 'content_type', '')
-                            ext = 'png'
-                            if 'jpeg' in content_type:
-                                ext = 'jpg'
-
-                            ten_anh = f'hinh_{self.bo_chuyen.dem_anh}.{ext}'
-                            if not os.path.exists(self.bo_chuyen.thu_muc_anh):
-                                os.makedirs(self.bo_chuyen.thu_muc_anh, exist_ok=True)
-
-                            duong_dan_anh = os.path.join(self.bo_chuyen.thu_muc_anh, ten_anh)
-                            with open(duong_dan_anh, 'wb') as f:
-                                f.write(part.blob)
-
+                            # Ảnh trùng nội dung (cùng SHA-1) dùng chung một file
+                            ten_anh, _, _ = self.bo_chuyen.luu_anh_theo_noi_dung(part, kich_thuoc_emu=kich_thuoc)
+                            self.bo_chuyen.dem_tham_chieu_anh += 1
                             danh_sach_anh.append(ten_anh)
         return danh_sach_anh
 
@@ -517,130 +588,74 @@ class BoXuLyBang:
             pass
         return danh_sach
 
-    def _lay_gridspan(self, tc) -> int:
-        # Lấy colspan từ w:gridSpan
-        try:
-            tcPr = tc.tcPr
-            if tcPr is None:
-                return 1
-            gridSpan = tcPr.gridSpan
-            if gridSpan is None:
-                return 1
-            val = gridSpan.get(qn('w:val'))
-            if val is None:
-                return 1
-            return max(1, int(val))
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 519: {e}')
-            return 1
-
-    def _lay_vmerge(self, tc):
-        # Lấy trạng thái vMerge: None / 'restart' / 'continue'
-        try:
-            tcPr = tc.tcPr
-            if tcPr is None:
-                return None
-            vMerge = tcPr.vMerge
-            if vMerge is None:
-                return None
-            val = vMerge.get(qn('w:val'))
-            if val is None:
-                return 'continue'
-            return str(val)
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 535: {e}')
-            return None
-
-    def _xay_dung_luoi_o(self, bang: Table):
-        # Xây dựng ma trận cell theo vị trí thực để xử lý rowspan/colspan
-        tbl = bang._tbl
-        tr_list = list(tbl.tr_lst)
-
-        # Ước lượng số cột theo tblGrid, fallback theo số tc lớn nhất
-        so_cot = 0
-        try:
-            grid_cols = tbl.tblGrid.gridCol_lst
-            so_cot = len(grid_cols)
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 548: {e}')
-            so_cot = 0
-
-        if so_cot <= 0:
-            for tr in tr_list:
-                so_cot = max(so_cot, len(list(tr.tc_lst)))
-
-        luoi = [[None for _ in range(so_cot)] for _ in range(len(tr_list))]
-        meta = {}
-
-        for r, tr in enumerate(tr_list):
-            c = 0
-            for tc in list(tr.tc_lst):
-                while c < so_cot and luoi[r][c] is not None:
-                    c += 1
-                if c >= so_cot:
-                    break
-
-                colspan = self._lay_gridspan(tc)
-                vmerge = self._lay_vmerge(tc)
-
-                cell_id = id(tc)
-                if vmerge in ('continue', 'cont') and r > 0 and luoi[r - 1][c] is not None:
-                    cell_id = meta.get((r - 1, c), {}).get('id', cell_id)
-
-                meta[(r, c)] = {
-                    'id': cell_id,
-                    'tc': tc,
-                    'colspan': colspan,
-                    'vmerge': vmerge,
-                    'start': not (vmerge in ('continue', 'cont')),
-                }
-
-                for k in range(colspan):
-                    if c + k < so_cot:
-                        luoi[r][c + k] = cell_id
-                        if (r, c + k) not in meta:
-                            meta[(r, c + k)] = meta[(r, c)]
-
-                c += colspan
-
-        # Tính rowspan cho các cell start
-        rowspan_map = {}
-        for (r, c), info in list(meta.items()):
-            if not info.get('start'):
-                continue
-            if meta.get((r, c)) != info:
-                continue
-
-            cell_id = info['id']
-            rowspan = 1
-            rr = r + 1
-            while rr < len(tr_list):
-                info_down = meta.get((rr, c))
-                if not info_down:
-                    break
-                if info_down.get('id') != cell_id:
-                    break
-                if info_down.get('start'):
-                    break
-                rowspan += 1
-                rr += 1
-            rowspan_map[cell_id] = max(rowspan_map.get(cell_id, 1), rowspan)
-
-        return luoi, meta, rowspan_map, so_cot, len(tr_list)
-
-    def _render_tabular_merge(self, bang: Table) -> str:
-        # Render bảng dữ liệu sang tabular có hỗ trợ \multirow/\multicolumn
-        luoi, meta, rowspan_map, so_cot, so_hang = self._xay_dung_luoi_o(bang)
-
+    @staticmethod
+    def _dinh_dang_cot(so_cot: int):
         # Phân bố độ rộng cột theo tỉ lệ \linewidth để đảm bảo không bị tràn trang (hỗ trợ two-column)
         if so_cot > 0:
             width_frac = 0.98 / so_cot
         else:
             width_frac = 0.15
-        
+
         # Bỏ kẻ sọc dọc '|' theo chuẩn booktabs
         # Sửa lại: Dùng đường kẻ dọc và ngang tiêu chuẩn (giống Word)
         cot = '|' + '|'.join([f"p{{{width_frac:.3f}\\linewidth}}" for _ in range(so_cot)]) + '|'
+        return cot, width_frac
+
+    def _render_dong_merge(self, cac_o: list, so_cot: int, width_frac: float) -> str:
+        # Render một dòng: cac_o = [(c, cell, colspan, rowspan), ...] các ô mang nội dung theo thứ tự cột
+        cells_out = []
+        c = 0
+        for c_bat_dau, cell, colspan, rowspan in cac_o:
+            # Vị trí trống / ô vMerge continue
+            while c < c_bat_dau:
+                cells_out.append('')
+                c += 1
+
+            noi_dung = self.xu_ly_doan_van_trong_cell(cell).strip()
+
+            token = noi_dung
+
+            if rowspan > 1:
+                token = rf"\multirow{{{rowspan}}}{{*}}{{{token}}}"
+
+            if colspan > 1:
+                mc_width = colspan * width_frac
+                token = rf"\multicolumn{{{colspan}}}{{p{{{mc_width:.3f}\linewidth}}}}{{{token}}}"
+
+            cells_out.append(token)
+            # Skip các cột đã bị gộp bởi multicolumn
+            c += colspan
+        while c < so_cot:
+            cells_out.append('')
+            c += 1
+
+        # Loại bỏ trailing empty cells do skip colspan
+        while cells_out and cells_out[-1] == '' and len(cells_out) > 1:
+            cells_out.pop()
+        # Đảm bảo đủ số cột (nếu thiếu thì thêm empty)
+        while len(cells_out) < so_cot:
+            cells_out.append('')
+
+        # Build dòng chỉ với cells thực sự
+        dong_filtered = []
+        skip = 0
+        for i, cell_str in enumerate(cells_out):
+            if skip > 0:
+                skip -= 1
+                continue
+            dong_filtered.append(cell_str)
+            # Nếu cell này là multicolumn, skip (colspan-1) cells tiếp theo
+            mc_match = re.match(r'\\multicolumn\{(\d+)\}', cell_str)
+            if mc_match:
+                skip = int(mc_match.group(1)) - 1
+
+        return "    " + " & ".join(dong_filtered) + r" \\" + "\n"
+
+    def _render_tabular_merge(self, bang: Table) -> str:
+        # Render bảng dữ liệu sang tabular có hỗ trợ \multirow/\multicolumn
+        luoi = LuoiBang(bang)
+        so_cot, so_hang = luoi.so_cot, luoi.so_hang
+        cot, width_frac = self._dinh_dang_cot(so_cot)
         vi_tri = "[H]" if self.bo_chuyen.mode == 'demo' else "[htbp]"
 
         latex = rf"\begin{{table}}{vi_tri}" + "\n"
@@ -651,79 +666,7 @@ class BoXuLyBang:
         latex += r"  \hline" + "\n"
 
         for r in range(so_hang):
-            cells_out = []
-            c = 0
-            while c < so_cot:
-                info = meta.get((r, c))
-                if not info:
-                    cells_out.append('')
-                    c += 1
-                    continue
-
-                if not info.get('start'):
-                    cells_out.append('')
-                    c += 1
-                    continue
-
-                if meta.get((r, c)) != info:
-                    cells_out.append('')
-                    c += 1
-                    continue
-
-                colspan = int(info.get('colspan') or 1)
-                cell_id = info['id']
-                rowspan = int(rowspan_map.get(cell_id, 1))
-
-                # Lấy text cell qua python-docx bằng mapping vị trí
-                try:
-                    cell_obj = bang.rows[r].cells[0]
-                    for candidate in bang.rows[r].cells:
-                        if id(candidate._tc) == id(info['tc']):
-                            cell_obj = candidate
-                            break
-                except Exception as e:
-                    print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_bang.py dòng 667: {e}')
-                    cell_obj = None
-
-                noi_dung = ""
-                if cell_obj is not None:
-                    noi_dung = self.xu_ly_doan_van_trong_cell(cell_obj)
-                noi_dung = noi_dung.strip()
-
-                token = noi_dung
-
-                if rowspan > 1:
-                    token = rf"\multirow{{{rowspan}}}{{*}}{{{token}}}"
-
-                if colspan > 1:
-                    mc_width = colspan * width_frac
-                    token = rf"\multicolumn{{{colspan}}}{{p{{{mc_width:.3f}\linewidth}}}}{{{token}}}"
-
-                cells_out.append(token)
-                # Skip các cột đã bị gộp bởi multicolumn
-                c += colspan
-
-            # Loại bỏ trailing empty cells do skip colspan
-            while cells_out and cells_out[-1] == '' and len(cells_out) > 1:
-                cells_out.pop()
-            # Đảm bảo đủ số cột (nếu thiếu thì thêm empty)
-            while len(cells_out) < so_cot:
-                cells_out.append('')
-            
-            # Build dòng chỉ với cells thực sự
-            dong_filtered = []
-            skip = 0
-            for i, cell_str in enumerate(cells_out):
-                if skip > 0:
-                    skip -= 1
-                    continue
-                dong_filtered.append(cell_str)
-                # Nếu cell này là multicolumn, skip (colspan-1) cells tiếp theo
-                mc_match = re.match(r'\\multicolumn\{(\d+)\}', cell_str)
-                if mc_match:
-                    skip = int(mc_match.group(1)) - 1
-
-            latex += "    " + " & ".join(dong_filtered) + r" \\" + "\n"
+            latex += self._render_dong_merge(luoi.cac_o_dong(r), so_cot, width_frac)
             
             # Dùng \hline cho mỗi dòng để giống word
             latex += r"  \hline" + "\n"
@@ -736,6 +679,40 @@ class BoXuLyBang:
 
         return latex
 
+    def _render_longtable_merge(self, bang: Table) -> str:
+        # Bảng dữ liệu rất lớn (≥ SO_HANG_TOI_THIEU_LONGTABLE dòng): longtable ngắt qua nhiều trang thay cho
+        # float tabular, duyệt XML theo từng dòng (LuoiBangTheoDong) — không dựng lưới, mỗi dòng render
+        # một lần vào danh sách rồi nối một lần ở cuối
+        luoi = LuoiBangTheoDong(bang)
+        so_cot = luoi.so_cot
+        cot, width_frac = self._dinh_dang_cot(so_cot)
+
+        cac_dong = []
+        for cac_o in luoi:
+            cac_dong.append(self._render_dong_merge(cac_o, so_cot, width_frac))
+            cac_dong.append(r"  \hline" + "\n")
+
+        caption_bang = self.bo_chuyen.bat_caption_bang()
+        caption_final = caption_bang or ""
+
+        # Caption đặt ở đầu longtable; \endhead lặp \hline ở đầu mỗi trang tiếp theo
+        dau = rf"\begin{{longtable}}{{{cot}}}" + "\n"
+        dau += rf"  \caption{{{caption_final}}}"
+        dau += rf"\label{{tab:bang{self.bo_chuyen.dem_bang}}} \\" + "\n"
+        dau += r"  \hline" + "\n"
+        dau += r"\endfirsthead" + "\n"
+        dau += r"  \hline" + "\n"
+        dau += r"\endhead" + "\n"
+        cuoi = r"\end{longtable}" + "\n\n"
+
+        # longtable không chạy trong chế độ two-column → tạm chuyển sang một cột
+        if self.bo_chuyen.template_hai_cot:
+            dau = r"\onecolumn" + "\n" + dau
+            cuoi = cuoi.rstrip("\n") + "\n" + r"\twocolumn" + "\n\n"
+
+        self.bo_chuyen.so_longtable += 1
+        return dau + "".join(cac_dong) + cuoi
+
     def xu_ly_bang(self, bang: Table) -> str:
         # Phân loại và xử lý bảng: Metadata, Tiểu sử, hoặc bảng dữ liệu thường
         try:
@@ -770,6 +747,8 @@ class BoXuLyBang:
             self.bo_chuyen.so_bang_noi_dung += 1
             self.bo_chuyen.dem_bang += 1
 
+            if len(bang._tbl.tr_lst) >= SO_HANG_TOI_THIEU_LONGTABLE:
+                return self._render_longtable_merge(bang)
             return self._render_tabular_merge(bang)
         except Exception as e:
             print(f"Lỗi xử lý bảng: {e}")
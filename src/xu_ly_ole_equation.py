@@ -2,22 +2,18 @@
 #
 # OLE Equation Editor 3.0 dùng format MTEF v3 (MathType Equation Format)
 # Pipeline:
-#   1. Trích "Equation Native" stream từ OLE Compound File
-#   2. Parse MTEF binary → cây cú pháp
+#   1. Trích "Equation Native" stream từ OLE Compound File (đọc thẳng CFB, olefile chỉ là dự phòng)
+#   2. Parse MTEF binary → cây cú pháp (memoryview + stack tường minh, không đệ quy)
 #   3. Duyệt cây → sinh LaTeX
 #
 # Cách dùng:
 #   latex = ole_equation_to_latex(ole_binary_bytes)
+#   latex = mtef_sang_latex(extract_mtef_from_ole(ole_binary_bytes))   # khi cần mã băm MTEF ở giữa
 
 import struct
 import io
 import re
 
-try:
-    import olefile
-except ImportError:
-    olefile = None
-
 # HẰNG SỐ MTEF
 
 # Record types (lower 4 bits of tag byte in MTEF v3)
@@ -134,160 +130,153 @@ _LATEX_SPECIAL = {'%': r'\%', '&': r'\&', '#': r'\#', '_': r'\_', '$': r'\$'}
 
 # PARSER: MTEF Binary → Parse Tree
 
-class MTEFParser:
-    # Parser cho MTEF v3 binary (Equation Editor 3.0)
-
-    def __init__(self, data: bytes):
-        self.data = data
-        self.pos = 0
-        self.version = data[0]
-        self.platform = data[1]
-        self.product = data[2]
-        self.prod_ver = data[3]
-        self.prod_sub = data[4]
-        self.pos = 5
-
-    def _read_byte(self):
-        if self.pos >= len(self.data):
-            return None
-        b = self.data[self.pos]
-        self.pos += 1
-        return b
-
-    def _peek_byte(self):
-        if self.pos >= len(self.data):
-            return None
-        return self.data[self.pos]
-
-    def _read_uint16_le(self):
-        if self.pos + 1 >= len(self.data):
-            self.pos = len(self.data)
-            return 0
-        lo = self.data[self.pos]
-        hi = self.data[self.pos + 1]
-        self.pos += 2
-        return (hi << 8) | lo
-
-    def parse(self):
-        # Parse toàn bộ MTEF → danh sách record
-        records = []
-        while self.pos < len(self.data):
-            rec = self._parse_record()
-            if rec is None:
-                break
-            records.append(rec)
-        return records
-
-    def _parse_record(self):
-        if self.pos >= len(self.data):
-            return None
-        tag = self._read_byte()
-        if tag is None:
-            return None
-        rec_type = tag & 0x0F
-        options = (tag >> 4) & 0x0F
-
-        if rec_type == _END:
-            return ('END',)
-        elif rec_type == _LINE:
-            return self._parse_line(options)
-        elif rec_type == _CHAR:
-            return self._parse_char(options)
-        elif rec_type == _TMPL:
-            return self._parse_tmpl(options)
-        elif rec_type == _PILE:
-            return self._parse_pile(options)
-        elif rec_type == _MATRIX:
-            return self._parse_matrix(options)
-        elif rec_type == _EMBELL:
-            return self._parse_embell(options)
-        elif rec_type in (_FULL, _SUB, _SUB2, _SYM, _SUBSYM):
-            # Các record đánh dấu kích thước - không có dữ liệu phụ
-            return (['FULL', '', '', 'SIZE', '', 'SUB', 'SUB2', '', '', '', 'FULL', 'SUB', 'SUB2', 'SYM', 'SUBSYM'][rec_type],)
-        elif rec_type in (_RULER, _FONT_STYLE_DEF, _SIZE):
-            # Bỏ qua các record ít gặp
-            return ('SKIP',)
+# Parser: đọc thẳng trên memoryview (không copy),
+# unpack uint16 bằng struct dựng sẵn và duyệt bằng stack tường minh (không giới hạn độ sâu)
+
+_DOC_UINT16_LE = struct.Struct('<H').unpack_from
+# CHAR: typeface (1 byte) + mã ký tự (uint16) đọc một lần
+_DOC_CHAR = struct.Struct('<BH').unpack_from
+
+# Loại khung trên stack
+_KHUNG_GOC = 0     # danh sách record cấp cao nhất
+_KHUNG_LINE = 1    # con của LINE
+_KHUNG_SLOT = 2    # một slot của TMPL (trạng thái: [selector, variation, slots])
+_KHUNG_PILE = 3    # các dòng của PILE (trạng thái: halign)
+_KHUNG_CELL = 4    # một cell của MATRIX (trạng thái: [rows, cols, cells])
+
+_REC_KICH_THUOC = {_FULL: ('FULL',), _SUB: ('SUB',), _SUB2: ('SUB2',), _SYM: ('SYM',), _SUBSYM: ('SUBSYM',)}
+_REC_END = ('END',)
+_REC_SKIP = ('SKIP',)
+
+
+def _parse_mtef_nhanh(mtef_data) -> list:
+    du_lieu = memoryview(mtef_data)
+    n = len(du_lieu)
+    pos = 5
+    goc = []
+    # Khung hiện tại giữ ở biến cục bộ; stack chỉ chứa các khung cha
+    loai_khung, danh_sach, trang_thai = _KHUNG_GOC, goc, None
+    them = danh_sach.append
+    stack = []
+
+    while True:
+        if pos < n:
+            tag = du_lieu[pos]
+            pos += 1
+            rec_type = tag & 0x0F
+
+            if rec_type == _CHAR:
+                if pos + 3 <= n:
+                    typeface, char_code = _DOC_CHAR(du_lieu, pos)
+                    pos += 3
+                else:
+                    typeface = 0
+                    if pos < n:
+                        typeface = du_lieu[pos]
+                        pos += 1
+                    if pos + 1 < n:
+                        char_code = _DOC_UINT16_LE(du_lieu, pos)[0]
+                        pos += 2
+                    else:
+                        char_code = 0
+                        pos = n
+                them(('CHAR', (typeface or 0x81) - 128, char_code))
+                continue
+            if rec_type != _END or loai_khung == _KHUNG_GOC:
+                if rec_type == _LINE:
+                    stack.append((loai_khung, danh_sach, trang_thai))
+                    loai_khung, danh_sach, trang_thai = _KHUNG_LINE, [], None
+                    them = danh_sach.append
+                elif rec_type == _TMPL:
+                    selector = variation = 0
+                    if pos < n:
+                        selector = du_lieu[pos]
+                        pos += 1
+                    if pos < n:
+                        variation = du_lieu[pos]
+                        pos += 1
+                    if variation & 0x80:
+                        var2 = 0
+                        if pos < n:
+                            var2 = du_lieu[pos]
+                            pos += 1
+                        variation = (variation & 0x7F) | (var2 << 7)
+                    if pos < n:
+                        stack.append((loai_khung, danh_sach, trang_thai))
+                        loai_khung, danh_sach, trang_thai = _KHUNG_SLOT, [], [selector, variation, []]
+                        them = danh_sach.append
+                    else:
+                        them(('TMPL', selector, variation, []))
+                elif rec_type == _END:
+                    # Chỉ tới đây ở khung gốc: END cấp cao nhất vẫn được giữ trong danh sách
+                    them(_REC_END)
+                elif rec_type in _REC_KICH_THUOC:
+                    them(_REC_KICH_THUOC[rec_type])
+                elif rec_type == _PILE:
+                    halign = 0
+                    if pos < n:
+                        halign = du_lieu[pos]
+                        pos += 1
+                    stack.append((loai_khung, danh_sach, trang_thai))
+                    loai_khung, danh_sach, trang_thai = _KHUNG_PILE, [], halign
+                    them = danh_sach.append
+                elif rec_type == _MATRIX:
+                    so_hang = so_cot = 1
+                    if pos < n:
+                        so_hang = du_lieu[pos] or 1
+                        pos += 1
+                    if pos < n:
+                        so_cot = du_lieu[pos] or 1
+                        pos += 1
+                    # Bỏ qua alignment của từng cột
+                    pos = min(n, pos + so_cot)
+                    if pos < n:
+                        stack.append((loai_khung, danh_sach, trang_thai))
+                        loai_khung, danh_sach, trang_thai = _KHUNG_CELL, [], [so_hang, so_cot, []]
+                        them = danh_sach.append
+                    else:
+                        them(('MATRIX', so_hang, so_cot, [[] for _ in range(so_hang * so_cot)]))
+                elif rec_type == _EMBELL:
+                    embell_type = 0
+                    if pos < n:
+                        embell_type = du_lieu[pos]
+                        pos += 1
+                    them(('EMBELL', embell_type))
+                elif rec_type in (_RULER, _FONT_STYLE_DEF, _SIZE):
+                    them(_REC_SKIP)
+                else:
+                    them(('UNKNOWN', tag))
+                continue
+        elif loai_khung == _KHUNG_GOC:
+            return goc
+
+        # Gặp END hoặc hết dữ liệu → đóng khung hiện tại, gắn record vào khung cha
+        if loai_khung == _KHUNG_LINE:
+            rec = ('LINE', danh_sach)
+        elif loai_khung == _KHUNG_PILE:
+            rec = ('PILE', trang_thai, danh_sach)
+        elif loai_khung == _KHUNG_SLOT:
+            slots = trang_thai[2]
+            slots.append(danh_sach)
+            # Đọc slot tiếp khi còn chỗ (tối đa 8) và byte kế là LINE/END
+            if len(slots) < 8 and pos < n and (du_lieu[pos] & 0x0F) in (_END, _LINE):
+                danh_sach = []
+                them = danh_sach.append
+                continue
+            rec = ('TMPL', trang_thai[0], trang_thai[1], slots)
         else:
-            return ('UNKNOWN', tag)
-
-    def _parse_line(self, options):
-        children = []
-        while self.pos < len(self.data):
-            rec = self._parse_record()
-            if rec is None or rec[0] == 'END':
-                break
-            children.append(rec)
-        return ('LINE', children)
-
-    def _parse_char(self, options):
-        typeface = self._read_byte() or 0x81
-        char_code = self._read_uint16_le()
-        font_style = typeface - 128
-        return ('CHAR', font_style, char_code)
-
-    def _parse_tmpl(self, options):
-        selector = self._read_byte() or 0
-        variation = self._read_byte() or 0
-        # Variation 2 bytes nếu bit 7 set (chủ yếu MTEF v5)
-        if variation & 0x80:
-            var2 = self._read_byte() or 0
-            variation = (variation & 0x7F) | (var2 << 7)
-
-        # Đọc các slot (mỗi slot kết thúc bằng END)
-        # Đọc tham lam, dừng khi byte tiếp theo không phải LINE/END
-        slots = []
-        for _ in range(8):  # tối đa 8 slot
-            if self.pos >= len(self.data):
-                break
-            slot = self._parse_slot()
-            slots.append(slot)
-            # Kiểm tra byte tiếp: nếu không phải END/LINE → dừng
-            nxt = self._peek_byte()
-            if nxt is None:
-                break
-            nxt_type = nxt & 0x0F
-            if nxt_type not in (_END, _LINE):
-                break
-
-        return ('TMPL', selector, variation, slots)
-
-    def _parse_slot(self):
-        # Đọc danh sách record cho đến END
-        records = []
-        while self.pos < len(self.data):
-            rec = self._parse_record()
-            if rec is None or rec[0] == 'END':
-                break
-            records.append(rec)
-        return records
-
-    def _parse_pile(self, options):
-        halign = self._read_byte() or 0
-        lines = []
-        while self.pos < len(self.data):
-            rec = self._parse_record()
-            if rec is None or rec[0] == 'END':
-                break
-            lines.append(rec)
-        return ('PILE', halign, lines)
-
-    def _parse_matrix(self, options):
-        rows = self._read_byte() or 1
-        cols = self._read_byte() or 1
-        # Đọc alignment cho mỗi cột
-        col_aligns = []
-        for _ in range(cols):
-            col_aligns.append(self._read_byte() or 0)
-        # Đọc rows*cols cell (mỗi cell kết thúc bằng END)
-        cells = []
-        for _ in range(rows * cols):
-            cell = self._parse_slot()
-            cells.append(cell)
-        return ('MATRIX', rows, cols, cells)
-
-    def _parse_embell(self, options):
-        embell_type = self._read_byte() or 0
-        return ('EMBELL', embell_type)
+            so_hang, so_cot, cells = trang_thai
+            cells.append(danh_sach)
+            con_thieu = so_hang * so_cot - len(cells)
+            if con_thieu > 0 and pos < n:
+                danh_sach = []
+                them = danh_sach.append
+                continue
+            cells.extend([] for _ in range(con_thieu))
+            rec = ('MATRIX', so_hang, so_cot, cells)
+        loai_khung, danh_sach, trang_thai = stack.pop()
+        them = danh_sach.append
+        them(rec)
 
 # CONVERTER: Parse Tree → LaTeX String
 
@@ -747,38 +736,198 @@ def _matrix_to_latex(rows, cols, cells):
         result_rows.append(' & '.join(row_parts))
     return r'\begin{matrix} ' + r' \\ '.join(result_rows) + r' \end{matrix}'
 
-# HÀM CHÍNH: OLE Binary → LaTeX
-
-def extract_mtef_from_ole(ole_binary: bytes) -> bytes | None:
-    # Trích xuất MTEF data từ OLE Compound File
-    # ole_binary = nội dung file oleObjectN.bin từ DOCX
-    if olefile is None:
+# ĐỌC COMPOUND FILE (CFB) TỐI THIỂU
+# Chỉ đi đủ xa để lấy một stream con trực tiếp của Root Entry ("Equation Native"):
+# header → các sector FAT (qua DIFAT) → chuỗi sector thư mục → cây tên con của root → chuỗi sector của stream.
+# Không dựng lại toàn bộ FAT/thư mục như olefile; stream nằm liền một khoảng được trả về dạng memoryview (không copy).
+# File lạ / hỏng → ValueError để extract_mtef_from_ole chuyển sang olefile
+
+_CFB_CHU_KY = b'\xD0\xCF\x11\xE0\xA1\xB1\x1A\xE1'
+# Header 76 byte đầu: chữ ký, clsid, minor, major, byte order, sector shift, mini shift, reserved,
+# số sector thư mục, số sector FAT, sector thư mục đầu, transaction, ngưỡng mini stream,
+# sector mini FAT đầu, số sector mini FAT, sector DIFAT đầu, số sector DIFAT (109 mục DIFAT theo sau)
+_CFB_HEADER = struct.Struct('<8s16sHHHHH6sIIIIIIIII')
+# Mục thư mục (128 byte): độ dài tên (0x40), loại (0x42), trái/phải/con (0x44), sector đầu + kích thước (0x74)
+_CFB_MUC_CAY = struct.Struct('<HBBIII')
+_CFB_MUC_STREAM = struct.Struct('<IQ')
+_CFB_UINT32 = struct.Struct('<I').unpack_from
+_CFB_SECTOR_MAX = 0xFFFFFFFA   # sector id hợp lệ < MAXREGSECT; lớn hơn là ENDOFCHAIN / FREESECT / ...
+_CFB_KHONG_CO = 0xFFFFFFFF     # NOSTREAM trong cây thư mục
+_CFB_NGUONG_MINI = 4096
+_CFB_STREAM = 2
+
+
+def _doc_stream_cfb(ole_binary, ten_stream: str):
+    # Trả về nội dung stream con của root tên ten_stream (không phân biệt hoa thường như olefile),
+    # None nếu không có stream đó; ValueError nếu cấu trúc file không đúng chuẩn
+    buf = memoryview(ole_binary)
+    n = len(buf)
+    if n < 512 or buf[:8] != _CFB_CHU_KY:
+        raise ValueError('không phải compound file')
+    (_, _, _, major, _, sector_shift, mini_shift, _, _, so_sector_fat, sector_thu_muc, _,
+     nguong_mini, sector_minifat, _, sector_difat, so_sector_difat) = _CFB_HEADER.unpack_from(buf, 0)
+    if (major, sector_shift) not in ((3, 9), (4, 12)) or mini_shift != 6 or nguong_mini != _CFB_NGUONG_MINI:
+        raise ValueError('header compound file không chuẩn')
+
+    co = 1 << sector_shift
+    muc_moi_sector = co >> 2
+    so_sector = (n - 1) // co      # số sector dữ liệu (sector cuối có thể thiếu byte)
+
+    def vi_tri(sid: int, do_dai: int = co) -> int:
+        if sid >= so_sector:
+            raise ValueError(f'sector {sid:#x} ngoài file')
+        dau = (sid + 1) << sector_shift
+        if dau + do_dai > n:
+            raise ValueError(f'sector {sid:#x} bị cắt cụt')
+        return dau
+
+    # Danh sách sector FAT: 109 mục trong header, phần còn lại theo chuỗi DIFAT
+    sector_fat = [_CFB_UINT32(buf, 0x4C + 4 * i)[0] for i in range(min(so_sector_fat, 109))]
+    sid = sector_difat
+    for _ in range(so_sector_difat):
+        if len(sector_fat) >= so_sector_fat or sid >= _CFB_SECTOR_MAX:
+            break
+        dau = vi_tri(sid)
+        sector_fat.extend(_CFB_UINT32(buf, dau + 4 * i)[0] for i in range(muc_moi_sector - 1))
+        sid = _CFB_UINT32(buf, dau + co - 4)[0]
+    del sector_fat[so_sector_fat:]
+
+    def chuoi(sid: int, bang, gioi_han: int) -> list:
+        # Các sector id theo chuỗi bắt đầu từ sid; bang(sid) → sid kế tiếp
+        ket_qua = []
+        while sid < _CFB_SECTOR_MAX:
+            if len(ket_qua) >= gioi_han:
+                raise ValueError('chuỗi sector lặp vòng')
+            ket_qua.append(sid)
+            sid = bang(sid)
+        return ket_qua
+
+    def ke_tiep_fat(sid: int) -> int:
+        chi_so = sid // muc_moi_sector
+        if chi_so >= len(sector_fat):
+            raise ValueError(f'sector {sid:#x} ngoài FAT')
+        return _CFB_UINT32(buf, vi_tri(sector_fat[chi_so]) + 4 * (sid % muc_moi_sector))[0]
+
+    # Thư mục: mục i nằm ở sector thu_muc[i // (co/128)]
+    thu_muc = chuoi(sector_thu_muc, ke_tiep_fat, so_sector)
+    muc_moi_sector_tm = co >> 7
+
+    def muc(i: int) -> int:
+        if i >= len(thu_muc) * muc_moi_sector_tm:
+            raise ValueError(f'mục thư mục {i} ngoài chuỗi thư mục')
+        return vi_tri(thu_muc[i // muc_moi_sector_tm]) + ((i % muc_moi_sector_tm) << 7)
+
+    def kich_thuoc(dau: int):
+        sid, kt = _CFB_MUC_STREAM.unpack_from(buf, dau + 0x74)
+        return sid, (kt & 0xFFFFFFFF if major == 3 else kt)
+
+    # Duyệt cây đỏ-đen các con của root (chỉ trái/phải, không đi vào storage con)
+    ten_can_tim = ten_stream.lower()
+    tim_thay = None
+    da_tham = set()
+    cho_duyet = [_CFB_UINT32(buf, muc(0) + 0x4C)[0]]
+    while cho_duyet:
+        i = cho_duyet.pop()
+        if i == _CFB_KHONG_CO:
+            continue
+        if i in da_tham:
+            raise ValueError('cây thư mục lặp vòng')
+        da_tham.add(i)
+        dau = muc(i)
+        do_dai_ten, loai, _, trai, phai, _ = _CFB_MUC_CAY.unpack_from(buf, dau + 0x40)
+        if loai == _CFB_STREAM and 2 <= do_dai_ten <= 64:
+            ten = bytes(buf[dau:dau + do_dai_ten - 2]).decode('utf-16-le', 'replace')
+            if ten.lower() == ten_can_tim:
+                tim_thay = dau
+                break
+        cho_duyet.append(trai)
+        cho_duyet.append(phai)
+    if tim_thay is None:
         return None
 
+    sid_dau, kich_thuoc_stream = kich_thuoc(tim_thay)
+    if kich_thuoc_stream == 0:
+        return b''
+
+    # Các khoảng byte (vị trí, độ dài) của stream trong file
+    khoang = []
+    if kich_thuoc_stream < _CFB_NGUONG_MINI:
+        # Mini stream: sector 64 byte nằm trong stream của root, tra theo mini FAT
+        sector_mini_fat = chuoi(sector_minifat, ke_tiep_fat, so_sector)
+        sid_root, kt_root = kich_thuoc(muc(0))
+        sector_root = chuoi(sid_root, ke_tiep_fat, so_sector)
+        muc_mini = len(sector_mini_fat) * muc_moi_sector
+
+        def ke_tiep_mini(sid: int) -> int:
+            if sid >= muc_mini:
+                raise ValueError(f'mini sector {sid:#x} ngoài mini FAT')
+            return _CFB_UINT32(buf, vi_tri(sector_mini_fat[sid // muc_moi_sector]) + 4 * (sid % muc_moi_sector))[0]
+
+        for sid in chuoi(sid_dau, ke_tiep_mini, muc_mini):
+            lech = sid << 6
+            if lech + 64 > kt_root or (lech >> sector_shift) >= len(sector_root):
+                raise ValueError(f'mini sector {sid:#x} ngoài mini stream')
+            khoang.append((vi_tri(sector_root[lech >> sector_shift]) + (lech & (co - 1)), 64))
+    else:
+        khoang = [(vi_tri(sid, 0), co) for sid in chuoi(sid_dau, ke_tiep_fat, so_sector)]
+
+    # Gộp các khoảng liền nhau rồi cắt đúng kích thước stream
+    gop = []
+    con_thieu = kich_thuoc_stream
+    for dau, do_dai in khoang:
+        if con_thieu <= 0:
+            break
+        do_dai = min(do_dai, con_thieu, n - dau)
+        con_thieu -= do_dai
+        if gop and gop[-1][0] + gop[-1][1] == dau:
+            gop[-1][1] += do_dai
+        else:
+            gop.append([dau, do_dai])
+    if con_thieu > 0:
+        raise ValueError('stream ngắn hơn kích thước khai báo')
+    if len(gop) == 1:
+        dau, do_dai = gop[0]
+        return buf[dau:dau + do_dai]
+    return b''.join(buf[dau:dau + do_dai] for dau, do_dai in gop)
+
+
+def _doc_stream_olefile(ole_binary, ten_stream: str):
+    # Dự phòng cho file _doc_stream_cfb không đọc được; olefile chỉ import khi thật sự cần
+    try:
+        import olefile
+    except ImportError:
+        return None
     try:
         ole = olefile.OleFileIO(io.BytesIO(ole_binary))
-        if ole.exists('Equation Native'):
-            eq_data = ole.openstream('Equation Native').read()
-            if len(eq_data) < 28:
-                ole.close()
-                return None
-            # Header 28 bytes (cbHdr ở 4 byte đầu)
-            cb_hdr = struct.unpack_from('<I', eq_data, 0)[0]
-            mtef_data = eq_data[cb_hdr:]
+        try:
+            if ole.exists(ten_stream):
+                return ole.openstream(ten_stream).read()
+        finally:
             ole.close()
-            return mtef_data
-        ole.close()
     except Exception as e:
-        print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_ole_equation.py dòng 771: {e}')
-        pass
+        print(f'[Cảnh báo] Không đọc được OLE bằng olefile: {e}')
     return None
 
-def parse_mtef(mtef_data: bytes) -> list:
+# HÀM CHÍNH: OLE Binary → LaTeX
+
+def extract_mtef_from_ole(ole_binary: bytes) -> memoryview | None:
+    # Trích xuất MTEF data từ OLE Compound File
+    # ole_binary = nội dung file oleObjectN.bin từ DOCX
+    try:
+        eq_data = _doc_stream_cfb(ole_binary, 'Equation Native')
+    except (ValueError, struct.error):
+        eq_data = _doc_stream_olefile(ole_binary, 'Equation Native')
+    if eq_data is None or len(eq_data) < 28:
+        return None
+    # Header 28 bytes (cbHdr ở 4 byte đầu); phần MTEF là view trên stream (không copy)
+    cb_hdr = struct.unpack_from('<I', eq_data, 0)[0]
+    return memoryview(eq_data)[cb_hdr:]
+
+def parse_mtef(mtef_data) -> list:
     # Parse MTEF binary → danh sách record (parse tree)
     if not mtef_data or len(mtef_data) < 5:
         return []
-    parser = MTEFParser(mtef_data)
-    return parser.parse()
+    return _parse_mtef_nhanh(mtef_data)
 
 def mtef_tree_to_latex(tree: list) -> str:
     # Chuyển parse tree → LaTeX string
@@ -787,7 +936,10 @@ def mtef_tree_to_latex(tree: list) -> str:
 def ole_equation_to_latex(ole_binary: bytes) -> str:
     # Hàm chính: OLE binary → LaTeX math string
     # Trả về '' nếu không parse được
-    mtef_data = extract_mtef_from_ole(ole_binary)
+    return mtef_sang_latex(extract_mtef_from_ole(ole_binary))
+
+def mtef_sang_latex(mtef_data) -> str:
+    # MTEF (đã trích khỏi OLE) → LaTeX; tách riêng để bộ nhớ đệm theo mã băm MTEF gọi thẳng
     if not mtef_data:
         return ''
 
@@ -795,7 +947,12 @@ def ole_equation_to_latex(ole_binary: bytes) -> str:
     if not tree:
         return ''
 
-    latex = mtef_tree_to_latex(tree)
+    try:
+        latex = mtef_tree_to_latex(tree)
+    except RecursionError:
+        # Parser không giới hạn độ sâu nhưng bộ sinh LaTeX vẫn đệ quy → bỏ công thức lồng quá sâu
+        print('[Cảnh báo] Công thức OLE lồng quá sâu, không chuyển được sang LaTeX')
+        return ''
 
     # Dọn dẹp chuỗi kết quả
     # Bỏ khoảng trắng thừa
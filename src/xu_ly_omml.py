@@ -0,0 +1,359 @@
+# xu_ly_omml.py - Bộ chuyển OMML → LaTeX gốc (không cần XSLT / pandoc)
+#
+# - Mỗi node được duyệt đúng một lần, chỉ đọc con trực tiếp (m:num, m:den, m:e, m:sub, m:sup...)
+# - Bảng dispatch tag → handler thay cho chuỗi if/elif
+# - Duyệt hậu thứ tự bằng stack tường minh → không giới hạn độ sâu đệ quy
+#
+# Cách dùng:
+#   bo_omml = BoChuyenOMML()
+#   latex   = bo_omml.chuyen(omath_element)
+#   khoa    = ma_bam_chuan_omml(omath_element)    # khóa bộ nhớ đệm theo dạng chuẩn
+
+import re
+import hashlib
+
+from config import (
+    OMML_NAMESPACE, W_NAMESPACE,
+    OMML_CHAR_MAP, NARY_SYMBOL_MAP, DELIMITER_MAP,
+    ACCENT_MAP, FUNC_NAME_MAP,
+)
+
+_NS = f'{{{OMML_NAMESPACE}}}'
+_VAL = f'{_NS}val'
+
+# Dạng chuẩn để băm: bỏ định dạng thuần (font, màu, cỡ chữ) không ảnh hưởng LaTeX
+_BO_QUA_KHI_BAM = frozenset({f'{{{W_NAMESPACE}}}rPr', f'{_NS}ctrlPr'})
+# Trong m:rPr chỉ giữ thuộc tính mang nghĩa toán (kiểu chữ, script, văn bản thường)
+_RPR_TOAN = f'{_NS}rPr'
+_GIU_TRONG_RPR_TOAN = frozenset({f'{_NS}sty', f'{_NS}scr', f'{_NS}nor', f'{_NS}lit'})
+
+
+def _bien_dich_bang_ky_tu(ban_do: list):
+    # OMML_CHAR_MAP → (bảng str.translate, danh sách (regex, replacement) còn lại)
+    # Mẫu là một ký tự literal → vào bảng; replacement được khai triển sẵn bằng chính re.sub
+    # Gặp mẫu regex thật, hoặc kết quả chứa ký tự của mẫu khác (thay dây chuyền) → từ đó trở đi
+    # giữ vòng re.sub tuần tự để kết quả y hệt cách cũ
+    bang = {}
+    con_lai = []
+    ky_tu_mau = {m for m, _ in ban_do if len(m) == 1 and re.escape(m) == m}
+    for pattern, replacement in ban_do:
+        if not con_lai and pattern in ky_tu_mau:
+            gia_tri = re.sub(pattern, replacement, pattern)
+            if not ky_tu_mau.intersection(gia_tri):
+                bang.setdefault(ord(pattern), gia_tri)
+                continue
+        con_lai.append((re.compile(pattern), replacement))
+    return bang, con_lai
+
+
+_BANG_KY_TU_TOAN, _MAU_KY_TU_TOAN_CON_LAI = _bien_dich_bang_ky_tu(OMML_CHAR_MAP)
+
+
+def thay_ky_tu_unicode_toan(text: str) -> str:
+    # Thay thế các ký tự Unicode toán học thành LaTeX commands (một lượt str.translate)
+    text = text.translate(_BANG_KY_TU_TOAN)
+    for mau, replacement in _MAU_KY_TU_TOAN_CON_LAI:
+        text = mau.sub(replacement, text)
+    return text
+
+
+def ma_bam_chuan_omml(elem) -> str:
+    # SHA-1 của dạng chuẩn cây OMML, băm dần khi duyệt (không dựng chuỗi XML trung gian)
+    # - Tag/thuộc tính theo tên Clark {uri}local → không phụ thuộc prefix namespace
+    # - Thuộc tính sắp xếp theo tên; bỏ tail và khoảng trắng định dạng (giữ nguyên text của m:t)
+    # - Bỏ w:rPr, m:ctrlPr và phần không mang nghĩa toán của m:rPr
+    bam = hashlib.sha1()
+    stack = [elem]
+    while stack:
+        node = stack.pop()
+        if node is None:
+            bam.update(b'\x01')
+            continue
+        tag = node.tag
+        if not isinstance(tag, str) or tag in _BO_QUA_KHI_BAM:
+            continue
+        if tag == _RPR_TOAN:
+            con = [c for c in node if c.tag in _GIU_TRONG_RPR_TOAN]
+            if not con:
+                continue
+        else:
+            con = list(node)
+
+        bam.update(b'\x00' + tag.encode('utf-8'))
+        if len(node.attrib):
+            for ten in sorted(node.attrib):
+                bam.update(b'\x02' + ten.encode('utf-8') + b'=' + node.attrib[ten].encode('utf-8'))
+        text = node.text
+        if text and (tag == _NS + 't' or text.strip()):
+            bam.update(b'\x03' + text.encode('utf-8'))
+
+        stack.append(None)
+        stack.extend(reversed(con))
+    return bam.hexdigest()
+
+
+def _ten_tag(elem) -> str:
+    # Tên cục bộ của tag (bỏ namespace); comment / processing instruction → ''
+    tag = elem.tag
+    if not isinstance(tag, str):
+        return ''
+    return tag.rsplit('}', 1)[-1]
+
+
+def _con_truc_tiep(elem, ten: str):
+    # Con trực tiếp đầu tiên có tag m:<ten> (không quét cây con)
+    return elem.find(_NS + ten)
+
+
+def _ghep(ket_qua: list) -> str:
+    return ''.join(ket_qua)
+
+
+class _Khung:
+    # Một node đang chờ kết quả của các con: duyệt lần lượt `con`, rồi gọi `ghep` với kết quả
+    __slots__ = ('con', 'vi_tri', 'ket_qua', 'ghep')
+
+    def __init__(self, con, ghep=_ghep):
+        self.con = con
+        self.vi_tri = 0
+        self.ket_qua = []
+        self.ghep = ghep
+
+
+class BoChuyenOMML:
+    # Chuyển <m:oMath> (hoặc bất kỳ sub-tree OMML nào) → chuỗi LaTeX
+
+    def __init__(self):
+        self._bang_xu_ly = {
+            'f': self._xu_ly_f,
+            'rad': self._xu_ly_rad,
+            'sSub': self._xu_ly_ssub,
+            'sSup': self._xu_ly_ssup,
+            'sSubSup': self._xu_ly_ssubsup,
+            'nary': self._xu_ly_nary,
+            'd': self._xu_ly_d,
+            'func': self._xu_ly_func,
+            'limLow': self._xu_ly_lim_low,
+            'limUpp': self._xu_ly_lim_upp,
+            'acc': self._xu_ly_acc,
+            'bar': self._xu_ly_bar,
+            'eqArr': self._xu_ly_eq_arr,
+            'm': self._xu_ly_matrix,
+            'box': self._xu_ly_box,
+            'borderBox': self._xu_ly_border_box,
+            'r': self._xu_ly_r,
+            't': self._xu_ly_t,
+        }
+
+    # API CHÍNH
+
+    def chuyen(self, elem) -> str:
+        # Duyệt hậu thứ tự bằng stack: node lá trả chuỗi ngay, node có con trả _Khung
+        ket_qua = self._mo_node(elem)
+        if isinstance(ket_qua, str):
+            return ket_qua
+
+        stack = [ket_qua]
+        while True:
+            khung = stack[-1]
+            if khung.vi_tri < len(khung.con):
+                con = khung.con[khung.vi_tri]
+                khung.vi_tri += 1
+                if con is None:
+                    # Thành phần tùy chọn vắng mặt (vd. sub của sSub) → chuỗi rỗng
+                    khung.ket_qua.append('')
+                    continue
+                ket_qua = self._mo_node(con)
+                if isinstance(ket_qua, str):
+                    khung.ket_qua.append(ket_qua)
+                else:
+                    stack.append(ket_qua)
+                continue
+
+            stack.pop()
+            latex = khung.ghep(khung.ket_qua)
+            if not stack:
+                return latex
+            stack[-1].ket_qua.append(latex)
+
+    def _mo_node(self, elem):
+        ten = _ten_tag(elem)
+        if not ten:
+            return ''
+        xu_ly = self._bang_xu_ly.get(ten)
+        if xu_ly is not None:
+            ket_qua = xu_ly(elem)
+            if ket_qua is not None:
+                return ket_qua
+        # Node không có handler (hoặc thiếu thành phần bắt buộc): ghép LaTeX của các con
+        return _Khung(list(elem))
+
+    # HANDLER (trả về str, _Khung, hoặc None → xử lý như node thường)
+
+    def _xu_ly_f(self, elem):
+        num = _con_truc_tiep(elem, 'num')
+        den = _con_truc_tiep(elem, 'den')
+        if num is None or den is None:
+            return None
+        return _Khung([num, den], lambda k: rf'\frac{{{k[0]}}}{{{k[1]}}}')
+
+    def _xu_ly_rad(self, elem):
+        e = _con_truc_tiep(elem, 'e')
+        if e is None:
+            return None
+
+        def ghep(k):
+            e_text, deg_text = k
+            if deg_text.strip():
+                return rf'\sqrt[{deg_text}]{{{e_text}}}'
+            return rf'\sqrt{{{e_text}}}'
+        return _Khung([e, _con_truc_tiep(elem, 'deg')], ghep)
+
+    def _xu_ly_ssub(self, elem):
+        base = _con_truc_tiep(elem, 'e')
+        if base is None:
+            return None
+        return _Khung([base, _con_truc_tiep(elem, 'sub')], lambda k: rf'{k[0]}_{{{k[1]}}}')
+
+    def _xu_ly_ssup(self, elem):
+        base = _con_truc_tiep(elem, 'e')
+        if base is None:
+            return None
+        return _Khung([base, _con_truc_tiep(elem, 'sup')], lambda k: rf'{k[0]}^{{{k[1]}}}')
+
+    def _xu_ly_ssubsup(self, elem):
+        base = _con_truc_tiep(elem, 'e')
+        if base is None:
+            return None
+        return _Khung(
+            [base, _con_truc_tiep(elem, 'sub'), _con_truc_tiep(elem, 'sup')],
+            lambda k: rf'{k[0]}_{{{k[1]}}}^{{{k[2]}}}',
+        )
+
+    def _xu_ly_nary(self, elem):
+        symbol = '\\sum'
+        nary_pr = _con_truc_tiep(elem, 'naryPr')
+        chr_elem = _con_truc_tiep(nary_pr, 'chr') if nary_pr is not None else None
+        if chr_elem is not None:
+            symbol = NARY_SYMBOL_MAP.get(chr_elem.get(_VAL), '\\sum')
+
+        def ghep(k):
+            sub_text, sup_text, e_text = k
+            result = symbol
+            if sub_text:
+                result += f'_{{{sub_text}}}'
+            if sup_text:
+                result += f'^{{{sup_text}}}'
+            return result + f' {e_text}'
+        return _Khung(
+            [_con_truc_tiep(elem, 'sub'), _con_truc_tiep(elem, 'sup'), _con_truc_tiep(elem, 'e')],
+            ghep,
+        )
+
+    def _xu_ly_d(self, elem):
+        beg_chr = '('
+        end_chr = ')'
+        d_pr = _con_truc_tiep(elem, 'dPr')
+        if d_pr is not None:
+            beg_e = _con_truc_tiep(d_pr, 'begChr')
+            end_e = _con_truc_tiep(d_pr, 'endChr')
+            if beg_e is not None:
+                beg_chr = beg_e.get(_VAL, '(')
+            if end_e is not None:
+                end_chr = end_e.get(_VAL, ')')
+
+        beg_latex = DELIMITER_MAP.get(beg_chr, beg_chr)
+        end_latex = DELIMITER_MAP.get(end_chr, end_chr)
+        # Nội dung bên trong (có thể nhiều e)
+        return _Khung(
+            elem.findall(_NS + 'e'),
+            lambda k: rf'\left{beg_latex}{",".join(k)}\right{end_latex}',
+        )
+
+    def _xu_ly_func(self, elem):
+        def ghep(k):
+            func_name, e_text = k
+            latex_func = FUNC_NAME_MAP.get(func_name.strip(), rf'\operatorname{{{func_name}}}')
+            return f'{latex_func}{{{e_text}}}'
+        return _Khung([_con_truc_tiep(elem, 'fName'), _con_truc_tiep(elem, 'e')], ghep)
+
+    def _xu_ly_lim_low(self, elem):
+        return _Khung(
+            [_con_truc_tiep(elem, 'e'), _con_truc_tiep(elem, 'lim')],
+            lambda k: rf'\underset{{{k[1]}}}{{{k[0]}}}',
+        )
+
+    def _xu_ly_lim_upp(self, elem):
+        return _Khung(
+            [_con_truc_tiep(elem, 'e'), _con_truc_tiep(elem, 'lim')],
+            lambda k: rf'\overset{{{k[1]}}}{{{k[0]}}}',
+        )
+
+    def _xu_ly_acc(self, elem):
+        accent_char = '\u0302'  # default hat
+        acc_pr = _con_truc_tiep(elem, 'accPr')
+        if acc_pr is not None:
+            chr_el = _con_truc_tiep(acc_pr, 'chr')
+            if chr_el is not None:
+                accent_char = chr_el.get(_VAL, '\u0302')
+
+        latex_accent = ACCENT_MAP.get(accent_char, '\\hat')
+        return _Khung([_con_truc_tiep(elem, 'e')], lambda k: f'{latex_accent}{{{k[0]}}}')
+
+    def _xu_ly_bar(self, elem):
+        pos = 'top'
+        bar_pr = _con_truc_tiep(elem, 'barPr')
+        if bar_pr is not None:
+            pos_el = _con_truc_tiep(bar_pr, 'pos')
+            if pos_el is not None:
+                pos = pos_el.get(_VAL, 'top')
+
+        lenh = r'\underline' if pos == 'bot' else r'\overline'
+        return _Khung([_con_truc_tiep(elem, 'e')], lambda k: f'{lenh}{{{k[0]}}}')
+
+    def _xu_ly_eq_arr(self, elem):
+        return _Khung(
+            elem.findall(_NS + 'e'),
+            lambda k: r'\begin{aligned}' + r' \\ '.join(k) + r'\end{aligned}',
+        )
+
+    def _xu_ly_matrix(self, elem):
+        if elem.tag != _NS + 'm':
+            return None
+        # Gom mọi ô m:e của các hàng m:mr vào một khung, ghép lại theo số ô từng hàng
+        o_theo_hang = [mr.findall(_NS + 'e') for mr in elem.findall(_NS + 'mr')]
+
+        def ghep(k):
+            rows = []
+            vi_tri = 0
+            for o in o_theo_hang:
+                rows.append(' & '.join(k[vi_tri:vi_tri + len(o)]))
+                vi_tri += len(o)
+            return r'\begin{matrix}' + r' \\ '.join(rows) + r'\end{matrix}'
+        return _Khung([e for o in o_theo_hang for e in o], ghep)
+
+    def _xu_ly_box(self, elem):
+        e = _con_truc_tiep(elem, 'e')
+        if e is None:
+            return ''
+        return _Khung([e])
+
+    def _xu_ly_border_box(self, elem):
+        e = _con_truc_tiep(elem, 'e')
+        if e is None:
+            return ''
+        return _Khung([e], lambda k: rf'\boxed{{{k[0]}}}')
+
+    def _xu_ly_r(self, elem):
+        # Run toán: chỉ lấy text của các con m:t trực tiếp
+        parts = []
+        for child in elem:
+            if _ten_tag(child) == 't' and child.text:
+                parts.append(thay_ky_tu_unicode_toan(child.text))
+        return ''.join(parts)
+
+    def _xu_ly_t(self, elem):
+        if elem.text:
+            return thay_ky_tu_unicode_toan(elem.text)
+        return ''
+
@@ -2,28 +2,42 @@
 #
 # Pipeline ưu tiên:
 #   1. XSLT (OMML → MathML → LaTeX)   – chính xác nhất
-#   2. Pandoc subprocess                – fallback mạnh
-#   3. Parser thủ công (đệ quy)        – fallback cuối
+#   2. Bộ chuyển OMML gốc (xu_ly_omml)  – một lượt, không đệ quy; đường chính khi không có XSLT (Linux)
+#   3. Pandoc subprocess                – fallback cuối
+# Ngân sách thời gian mỗi tài liệu (NganSachThoiGianToan): hết ngân sách → chỉ còn bước 2 / text gốc
 #
 # Cách dùng:
 #   bo_toan = BoXuLyToan()                       # tự tìm OMML2MML.XSL
 #   bo_toan = BoXuLyToan(duong_dan_xslt=r"...")   # chỉ định đường dẫn
 #   latex   = bo_toan.omml_element_to_latex(omath_element)
+#   bo_toan.bao_cao_ha_cap()                      # công thức bị hạ cấp vì hết thời gian
 
 import os
 import re
 import subprocess
 import tempfile
+import threading
+import time
+import zipfile
+import hashlib
+import multiprocessing
 from copy import deepcopy
 from lxml import etree
 
 from utils import loc_ky_tu
+from xu_ly_omml import BoChuyenOMML, ma_bam_chuan_omml
+from bo_nho_dem import BoNhoDemLRU, BoNhoDemDia
+from xu_ly_ole_equation import ole_equation_to_latex, extract_mtef_from_ole, mtef_sang_latex
 
 from config import (
     OMML_NAMESPACE, W_NAMESPACE,
-    OMML_CHAR_MAP, NARY_SYMBOL_MAP, DELIMITER_MAP,
-    ACCENT_MAP, FUNC_NAME_MAP,
     DEFAULT_OMML2MML_XSL,
+    THOI_GIAN_PANDOC_TOI_DA_GIAY, SO_CONG_THUC_MOI_LO_PANDOC,
+    SO_CONG_THUC_TOI_DA_BO_NHO_DEM, DUONG_DAN_BO_NHO_DEM_CONG_THUC,
+    PHIEN_BAN_BO_CHUYEN_TOAN,
+    SO_CONG_THUC_TOI_THIEU_SONG_SONG, SO_TIEN_TRINH_TOAN,
+    THOI_GIAN_TOI_DA_MOI_CONG_THUC_GIAY,
+    THOI_GIAN_TOAN_TOI_DA_MOI_TAI_LIEU_GIAY,
 )
 
 # Namespace map dùng cho XSLT wrapper
@@ -32,6 +46,228 @@ _OMML_NSMAP = {
     'w': W_NAMESPACE,
 }
 
+# Gói .docx tối giản cho pandoc (chỉ có word/document.xml)
+_DOCX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+_DOCX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+# Đoạn đánh dấu đặt trước mỗi công thức trong file tổng hợp để tách kết quả pandoc
+_MAU_DANH_DAU_PANDOC = re.compile(r'^W2LCT(\d+)$')
+_MAU_PLACEHOLDER_PANDOC = re.compile(r'%%CONG_THUC_PANDOC_\d+%%')
+
+# BỘ ĐĂNG KÝ CẤP TIẾN TRÌNH
+# Mỗi request tạo một BoXuLyToan mới → XSLT, thư viện MathML→LaTeX và pandoc
+# chỉ được biên dịch / dò tìm một lần cho cả tiến trình rồi dùng chung
+
+_khoa_dang_ky = threading.Lock()
+# (đường dẫn tuyệt đối, mtime) → etree.XSLT đã biên dịch (None nếu biên dịch lỗi)
+_xslt_da_bien_dich = {}
+_CHUA_KIEM_TRA = object()
+_mathml_to_latex_fn_chung = _CHUA_KIEM_TRA
+_co_pandoc_chung = None
+# Bộ nhớ đệm công thức: khóa (chữ ký bộ chuyển + mã băm dạng chuẩn OMML) → LaTeX
+_bo_nho_dem_cong_thuc = BoNhoDemLRU(SO_CONG_THUC_TOI_DA_BO_NHO_DEM)
+_bo_nho_dem_dia = _CHUA_KIEM_TRA
+# Process pool chuyển công thức dùng chung cả tiến trình: (đường dẫn XSLT, multiprocessing.Pool)
+_nhom_tien_trinh_toan = None
+
+
+def lay_xslt_da_bien_dich(xslt_path: str | None):
+    # Trả về XSLT đã biên dịch cho đường dẫn, biên dịch lại nếu file đổi (mtime khác)
+    if not xslt_path or not os.path.exists(xslt_path):
+        return None
+    try:
+        khoa = (os.path.abspath(xslt_path), os.path.getmtime(xslt_path))
+    except OSError as e:
+        print(f'[Cảnh báo] Lỗi đọc thông tin file XSLT: {e}')
+        return None
+
+    xslt = _xslt_da_bien_dich.get(khoa, _CHUA_KIEM_TRA)
+    if xslt is not _CHUA_KIEM_TRA:
+        return xslt
+    with _khoa_dang_ky:
+        xslt = _xslt_da_bien_dich.get(khoa, _CHUA_KIEM_TRA)
+        if xslt is not _CHUA_KIEM_TRA:
+            return xslt
+        try:
+            xslt = etree.XSLT(etree.parse(xslt_path))
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 58: {e}')
+            xslt = None
+        # Bỏ bản biên dịch cũ của cùng file (mtime trước đó)
+        for khoa_cu in [k for k in _xslt_da_bien_dich if k[0] == khoa[0]]:
+            del _xslt_da_bien_dich[khoa_cu]
+        _xslt_da_bien_dich[khoa] = xslt
+    return xslt
+
+
+def lay_mathml_converter():
+    # Tìm thư viện MathML→LaTeX có sẵn trong môi trường (chỉ thử import một lần)
+    global _mathml_to_latex_fn_chung
+    if _mathml_to_latex_fn_chung is not _CHUA_KIEM_TRA:
+        return _mathml_to_latex_fn_chung
+    with _khoa_dang_ky:
+        if _mathml_to_latex_fn_chung is not _CHUA_KIEM_TRA:
+            return _mathml_to_latex_fn_chung
+        # latex2mathml (có hàm ngược mathml→latex ở phiên bản mới)
+        try:
+            from latex2mathml.converter import convert as _l2m  # noqa: F401
+            # Thử hàm ngược
+            from latex2mathml import mathml2latex as _m2l
+            _mathml_to_latex_fn_chung = _m2l
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 70: {e}')
+            # Fallback: tự parse đơn giản qua _parse_mathml_node
+            _mathml_to_latex_fn_chung = None
+    return _mathml_to_latex_fn_chung
+
+
+def kiem_tra_pandoc() -> bool:
+    # Dò pandoc một lần cho cả tiến trình
+    global _co_pandoc_chung
+    if _co_pandoc_chung is not None:
+        return _co_pandoc_chung
+    with _khoa_dang_ky:
+        if _co_pandoc_chung is not None:
+            return _co_pandoc_chung
+        try:
+            subprocess.run(
+                ['pandoc', '--version'],
+                capture_output=True, timeout=5,
+            )
+            _co_pandoc_chung = True
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 84: {e}')
+            _co_pandoc_chung = False
+    return _co_pandoc_chung
+
+
+def lay_bo_nho_dem_dia():
+    # Tầng đệm SQLite (chỉ khi cấu hình DUONG_DAN_BO_NHO_DEM_CONG_THUC), mở một lần cho tiến trình
+    global _bo_nho_dem_dia
+    if _bo_nho_dem_dia is not _CHUA_KIEM_TRA:
+        return _bo_nho_dem_dia
+    with _khoa_dang_ky:
+        if _bo_nho_dem_dia is _CHUA_KIEM_TRA:
+            dia = None
+            if DUONG_DAN_BO_NHO_DEM_CONG_THUC:
+                dia = BoNhoDemDia(DUONG_DAN_BO_NHO_DEM_CONG_THUC)
+                if not dia.hoat_dong:
+                    dia = None
+            _bo_nho_dem_dia = dia
+    return _bo_nho_dem_dia
+
+
+def lay_nhom_tien_trinh_toan(duong_dan_xslt: str | None):
+    # Process pool công thức tạo một lần cho cả tiến trình (tiến trình con biên dịch XSLT một lần)
+    # Đổi đường dẫn XSLT → dừng pool cũ, tạo pool mới
+    global _nhom_tien_trinh_toan
+    with _khoa_dang_ky:
+        if _nhom_tien_trinh_toan is not None and _nhom_tien_trinh_toan[0] != duong_dan_xslt:
+            _nhom_tien_trinh_toan[1].terminate()
+            _nhom_tien_trinh_toan = None
+        if _nhom_tien_trinh_toan is None:
+            # 'spawn': an toàn khi tiến trình chính đang chạy thread pool ảnh, giống nhau trên mọi OS
+            nhom = multiprocessing.get_context('spawn').Pool(
+                processes=SO_TIEN_TRINH_TOAN,
+                initializer=_khoi_tao_tien_trinh_toan,
+                initargs=(duong_dan_xslt,),
+            )
+            _nhom_tien_trinh_toan = (duong_dan_xslt, nhom)
+        return _nhom_tien_trinh_toan[1]
+
+
+def _la_nhom_tien_trinh_hien_tai(nhom) -> bool:
+    return _nhom_tien_trinh_toan is not None and _nhom_tien_trinh_toan[1] is nhom
+
+
+def huy_nhom_tien_trinh_toan(nhom):
+    # Dừng hẳn pool có tiến trình con đang treo (không lấy lại được); job sau tạo pool mới
+    global _nhom_tien_trinh_toan
+    with _khoa_dang_ky:
+        if _la_nhom_tien_trinh_hien_tai(nhom):
+            _nhom_tien_trinh_toan = None
+    nhom.terminate()
+
+
+def khoi_dong_bo_xu_ly_toan(duong_dan_xslt: str = None):
+    # Làm nóng bộ đăng ký khi worker khởi động để request đầu tiên không phải chờ
+    lay_xslt_da_bien_dich(duong_dan_xslt or DEFAULT_OMML2MML_XSL)
+    lay_mathml_converter()
+    kiem_tra_pandoc()
+    lay_bo_nho_dem_dia()
+    # Process pool công thức khởi động cùng worker: tiến trình con biên dịch XSLT trước request đầu tiên
+    if SO_TIEN_TRINH_TOAN >= 2:
+        lay_nhom_tien_trinh_toan(duong_dan_xslt or DEFAULT_OMML2MML_XSL)
+
+
+# TIẾN TRÌNH CON CHUYỂN CÔNG THỨC (process pool)
+
+_bo_toan_tien_trinh = None
+
+
+def _khoi_tao_tien_trinh_toan(duong_dan_xslt):
+    # Mỗi tiến trình con tạo một BoXuLyToan (biên dịch XSLT một lần cho cả tiến trình)
+    global _bo_toan_tien_trinh
+    _bo_toan_tien_trinh = BoXuLyToan(duong_dan_xslt=duong_dan_xslt)
+
+
+def _chuyen_mot_cong_thuc(loai: str, du_lieu: bytes) -> str:
+    # Chuyển một công thức (loại 'omml' | 'ole', bytes) → LaTeX; mỗi công thức một task
+    # để giới hạn thời gian áp dụng cho từng công thức
+    # Không dùng pandoc ở đây (pandoc đã được gom theo tài liệu ở tiến trình chính)
+    try:
+        if loai == 'ole':
+            return ole_equation_to_latex(du_lieu)
+        omath = etree.fromstring(du_lieu)
+        return (_bo_toan_tien_trinh._via_xslt(omath)
+                or _bo_toan_tien_trinh._via_manual_parser(omath))
+    except Exception as e:
+        print(f'[Cảnh báo] Lỗi chuyển công thức trong tiến trình con: {e}')
+        return ''
+
+
+class NganSachThoiGianToan:
+    # Ngân sách thời gian chuyển công thức của một tài liệu
+    # - tong_giay: tổng cho cả tài liệu (process pool + render + pandoc); hết → chỉ dùng đường rẻ nhất
+    # - moi_cong_thuc_giay: một công thức vượt mức này thì không thử thêm đường đắt hơn
+    # - cong_thuc_ha_cap: công thức bị hạ cấp (text rút gọn + lý do) để báo cáo cuối job
+
+    def __init__(self, tong_giay: float, moi_cong_thuc_giay: float):
+        self.tong_giay = tong_giay
+        self.moi_cong_thuc_giay = moi_cong_thuc_giay
+        self.da_dung = 0.0
+        self.cong_thuc_ha_cap = []
+
+    def con_lai(self) -> float:
+        return max(0.0, self.tong_giay - self.da_dung)
+
+    def het(self) -> bool:
+        return self.da_dung >= self.tong_giay
+
+    def tru(self, giay: float):
+        self.da_dung += max(0.0, giay)
+
+    def ghi_ha_cap(self, text_goc: str, ly_do: str):
+        text_goc = ' '.join(text_goc.split())
+        if len(text_goc) > 60:
+            text_goc = text_goc[:57] + '...'
+        self.cong_thuc_ha_cap.append({'cong_thuc': text_goc, 'ly_do': ly_do})
+
+
 class BoXuLyToan:
     # Bộ xử lý toán: chuyển OMML XML element → LaTeX string
 
@@ -39,9 +275,31 @@ class BoXuLyToan:
         self._xslt_transform = None
         self._mathml_to_latex_fn = None
         self._co_pandoc = None  # lazy-check
+        self._bo_omml = BoChuyenOMML()
+
+        # Công thức chờ pandoc: (placeholder, bản sao oMath, text gốc), giải một lần lúc ghép kết quả
+        self._cong_thuc_cho_pandoc = []
+        self._dem_cong_thuc_pandoc = 0
+        # Công thức trùng (cùng khóa dạng chuẩn OMML) chỉ xếp hàng pandoc một lần: khóa → placeholder
+        self._placeholder_pandoc_theo_khoa = {}
+        self._thoi_gian_pandoc_con_lai = THOI_GIAN_PANDOC_TOI_DA_GIAY
+
+        # Thống kê bộ nhớ đệm công thức của job này
+        self.thong_ke_bo_nho_dem = {'tinh_truoc': 0, 'trung_ram': 0, 'trung_dia': 0, 'truot': 0}
+        # Kết quả chuyển trước bằng process pool cho job này: khóa → LaTeX
+        self._ket_qua_tinh_truoc = {}
+        # Khóa blob OLE không giải được trong job này (tách khỏi kết quả thật, không tính là trúng đệm)
+        self._ole_loi = set()
+        # Ngân sách thời gian toán của job này (tài liệu + từng công thức)
+        self.ngan_sach = NganSachThoiGianToan(
+            THOI_GIAN_TOAN_TOI_DA_MOI_TAI_LIEU_GIAY, THOI_GIAN_TOI_DA_MOI_CONG_THUC_GIAY
+        )
+        # Kết quả hạ cấp của job này (khóa → LaTeX): chỉ dùng lại trong job, không vào bộ nhớ đệm chung
+        self._ket_qua_ha_cap = {}
 
         # 1. Khởi tạo XSLT transform
         xslt_path = duong_dan_xslt or DEFAULT_OMML2MML_XSL
+        self._duong_dan_xslt = xslt_path
         self._init_xslt(xslt_path)
 
         # 2. Khởi tạo MathML → LaTeX converter
@@ -50,105 +308,292 @@ class BoXuLyToan:
     # KHỞI TẠO
 
     def _init_xslt(self, xslt_path: str | None):
-        if not xslt_path or not os.path.exists(xslt_path):
-            return
-        try:
-            xslt_doc = etree.parse(xslt_path)
-            self._xslt_transform = etree.XSLT(xslt_doc)
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 58: {e}')
-            self._xslt_transform = None
+        # XSLT đã biên dịch lấy từ bộ đăng ký cấp tiến trình
+        self._xslt_transform = lay_xslt_da_bien_dich(xslt_path)
+        self._chu_ky_xslt = '-'
+        if self._xslt_transform is not None:
+            try:
+                self._chu_ky_xslt = f'{os.path.abspath(xslt_path)}:{os.path.getmtime(xslt_path)}'
+            except OSError:
+                pass
 
     def _init_mathml_converter(self):
-        # Tìm thư viện MathML→LaTeX có sẵn trong môi trường
-        # latex2mathml (có hàm ngược mathml→latex ở phiên bản mới)
-        try:
-            from latex2mathml.converter import convert as _l2m  # noqa: F401
-            # Thử hàm ngược
-            from latex2mathml import mathml2latex as _m2l
-            self._mathml_to_latex_fn = _m2l
-            return
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 70: {e}')
-            pass
-        # Fallback: tự parse đơn giản qua _mathml_simple_to_latex
-        self._mathml_to_latex_fn = None
+        self._mathml_to_latex_fn = lay_mathml_converter()
+
+    def _chu_ky_bo_chuyen(self) -> str:
+        # Kết quả phụ thuộc XSLT + converter đang dùng → đưa vào khóa đệm
+        co_m2l = 'm2l' if self._mathml_to_latex_fn is not None else '-'
+        return f'{PHIEN_BAN_BO_CHUYEN_TOAN}|{self._chu_ky_xslt}|{co_m2l}'
 
     def _kiem_tra_pandoc(self) -> bool:
-        if self._co_pandoc is not None:
-            return self._co_pandoc
-        try:
-            subprocess.run(
-                ['pandoc', '--version'],
-                capture_output=True, timeout=5,
-            )
-            self._co_pandoc = True
-        except Exception as e:
-            print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 84: {e}')
-            self._co_pandoc = False
+        if self._co_pandoc is None:
+            self._co_pandoc = kiem_tra_pandoc()
         return self._co_pandoc
 
     # API CHÍNH
 
     def omml_element_to_latex(self, omath) -> str:
-        # Chuyển một <m:oMath> element thành chuỗi LaTeX (XSLT → thủ công → Pandoc)
-        latex = self._via_xslt(omath)
-        if latex:
+        # Chuyển một <m:oMath> element thành chuỗi LaTeX (bộ nhớ đệm → XSLT → thủ công → Pandoc)
+        khoa = self._khoa_cong_thuc(omath)
+
+        if khoa is not None:
+            latex = self._lay_tu_bo_nho_dem(khoa)
+            if latex is not None:
+                return latex
+            # Đã hạ cấp trong job (hết ngân sách / quá hạn trong process pool) → không chuyển lại
+            if khoa in self._ket_qua_ha_cap:
+                return self._ket_qua_ha_cap[khoa]
+            # Đã xếp hàng pandoc trong job này → dùng chung placeholder, không thử lại XSLT / thủ công
+            if khoa in self._placeholder_pandoc_theo_khoa:
+                return self._placeholder_pandoc_theo_khoa[khoa]
+            self.thong_ke_bo_nho_dem['truot'] += 1
+
+        # Hết ngân sách tài liệu → chỉ parser thủ công (rẻ nhất), rỗng thì nơi gọi dùng text gốc
+        # Kết quả hạ cấp không đưa vào bộ nhớ đệm chung
+        if self.ngan_sach.het():
+            latex = self._via_manual_parser(omath)
+            self.ngan_sach.ghi_ha_cap(
+                self.omml_to_text(omath),
+                'hết ngân sách tài liệu → ' + ('parser thủ công' if latex else 'text gốc'),
+            )
+            if khoa is not None:
+                self._ket_qua_ha_cap[khoa] = latex
             return latex
 
-        latex = self._via_manual_parser(omath)
+        # XSLT / parser thủ công chạy trong tiến trình chính không ngắt được giữa chừng: giới hạn riêng
+        # chỉ được kiểm tra giữa các bước; công thức treo chỉ bị chặn trong process pool (đã hạ cấp ở trên)
+        bat_dau = time.monotonic()
+        try:
+            latex = self._via_xslt(omath)
+            if not latex and time.monotonic() - bat_dau <= self.ngan_sach.moi_cong_thuc_giay:
+                latex = self._via_manual_parser(omath)
+        finally:
+            thoi_gian = time.monotonic() - bat_dau
+            self.ngan_sach.tru(thoi_gian)
         if latex:
+            if khoa is not None:
+                self._luu_vao_bo_nho_dem(khoa, latex)
             return latex
 
+        # Công thức đã quá giới hạn riêng → không gửi tiếp cho pandoc
+        if thoi_gian > self.ngan_sach.moi_cong_thuc_giay:
+            self.ngan_sach.ghi_ha_cap(
+                self.omml_to_text(omath), f'quá {self.ngan_sach.moi_cong_thuc_giay:g}s → text gốc'
+            )
+            if khoa is not None:
+                self._ket_qua_ha_cap[khoa] = ""
+            return ""
+
+        # Placeholder pandoc chỉ có nghĩa trong tài liệu hiện tại → không đệm
         latex = self._via_pandoc(omath)
         if latex:
+            if khoa is not None:
+                self._placeholder_pandoc_theo_khoa[khoa] = latex
             return latex
 
         return ""
 
+    # BỘ NHỚ ĐỆM CÔNG THỨC
+
+    def _khoa_cong_thuc(self, omath):
+        # Khóa đệm = chữ ký bộ chuyển + mã băm dạng chuẩn OMML (None nếu không băm được)
+        try:
+            return f'{self._chu_ky_bo_chuyen()}|{ma_bam_chuan_omml(omath)}'
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi băm công thức OMML: {e}')
+            return None
+
+    def _lay_tu_bo_nho_dem(self, khoa: str):
+        latex = self._ket_qua_tinh_truoc.get(khoa)
+        if latex is not None:
+            self.thong_ke_bo_nho_dem['tinh_truoc'] += 1
+            return latex
+        latex = _bo_nho_dem_cong_thuc.lay(khoa)
+        if latex is not None:
+            self.thong_ke_bo_nho_dem['trung_ram'] += 1
+            return latex
+        dia = lay_bo_nho_dem_dia()
+        if dia is not None:
+            latex = dia.lay(khoa)
+            if latex is not None:
+                _bo_nho_dem_cong_thuc.dat(khoa, latex)
+                self.thong_ke_bo_nho_dem['trung_dia'] += 1
+                return latex
+        return None
+
+    def _luu_vao_bo_nho_dem(self, khoa: str, latex: str):
+        _bo_nho_dem_cong_thuc.dat(khoa, latex)
+        dia = lay_bo_nho_dem_dia()
+        if dia is not None:
+            dia.dat(khoa, latex)
+
+    def bao_cao_ha_cap(self) -> list:
+        # Danh sách công thức bị hạ cấp vì ngân sách thời gian: [{'cong_thuc', 'ly_do'}]
+        return list(self.ngan_sach.cong_thuc_ha_cap)
+
+    def hoan_tat_bo_nho_dem(self) -> dict:
+        # Gọi cuối job: ghi tầng đĩa, trả thống kê trúng/trượt của job
+        dia = lay_bo_nho_dem_dia()
+        if dia is not None:
+            dia.dong_bo()
+        return dict(self.thong_ke_bo_nho_dem)
+
+    def ole_sang_latex(self, ole_binary: bytes) -> str:
+        # OLE Equation Editor → LaTeX qua bộ nhớ đệm hai khóa (RAM + đĩa, dùng chung cả tiến trình):
+        # - SHA-1 của blob: trúng → bỏ qua cả đọc CFB, parse MTEF và sinh LaTeX
+        # - SHA-1 của MTEF: cùng công thức nằm trong blob khác (khác CLSID, ảnh preview...) → bỏ qua parse + sinh LaTeX
+        # Blob không giải được chỉ ghi lại cho job này (_ole_loi) → blob trùng trong tài liệu chỉ thử một lần
+        khoa = self._khoa_ole(ole_binary)
+        if khoa in self._ole_loi:
+            return ''
+        latex = self._lay_tu_bo_nho_dem(khoa)
+        if latex is not None:
+            return latex
+
+        mtef_data = extract_mtef_from_ole(ole_binary)
+        khoa_mtef = self._khoa_mtef(mtef_data) if mtef_data else None
+        latex = self._lay_tu_bo_nho_dem(khoa_mtef) if khoa_mtef else None
+        if latex is None:
+            self.thong_ke_bo_nho_dem['truot'] += 1
+            latex = mtef_sang_latex(mtef_data)
+            if latex:
+                self._luu_vao_bo_nho_dem(khoa_mtef, latex)
+        if latex:
+            self._luu_vao_bo_nho_dem(khoa, latex)
+        else:
+            self._ole_loi.add(khoa)
+        return latex
+
+    @staticmethod
+    def _khoa_ole(ole_binary: bytes) -> str:
+        return f'ole|{PHIEN_BAN_BO_CHUYEN_TOAN}|{hashlib.sha1(ole_binary).hexdigest()}'
+
+    @staticmethod
+    def _khoa_mtef(mtef_data) -> str:
+        return f'mtef|{PHIEN_BAN_BO_CHUYEN_TOAN}|{hashlib.sha1(mtef_data).hexdigest()}'
+
+    # CHUYỂN TRƯỚC SONG SONG (tài liệu nhiều công thức)
+
+    def tinh_truoc_cong_thuc(self, danh_sach_omath: list, danh_sach_ole: list = ()) -> int:
+        # Gom công thức chưa có trong bộ nhớ đệm, chuyển song song bằng process pool dùng chung
+        # Kết quả được đọc lại khi render đoạn văn (omml_element_to_latex / ole_sang_latex)
+        # Trả về số công thức đã chuyển trước
+        viec = []
+        da_gom = set()
+        for omath in danh_sach_omath:
+            khoa = self._khoa_cong_thuc(omath)
+            if khoa is None or khoa in da_gom or _bo_nho_dem_cong_thuc.lay(khoa) is not None:
+                continue
+            da_gom.add(khoa)
+            viec.append((khoa, 'omml', etree.tostring(omath), omath))
+        for ole_binary in danh_sach_ole:
+            khoa = self._khoa_ole(ole_binary)
+            if khoa in da_gom or _bo_nho_dem_cong_thuc.lay(khoa) is not None:
+                continue
+            da_gom.add(khoa)
+            viec.append((khoa, 'ole', ole_binary, None))
+
+        # Một lõi CPU → process pool chỉ thêm chi phí, để render chuyển tuần tự
+        if (SO_TIEN_TRINH_TOAN < 2 or len(viec) < SO_CONG_THUC_TOI_THIEU_SONG_SONG
+                or self.ngan_sach.het()):
+            return 0
+
+        bat_dau = time.monotonic()
+        try:
+            nhom = lay_nhom_tien_trinh_toan(self._duong_dan_xslt)
+            cac_tuong_lai = [nhom.apply_async(_chuyen_mot_cong_thuc, (loai, du_lieu))
+                             for _, loai, du_lieu, _ in viec]
+        except Exception as e:
+            print(f'[Cảnh báo] Không tạo được process pool công thức, chuyển tuần tự: {e}')
+            return 0
+
+        so_da_chuyen = 0
+        so_qua_han = 0
+        gioi_han = self.ngan_sach.moi_cong_thuc_giay
+        try:
+            for i, ((khoa, loai, _, omath), tuong_lai) in enumerate(zip(viec, cac_tuong_lai)):
+                # Task chạy theo thứ tự gửi: khi công thức trước xong, công thức này đã bắt đầu,
+                # trừ khi mọi tiến trình con đều đang treo → phần còn lại để render chuyển như thường
+                con_lai = self.ngan_sach.con_lai() - (time.monotonic() - bat_dau)
+                if so_qua_han >= SO_TIEN_TRINH_TOAN or con_lai <= 0:
+                    break
+                try:
+                    latex = tuong_lai.get(timeout=min(gioi_han, con_lai))
+                except multiprocessing.TimeoutError:
+                    if con_lai < gioi_han or not _la_nhom_tien_trinh_hien_tai(nhom):
+                        # Hết ngân sách tài liệu hoặc pool đã bị job khác dừng → không phải lỗi của công thức này
+                        break
+                    so_qua_han += 1
+                    self._ha_cap_cong_thuc_qua_han(khoa, loai, omath)
+                    continue
+                so_da_chuyen += self._ghi_ket_qua_tinh_truoc(khoa, latex)
+            else:
+                i = len(viec)
+            # Kết quả đã xong sau điểm dừng vẫn được giữ lại
+            for (khoa, _, _, _), tuong_lai in zip(viec[i:], cac_tuong_lai[i:]):
+                if tuong_lai.ready() and tuong_lai.successful():
+                    so_da_chuyen += self._ghi_ket_qua_tinh_truoc(khoa, tuong_lai.get())
+        except Exception as e:
+            print(f'[Cảnh báo] Lỗi chuyển công thức song song: {e}')
+        finally:
+            if so_qua_han:
+                print(f'[Cảnh báo] {so_qua_han} công thức quá {gioi_han:g}s trong process pool, khởi động lại pool')
+                huy_nhom_tien_trinh_toan(nhom)
+            self.ngan_sach.tru(time.monotonic() - bat_dau)
+        return so_da_chuyen
+
+    def _ghi_ket_qua_tinh_truoc(self, khoa: str, latex: str) -> int:
+        # Lưu một kết quả từ process pool; trả về 1 nếu có LaTeX
+        if not latex:
+            # OLE lỗi trong tiến trình con → không giải lại khi render
+            if khoa.startswith('ole|'):
+                self._ole_loi.add(khoa)
+            return 0
+        self._ket_qua_tinh_truoc[khoa] = latex
+        self._luu_vao_bo_nho_dem(khoa, latex)
+        return 1
+
+    def _ha_cap_cong_thuc_qua_han(self, khoa: str, loai: str, omath):
+        # Công thức làm tiến trình con quá giới hạn → hạ cấp ngay, render không chuyển lại ở tiến trình chính
+        ly_do = f'quá {self.ngan_sach.moi_cong_thuc_giay:g}s trong process pool → text gốc'
+        if loai == 'ole':
+            self._ole_loi.add(khoa)
+            self.ngan_sach.ghi_ha_cap('OLE Equation', ly_do)
+        else:
+            self._ket_qua_ha_cap[khoa] = ''
+            self.ngan_sach.ghi_ha_cap(self.omml_to_text(omath), ly_do)
+
     # HƯỚNG 1: XSLT  (OMML → MathML → LaTeX)
 
     def _via_xslt(self, omath) -> str:
         if self._xslt_transform is None:
             return ""
         try:
-            # XSLT cần root element có namespace declarations
-            wrapper = deepcopy(omath)
-            result = self._xslt_transform(wrapper)
-            mathml_str = str(result).strip()
-            if not mathml_str:
-                return ""
-
-            # Nếu kết quả là MathML → chuyển sang LaTeX
-            if '<math' in mathml_str or '<mml:math' in mathml_str:
-                return self._mathml_to_latex(mathml_str)
-
-            # Nếu XSLT trả LaTeX thẳng (custom XSLT)
-            return mathml_str
+            # lxml áp XSLT lên element bằng document giả gốc tại element → không cần deepcopy
+            result = self._xslt_transform(omath)
+            root = result.getroot()
+
+            # Nếu kết quả là cây MathML → duyệt thẳng cây kết quả (không serialize / parse lại)
+            if root is not None and isinstance(root.tag, str) and etree.QName(root).localname == 'math':
+                return self._mathml_tree_to_latex(root)
+
+            # Nếu XSLT trả LaTeX thẳng (custom XSLT, output text)
+            return str(result).strip()
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 125: {e}')
             return ""
 
-    def _mathml_to_latex(self, mathml_str: str) -> str:
-        # Chuyển chuỗi MathML → LaTeX (dùng thư viện hoặc fallback)
-        # Dùng thư viện nếu có
+    def _mathml_tree_to_latex(self, root) -> str:
+        # Cây MathML (element lxml) → LaTeX
+        # Thư viện ngoài chỉ nhận chuỗi → chỉ serialize khi có thư viện
         if self._mathml_to_latex_fn is not None:
             try:
-                return self._mathml_to_latex_fn(mathml_str)
+                return self._mathml_to_latex_fn(etree.tostring(root, encoding='unicode'))
             except Exception as e:
                 print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 134: {e}')
-                pass
-
-        # Fallback: parse MathML đơn giản bằng lxml
-        return self._mathml_simple_to_latex(mathml_str)
 
-    def _mathml_simple_to_latex(self, mathml_str: str) -> str:
-        # Parser MathML → LaTeX đơn giản (fallback khi không có thư viện)
+        # Fallback: parser MathML đơn giản, nhận biết tag theo localname nên không cần bỏ namespace
         try:
-            # Xóa namespace prefixes để parse dễ hơn
-            clean = re.sub(r'<(/?)mml:', r'<\1', mathml_str)
-            clean = re.sub(r'\s+xmlns:[a-z]+="[^"]*"', '', clean)
-            root = etree.fromstring(clean.encode('utf-8'))
             return self._parse_mathml_node(root).strip()
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 148: {e}')
@@ -223,283 +668,134 @@ class BoXuLyToan:
         # Fallback
         return ''.join(children_latex)
 
-    # HƯỚNG 2: PANDOC
+    # HƯỚNG 2: PANDOC (gom theo tài liệu, một tiến trình cho nhiều công thức)
 
     def _via_pandoc(self, omath) -> str:
+        # Không gọi pandoc ngay: ghi nhận công thức, trả placeholder, giải ở giai_cong_thuc_pandoc
         if not self._kiem_tra_pandoc():
             return ""
-        try:
-            # Tạo một document XML tối giản chứa oMath
-            omath_copy = deepcopy(omath)
-            # Wrap trong w:document > w:body > w:p > m:oMathPara
-            nsmap = {
-                'w': W_NAMESPACE,
-                'm': OMML_NAMESPACE,
-            }
-            doc = etree.Element(f'{{{W_NAMESPACE}}}document', nsmap=nsmap)
-            body = etree.SubElement(doc, f'{{{W_NAMESPACE}}}body')
+        self._dem_cong_thuc_pandoc += 1
+        placeholder = f'%%CONG_THUC_PANDOC_{self._dem_cong_thuc_pandoc}%%'
+        self._cong_thuc_cho_pandoc.append((placeholder, deepcopy(omath), self.omml_to_text(omath)))
+        return placeholder
+
+    def giai_cong_thuc_pandoc(self, latex: str) -> str:
+        # Chuyển mọi công thức đang chờ bằng pandoc (theo lô) rồi thay placeholder trong kết quả
+        # Công thức pandoc không chuyển được (lỗi / hết ngân sách thời gian) → dùng text gốc
+        if not self._cong_thuc_cho_pandoc:
+            return latex
+        cho_xu_ly = self._cong_thuc_cho_pandoc
+        self._cong_thuc_cho_pandoc = []
+        self._placeholder_pandoc_theo_khoa = {}
+
+        ket_qua = {}
+        for i in range(0, len(cho_xu_ly), SO_CONG_THUC_MOI_LO_PANDOC):
+            lo = cho_xu_ly[i:i + SO_CONG_THUC_MOI_LO_PANDOC]
+            ket_qua_lo = self._chay_pandoc_theo_lo(lo)
+            for chi_so, latex_ct in ket_qua_lo.items():
+                ket_qua[lo[chi_so][0]] = latex_ct
+            if self._thoi_gian_pandoc_con_lai <= 0 or self.ngan_sach.het():
+                ly_do = 'hết ngân sách thời gian pandoc → text gốc'
+            else:
+                ly_do = 'pandoc không chuyển được → text gốc'
+            for chi_so, (_, _, text) in enumerate(lo):
+                if chi_so not in ket_qua_lo:
+                    self.ngan_sach.ghi_ha_cap(text, ly_do)
+
+        text_goc = {placeholder: text for placeholder, _, text in cho_xu_ly}
+        return _MAU_PLACEHOLDER_PANDOC.sub(
+            lambda m: ket_qua.get(m.group(0)) or text_goc.get(m.group(0), ''),
+            latex,
+        )
+
+    def _chay_pandoc_theo_lo(self, lo: list) -> dict:
+        # Ghép cả lô vào một .docx (đoạn đánh dấu W2LCT<i> + đoạn chứa oMath), gọi pandoc một lần
+        # Trả về {chỉ số trong lô: LaTeX}
+        # Timeout = phần còn lại nhỏ hơn giữa ngân sách pandoc và ngân sách toán của tài liệu
+        thoi_gian_toi_da = min(self._thoi_gian_pandoc_con_lai, self.ngan_sach.con_lai())
+        if thoi_gian_toi_da <= 0:
+            return {}
+
+        doc = etree.Element(f'{{{W_NAMESPACE}}}document', nsmap=_OMML_NSMAP)
+        body = etree.SubElement(doc, f'{{{W_NAMESPACE}}}body')
+        for chi_so, (_, omath, _) in enumerate(lo):
+            para_danh_dau = etree.SubElement(body, f'{{{W_NAMESPACE}}}p')
+            run = etree.SubElement(para_danh_dau, f'{{{W_NAMESPACE}}}r')
+            etree.SubElement(run, f'{{{W_NAMESPACE}}}t').text = f'W2LCT{chi_so}'
             para = etree.SubElement(body, f'{{{W_NAMESPACE}}}p')
-            omath_para = etree.SubElement(para, f'{{{OMML_NAMESPACE}}}oMathPara')
-            omath_para.append(omath_copy)
+            para.append(omath)
 
-            xml_bytes = etree.tostring(doc, xml_declaration=True, encoding='UTF-8')
-
-            # Lưu tạm thành .xml, gọi pandoc
-            with tempfile.NamedTemporaryFile(suffix='.xml', delete=False, mode='wb') as tmp:
-                tmp.write(xml_bytes)
-                tmp_path = tmp.name
+        bat_dau = time.monotonic()
+        try:
+            with tempfile.TemporaryDirectory() as thu_muc_tam:
+                duong_dan = os.path.join(thu_muc_tam, 'cong_thuc.docx')
+                with zipfile.ZipFile(duong_dan, 'w', zipfile.ZIP_DEFLATED) as z:
+                    z.writestr('[Content_Types].xml', _DOCX_CONTENT_TYPES)
+                    z.writestr('_rels/.rels', _DOCX_RELS)
+                    z.writestr('word/document.xml',
+                               etree.tostring(doc, xml_declaration=True, encoding='UTF-8'))
 
-            try:
                 result = subprocess.run(
-                    ['pandoc', '-f', 'docx', '-t', 'latex', tmp_path],
-                    capture_output=True, text=True, timeout=15,
+                    ['pandoc', '-f', 'docx', '-t', 'latex', '--wrap=none', duong_dan],
+                    capture_output=True, text=True, timeout=thoi_gian_toi_da,
                 )
-                if result.returncode == 0 and result.stdout.strip():
-                    return result.stdout.strip()
-            finally:
-                try:
-                    os.unlink(tmp_path)
-                except OSError:
-                    pass
+        except subprocess.TimeoutExpired:
+            print(f'[Cảnh báo] Pandoc vượt ngân sách thời gian ({thoi_gian_toi_da:.1f}s), '
+                  f'{len(lo)} công thức dùng text gốc')
+            self._thoi_gian_pandoc_con_lai = 0
+            return {}
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 258: {e}')
-            pass
-        return ""
+            return {}
+        finally:
+            da_chay = time.monotonic() - bat_dau
+            self._thoi_gian_pandoc_con_lai -= da_chay
+            self.ngan_sach.tru(da_chay)
 
-    # HƯỚNG 3: PARSER THỦ CÔNG (đệ quy)
+        if result.returncode != 0:
+            return {}
+        return self._tach_ket_qua_pandoc(result.stdout)
+
+    @staticmethod
+    def _tach_ket_qua_pandoc(stdout: str) -> dict:
+        # Tách output pandoc theo dòng đánh dấu, bỏ delimiter math \(...\), \[...\], $...$
+        ket_qua = {}
+        chi_so = None
+        dong_hien_tai = []
+
+        def ket_thuc():
+            if chi_so is None:
+                return
+            latex = '\n'.join(dong_hien_tai).strip()
+            for mo, dong in ((r'\(', r'\)'), (r'\[', r'\]'), ('$$', '$$'), ('$', '$')):
+                if latex.startswith(mo) and latex.endswith(dong) and len(latex) >= len(mo) + len(dong):
+                    latex = latex[len(mo):len(latex) - len(dong)].strip()
+                    break
+            if latex:
+                ket_qua[chi_so] = latex
+
+        for dong in stdout.splitlines():
+            khop = _MAU_DANH_DAU_PANDOC.match(dong.strip())
+            if khop:
+                ket_thuc()
+                chi_so = int(khop.group(1))
+                dong_hien_tai = []
+            else:
+                dong_hien_tai.append(dong)
+        ket_thuc()
+        return ket_qua
+
+    # HƯỚNG 3: BỘ CHUYỂN OMML GỐC (một lượt, dispatch table, không đệ quy)
 
     def _via_manual_parser(self, omath) -> str:
         try:
-            parts = []
-            self._process_omml_element(omath, parts)
-            return ''.join(parts)
+            return self._bo_omml.chuyen(omath)
         except Exception as e:
             print(f'[Cảnh báo] Lỗi im lặng ở xu_ly_toan.py dòng 269: {e}')
             return ""
 
-    def _process_omml_element(self, elem, parts: list):
-        # Đệ quy xử lý các phần tử OMML (f, rad, sSub, sSup, nary, d, func...)
-        tag = elem.tag.split('}')[-1] if '}' in elem.tag else elem.tag
-        ns = OMML_NAMESPACE
-
-        if tag == 'f':
-            num = elem.find(f'.//{{{ns}}}num')
-            den = elem.find(f'.//{{{ns}}}den')
-            if num is not None and den is not None:
-                num_text = self._get_omml_text(num)
-                den_text = self._get_omml_text(den)
-                parts.append(rf'\frac{{{num_text}}}{{{den_text}}}')
-                return
-
-        elif tag == 'rad':
-            deg = elem.find(f'.//{{{ns}}}deg')
-            e = elem.find(f'.//{{{ns}}}e')
-            if e is not None:
-                e_text = self._get_omml_text(e)
-                if deg is not None:
-                    deg_text = self._get_omml_text(deg)
-                    if deg_text.strip():
-                        parts.append(rf'\sqrt[{deg_text}]{{{e_text}}}')
-                        return
-                parts.append(rf'\sqrt{{{e_text}}}')
-                return
-
-        elif tag == 'sSub':
-            base = elem.find(f'.//{{{ns}}}e')
-            sub = elem.find(f'.//{{{ns}}}sub')
-            if base is not None:
-                base_text = self._get_omml_text(base)
-                sub_text = self._get_omml_text(sub) if sub is not None else ''
-                parts.append(rf'{base_text}_{{{sub_text}}}')
-                return
-
-        elif tag == 'sSup':
-            base = elem.find(f'.//{{{ns}}}e')
-            sup = elem.find(f'.//{{{ns}}}sup')
-            if base is not None:
-                base_text = self._get_omml_text(base)
-                sup_text = self._get_omml_text(sup) if sup is not None else ''
-                parts.append(rf'{base_text}^{{{sup_text}}}')
-                return
-
-        elif tag == 'sSubSup':
-            base = elem.find(f'.//{{{ns}}}e')
-            sub = elem.find(f'.//{{{ns}}}sub')
-            sup = elem.find(f'.//{{{ns}}}sup')
-            if base is not None:
-                base_text = self._get_omml_text(base)
-                sub_text = self._get_omml_text(sub) if sub is not None else ''
-                sup_text = self._get_omml_text(sup) if sup is not None else ''
-                parts.append(rf'{base_text}_{{{sub_text}}}^{{{sup_text}}}')
-                return
-
-        elif tag == 'nary':
-            naryPr = elem.find(f'{{{ns}}}naryPr')
-            chr_elem = naryPr.find(f'{{{ns}}}chr') if naryPr is not None else None
-            sub = elem.find(f'{{{ns}}}sub')
-            sup = elem.find(f'{{{ns}}}sup')
-            e = elem.find(f'{{{ns}}}e')
-
-            symbol = '\\sum'
-            if chr_elem is not None:
-                val = chr_elem.get(f'{{{ns}}}val')
-                symbol = NARY_SYMBOL_MAP.get(val, '\\sum')
-
-            sub_text = self._get_omml_text(sub) if sub is not None else ''
-            sup_text = self._get_omml_text(sup) if sup is not None else ''
-            e_text = self._get_omml_text(e) if e is not None else ''
-
-            result = symbol
-            if sub_text:
-                result += f'_{{{sub_text}}}'
-            if sup_text:
-                result += f'^{{{sup_text}}}'
-            result += f' {e_text}'
-            parts.append(result)
-            return
-
-        elif tag == 'd':
-            dPr = elem.find(f'{{{ns}}}dPr')
-            begChr = '('
-            endChr = ')'
-            if dPr is not None:
-                beg_e = dPr.find(f'{{{ns}}}begChr')
-                end_e = dPr.find(f'{{{ns}}}endChr')
-                if beg_e is not None:
-                    begChr = beg_e.get(f'{{{ns}}}val', '(')
-                if end_e is not None:
-                    endChr = end_e.get(f'{{{ns}}}val', ')')
-
-            beg_latex = DELIMITER_MAP.get(begChr, begChr)
-            end_latex = DELIMITER_MAP.get(endChr, endChr)
-
-            # Nội dung bên trong (có thể nhiều e)
-            e_list = elem.findall(f'{{{ns}}}e')
-            inner_parts = []
-            for e in e_list:
-                inner_parts.append(self._get_omml_text(e))
-            inner = ','.join(inner_parts)
-
-            parts.append(rf'\left{beg_latex}{inner}\right{end_latex}')
-            return
-
-        elif tag == 'func':
-            fName = elem.find(f'{{{ns}}}fName')
-            e = elem.find(f'{{{ns}}}e')
-            func_name = self._get_omml_text(fName) if fName is not None else ''
-            e_text = self._get_omml_text(e) if e is not None else ''
-
-            latex_func = FUNC_NAME_MAP.get(func_name.strip(), rf'\operatorname{{{func_name}}}')
-            parts.append(f'{latex_func}{{{e_text}}}')
-            return
-
-        elif tag in ('limLow', 'limUpp'):
-            e = elem.find(f'{{{ns}}}e')
-            lim = elem.find(f'{{{ns}}}lim')
-            e_text = self._get_omml_text(e) if e is not None else ''
-            lim_text = self._get_omml_text(lim) if lim is not None else ''
-            if tag == 'limLow':
-                parts.append(rf'\underset{{{lim_text}}}{{{e_text}}}')
-            else:
-                parts.append(rf'\overset{{{lim_text}}}{{{e_text}}}')
-            return
-
-        elif tag == 'acc':
-            accPr = elem.find(f'{{{ns}}}accPr')
-            e = elem.find(f'{{{ns}}}e')
-            e_text = self._get_omml_text(e) if e is not None else ''
-
-            accent_char = '\u0302'  # default hat
-            if accPr is not None:
-                chr_el = accPr.find(f'{{{ns}}}chr')
-                if chr_el is not None:
-                    accent_char = chr_el.get(f'{{{ns}}}val', '\u0302')
-
-            latex_accent = ACCENT_MAP.get(accent_char, '\\hat')
-            parts.append(f'{latex_accent}{{{e_text}}}')
-            return
-
-        elif tag == 'bar':
-            barPr = elem.find(f'{{{ns}}}barPr')
-            e = elem.find(f'{{{ns}}}e')
-            e_text = self._get_omml_text(e) if e is not None else ''
-
-            pos = 'top'
-            if barPr is not None:
-                pos_el = barPr.find(f'{{{ns}}}pos')
-                if pos_el is not None:
-                    pos = pos_el.get(f'{{{ns}}}val', 'top')
-
-            if pos == 'bot':
-                parts.append(rf'\underline{{{e_text}}}')
-            else:
-                parts.append(rf'\overline{{{e_text}}}')
-            return
-
-        elif tag == 'eqArr':
-            rows = []
-            for e in elem.findall(f'{{{ns}}}e'):
-                rows.append(self._get_omml_text(e))
-            parts.append(r'\begin{aligned}' + r' \\ '.join(rows) + r'\end{aligned}')
-            return
-
-        elif tag == 'm' and elem.tag.endswith(f'{{{ns}}}m'):
-            rows = []
-            for mr in elem.findall(f'{{{ns}}}mr'):
-                cells = []
-                for e in mr.findall(f'{{{ns}}}e'):
-                    cells.append(self._get_omml_text(e))
-                rows.append(' & '.join(cells))
-            parts.append(r'\begin{matrix}' + r' \\ '.join(rows) + r'\end{matrix}')
-            return
-
-        elif tag == 'box':
-            e = elem.find(f'{{{ns}}}e')
-            if e is not None:
-                parts.append(self._get_omml_text(e))
-            return
-
-        elif tag == 'borderBox':
-            e = elem.find(f'{{{ns}}}e')
-            if e is not None:
-                e_text = self._get_omml_text(e)
-                parts.append(rf'\boxed{{{e_text}}}')
-            return
-
-        elif tag == 'r':
-            for child in elem:
-                child_tag = child.tag.split('}')[-1] if '}' in child.tag else child.tag
-                if child_tag == 't' and child.text:
-                    text = child.text
-                    text = self._replace_unicode_math(text)
-                    parts.append(text)
-            return
-
-        elif tag == 't':
-            if elem.text:
-                text = self._replace_unicode_math(elem.text)
-                parts.append(text)
-            return
-
-        # Đệ quy xử lý các phần tử con
-        for child in elem:
-            self._process_omml_element(child, parts)
-
-    def _get_omml_text(self, elem) -> str:
-        # Lấy text LaTeX từ một sub-tree OMML
-        parts = []
-        self._process_omml_element(elem, parts)
-        return ''.join(parts)
-
     # TIỆN ÍCH
 
-    @staticmethod
-    def _replace_unicode_math(text: str) -> str:
-        # Thay thế các ký tự Unicode toán học thành LaTeX commands
-        for pattern, replacement in OMML_CHAR_MAP:
-            text = re.sub(pattern, replacement, text)
-        return text
-
     def omml_to_text(self, omath_elem) -> str:
         # Lấy plain-text từ OMML element (không format LaTeX)
         try: